@@ -0,0 +1,62 @@
+"""
+Diff benchmark: the shipped test.gds against a fresh build of its die.
+
+The posts of test.gds were written as closed 5-vertex polygons and a new
+build writes them with 4 vertices, and its grating references are 1x1
+arrays where a new build writes plain references, so every post and
+every reference of the top cell must still match and only the cells that
+really changed may report differences.  The check fails if a post or a
+top-cell reference is left unmatched or if the diff is slower than
+`--max-seconds`.
+
+    python benchmarks/diff.py --max-seconds 10
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="slowest accepted diff")
+    args = parser.parse_args(argv)
+
+    from gdspy_grating.build import build_and_write, load_manifest
+    from gdspy_grating.diff import diff_libraries, format_diff
+
+    manifest_path = os.path.join(ROOT, "manifests", "d2nn_dies.json")
+    manifest = load_manifest(manifest_path)
+    spec = next(d for d in manifest["dies"] if d["name"] == "test")
+    with tempfile.TemporaryDirectory() as output_dir:
+        outfile = build_and_write(
+            spec,
+            os.path.dirname(manifest_path),
+            output_dir,
+            manifest.get("gratings", []),
+            manifest.get("block_defaults"),
+        )[0]
+        t0 = time.perf_counter()
+        result = diff_libraries(os.path.join(ROOT, "test.gds"), outfile)
+        elapsed = time.perf_counter() - t0
+    print(format_diff(result))
+    posts = result["Positive"].get("layers", {}).get((2, 0))
+    references = result["Positive"].get("references", (0, 0))
+    print("diff in {:.3f} s (limit {:.3f} s)".format(elapsed, args.max_seconds))
+    failed = elapsed > args.max_seconds
+    if posts is not None:
+        print("posts left unmatched: {} only in a, {} only in b".format(posts["only_a"], posts["only_b"]))
+        failed = True
+    if any(references):
+        print("references left unmatched: {} only in a, {} only in b".format(*references))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Startup-time benchmark for small layout tasks.
+
+Every case runs in a fresh interpreter, the way the job runner calls a
+layout task, and the median wall time over `--repeat` runs is printed.
+
+    python benchmarks/startup.py --repeat 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("bare interpreter", "pass"),
+    ("eager imports (old scripts)", "import unicodedata, numpy, gdspy, scipy.io"),
+    ("import gdspy_grating", "import gdspy_grating"),
+    (
+        "build one grating",
+        "from gdspy_grating import grating_lumerical\n"
+        "grating_lumerical(0.6, 20, 0.38, 19, (0, 0), '-x', focus_distance=25, focus_width=16)",
+    ),
+    ("load one mask", "from gdspy_grating import load_mask\nload_mask('0_1', 0)"),
+]
+
+
+def time_case(code, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="runs per case")
+    args = parser.parse_args(argv)
+
+    print("{:<30}{:>12}{:>12}".format("case", "median ms", "best ms"))
+    for name, code in CASES:
+        median, best = time_case(code, args.repeat)
+        print("{:<30}{:>12.1f}{:>12.1f}".format(name, 1e3 * median, 1e3 * best))
+
+
+if __name__ == "__main__":
+    main()
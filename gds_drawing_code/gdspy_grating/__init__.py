@@ -0,0 +1,96 @@
+"""
+Grating couplers and D2NN blocks for gdspy layouts.
+
+Builders are imported on first access, so ``import gdspy_grating`` is
+cheap; gdspy is loaded with the first builder and scipy only when a
+mask file is read.
+"""
+
+import importlib
+
+_exports = {
+    "apodization_profile": "apodization",
+    "spline_profile": "apodization",
+    "tooth_layout": "apodization",
+    "straight_teeth": "apodization",
+    "focusing_teeth": "apodization",
+    "apodized_grating": "apodization",
+    "grating_demo": "grating",
+    "grating_lumerical": "grating",
+    "load_mask": "d2nn",
+    "post_table": "d2nn",
+    "post_rectangles": "d2nn",
+    "d2nn_construct": "d2nn",
+    "tile_posts": "d2nn",
+    "tile_query": "d2nn",
+    "load_manifest": "build",
+    "build_die": "build",
+    "write_cells": "shards",
+    "write_shards": "shards",
+    "merge_gds": "shards",
+    "simplify_polygons": "simplify",
+    "simplify_cell": "simplify",
+    "simplify_library": "simplify",
+    "cell_stats": "stats",
+    "layout_stats": "stats",
+    "format_stats": "stats",
+    "import_cell": "external",
+    "import_cells": "external",
+    "parse_layers": "partial",
+    "filter_cell": "partial",
+    "filter_library": "partial",
+    "compose": "transform",
+    "transform_polygonset": "transform",
+    "flatten": "transform",
+    "flat_polygons": "transform",
+    "cell_signature": "diff",
+    "diff_cells": "diff",
+    "diff_libraries": "diff",
+    "format_diff": "diff",
+    "BoundingBoxes": "placement",
+    "Packer": "placement",
+    "pack": "placement",
+    "place_cells": "placement",
+    "Port": "router",
+    "Router": "router",
+    "d2nn_ports": "router",
+    "move_port": "router",
+    "cell_obstacles": "router",
+    "DieWatcher": "watch",
+    "open_gds": "compressed",
+    "read_gds": "compressed",
+    "write_gds": "compressed",
+    "convert_gds": "compressed",
+    "CellStore": "store",
+    "build_and_write_stored": "store",
+    "coverage": "density",
+    "density_maps": "density",
+    "window_density": "density",
+    "dummy_fill": "density",
+    "stacked_coverage": "density",
+    "backscatter": "proximity",
+    "dose_classes": "proximity",
+    "proximity_correction": "proximity",
+    "PostLayer": "extract",
+    "post_values": "extract",
+    "extract_layers": "extract",
+    "compare_mask": "extract",
+    "verify_die": "extract",
+    "CellIndex": "index",
+    "index_gds": "index",
+    "scan_gds": "index",
+}
+
+__all__ = sorted(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + _exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
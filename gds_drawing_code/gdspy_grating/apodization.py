@@ -0,0 +1,192 @@
+import numpy
+import gdspy
+
+
+def apodization_profile(profile, number_of_teeth):
+    """
+    Evaluate a per-tooth profile (fill factor or period) for all teeth.
+
+    profile         : number, table or callable.  A number is used for
+                      every tooth.  A table (list or array) is used as is
+                      when it has `number_of_teeth` entries and is
+                      linearly resampled over the grating otherwise.  A
+                      callable (e.g. from `spline_profile`) is evaluated
+                      once on the array of tooth indices.
+    number_of_teeth : number of teeth in the grating
+
+    Return `numpy.ndarray` with `number_of_teeth` values
+    """
+    q = numpy.arange(number_of_teeth)
+    if callable(profile):
+        values = numpy.asarray(profile(q), dtype=float)
+    elif numpy.ndim(profile) == 0:
+        values = numpy.full(number_of_teeth, profile, dtype=float)
+    else:
+        table = numpy.asarray(profile, dtype=float).ravel()
+        if table.size == number_of_teeth:
+            values = table.copy()
+        elif table.size == 1:
+            values = numpy.full(number_of_teeth, table[0])
+        else:
+            values = numpy.interp(
+                numpy.linspace(0, 1, number_of_teeth),
+                numpy.linspace(0, 1, table.size),
+                table,
+            )
+    return numpy.broadcast_to(values, (number_of_teeth,)).astype(float)
+
+
+def spline_profile(tooth_index, value, degree=3):
+    """
+    Smooth profile through a few control points.
+
+    tooth_index : tooth indices of the control points (increasing)
+    value       : profile value at each control point
+    degree      : spline degree (reduced if there are too few points)
+
+    Return callable accepted by `apodization_profile`
+    """
+    from scipy.interpolate import make_interp_spline
+
+    tooth_index = numpy.asarray(tooth_index, dtype=float)
+    degree = min(degree, tooth_index.size - 1)
+    return make_interp_spline(tooth_index, numpy.asarray(value, dtype=float), k=degree)
+
+
+def tooth_layout(period, fill_frac, number_of_teeth):
+    """
+    Position and width of every tooth of an apodized grating.
+
+    period          : grating period profile (see `apodization_profile`)
+    fill_frac       : fill factor profile (see `apodization_profile`)
+    number_of_teeth : number of teeth in the grating
+
+    Return `(start, width)` arrays: distance of each tooth cell from the
+    grating origin and tooth width (`period * fill_frac`)
+    """
+    periods = apodization_profile(period, number_of_teeth)
+    fills = apodization_profile(fill_frac, number_of_teeth)
+    start = numpy.concatenate(([0.0], numpy.cumsum(periods[:-1])))
+    return start, periods * fills
+
+
+def straight_teeth(start, tooth_width, width, position):
+    """
+    Batch generator of straight grating teeth along +y.
+
+    start       : distance of each tooth from `position`
+    tooth_width : width of each tooth
+    width       : width of the grating
+    position    : grating position (feed point)
+
+    Return `numpy.ndarray[N, 4, 2]` with the rectangle of each tooth
+    """
+    y0 = position[1] + numpy.asarray(start, dtype=float)
+    y1 = y0 + numpy.asarray(tooth_width, dtype=float)
+    x0 = numpy.full_like(y0, position[0] - 0.5 * width)
+    x1 = x0 + width
+    return numpy.stack(
+        (
+            numpy.stack((x0, y0), -1),
+            numpy.stack((x1, y0), -1),
+            numpy.stack((x1, y1), -1),
+            numpy.stack((x0, y1), -1),
+        ),
+        1,
+    )
+
+
+def focusing_teeth(radius, tooth_width, half_angle, position, tolerance=0.001, max_points=199):
+    """
+    Batch generator of focusing (circular) grating teeth along +y.
+
+    Each tooth is the annular sector between `radius - tooth_width / 2`
+    and `radius + tooth_width / 2` spanning `half_angle` on each side of
+    the +y axis around `position`, which is the shape `Path.parametric`
+    produces for a circular arc.  Teeth needing the same number of
+    fractured pieces are generated together, so the work is a handful of
+    array operations regardless of the number of teeth.
+
+    radius      : centerline radius of each tooth
+    tooth_width : width of each tooth
+    half_angle  : half of the angular aperture (radians)
+    position    : grating position (focus point)
+    tolerance   : maximal sagitta of each polygon edge
+    max_points  : maximal number of vertices of each polygon
+
+    Return list of `numpy.ndarray[M, 2]` polygons
+    """
+    radius = numpy.asarray(radius, dtype=float)
+    half = 0.5 * numpy.asarray(tooth_width, dtype=float) * numpy.ones_like(radius)
+    outer = radius + half
+    cos_step = numpy.clip(1 - tolerance / outer, -1, 1)
+    segments = numpy.ceil(2 * half_angle / (2 * numpy.arccos(cos_step)))
+    segments = numpy.maximum(segments, 1).astype(int)
+    per_chunk = max(max_points // 2 - 1, 1)
+    chunks = -(-segments // per_chunk)
+
+    polygons = []
+    for num in numpy.unique(chunks):
+        sel = chunks == num
+        seg = -(-segments[sel].max() // num)
+        # angles[j, k] is the k-th vertex angle of the j-th fractured piece
+        angles = (
+            0.5 * numpy.pi
+            + half_angle
+            - 2 * half_angle / (num * seg) * (numpy.arange(num)[:, None] * seg + numpy.arange(seg + 1))
+        )
+        direction = numpy.stack((numpy.cos(angles), numpy.sin(angles)), -1)
+        r_out = outer[sel][:, None, None, None]
+        r_in = (radius[sel] - half[sel])[:, None, None, None]
+        pts = numpy.concatenate(
+            (r_out * direction, (r_in * direction)[:, :, ::-1]), 2
+        ) + numpy.asarray(position, dtype=float)
+        polygons.extend(pts.reshape((-1, 2 * seg + 2, 2)))
+    return polygons
+
+
+def apodized_grating(
+    period,
+    number_of_teeth,
+    fill_frac,
+    width,
+    position,
+    focus_distance=-1,
+    focus_width=-1,
+    tolerance=0.001,
+    max_points=199,
+    layer=0,
+    datatype=0,
+):
+    """
+    Apodized straight or focusing grating pointing along +y.
+
+    period          : grating period profile (see `apodization_profile`)
+    number_of_teeth : number of teeth in the grating
+    fill_frac       : fill factor profile (see `apodization_profile`)
+    width           : width of the straight grating
+    position        : grating position (feed point)
+    focus_distance  : focus distance (negative for straight grating)
+    focus_width     : width of the focusing grating at `focus_distance`
+                      (its sign is ignored)
+    tolerance       : maximal sagitta of the tooth edges
+    max_points      : maximal number of vertices of each polygon
+    layer           : GDSII layer number
+    datatype        : GDSII datatype number
+
+    Return `PolygonSet`
+    """
+    start, tooth_width = tooth_layout(period, fill_frac, number_of_teeth)
+    if focus_distance < 0:
+        polygons = straight_teeth(start, tooth_width, width, position)
+    else:
+        half_angle = numpy.arcsin(0.5 * abs(focus_width) / focus_distance)
+        polygons = focusing_teeth(
+            focus_distance + start,
+            tooth_width,
+            half_angle,
+            position,
+            tolerance=tolerance,
+            max_points=max_points,
+        )
+    return gdspy.PolygonSet(polygons, layer=layer, datatype=datatype)
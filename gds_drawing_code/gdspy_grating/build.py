@@ -0,0 +1,640 @@
+"""
+Build dies described by a manifest instead of editing `__main__` blocks.
+
+A manifest (JSON or TOML) has a list of `dies`.  Each die has a `name`,
+an optional `output` file and `top` cell name (default 'Positive') and
+lists of `gratings`, `blocks`, `waveguides` and `references`.  Gratings
+and `block_defaults` given at the manifest level are shared by every
+die.  A die with `max_deviation` has its polygons simplified before
+output (see `simplify_polygons`).  A die with `layers` (numbers,
+`[layer, datatype]` pairs or 'layer/datatype' strings) and/or `cells`
+only generates and writes those (see `filter_library`), and
+`max_gds_bytes` or `max_shots` reject a die whose estimated size (see
+`layout_stats`) is too large before anything is written.  A block with
+`double` set is also drawn from its `_double` masks into the top cell
+`<top>_double`.  A die can also have `structures`, each with a `name`,
+`waveguides` and `references` in its own coordinates, built into a cell
+`<top>_<name>` referenced at its `origin`.  With `placement` (see
+`Packer`), the blocks and structures are not placed by `y_min` and
+`origin` but packed from their bounding boxes, each block in a cell
+`<top>_block<i>`.  `routes` connects ports with waveguides found by a
+`Router`: the outputs 'block<i>.out0' and 'block<i>.out1' of the blocks
+(built with `outputs` false) and the `ports` of the structures, named
+'<structure>.<port>'.  `fill` adds dummy fill (see `dummy_fill`) to the
+top cell once everything else is drawn, and `proximity` then encodes an
+e-beam dose class in the datatype of every polygon (see
+`proximity_correction`).  An `output` ending in '.gz', '.xz' or '.zst'
+is written compressed (see `open_gds`), and `plain_output` names an
+uncompressed copy written in the same pass.  See
+`manifests/d2nn_dies.json` for the layout of `test.py`.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+import gdspy
+from .compressed import write_gds
+from .shards import write_cells
+from .simplify import simplify_cell, simplify_library
+from .stats import layout_stats
+from .grating import grating_demo, grating_lumerical
+from .d2nn import d2nn_construct
+from .external import import_cell
+from .partial import filter_cell, filter_library, layer_selected, parse_layers
+from .placement import BoundingBoxes, place_cells
+from .router import Port, Router, d2nn_ports, move_port
+from .density import dummy_fill
+from .proximity import proximity_correction
+
+BUILDERS = {
+    "grating_demo": grating_demo,
+    "grating_lumerical": grating_lumerical,
+}
+
+BLOCK_DEFAULTS = {
+    "x_max": 0,
+    "y_min": 0,
+    "layer_distance": 200,
+    "input_distance": 100,
+    "num_layers": 5,
+    "small_margin": 5.0,
+    "wg_len": 300,
+    "polygon_layer": 2,
+}
+
+STAGES = ("gratings", "blocks", "waveguides", "proximity", "simplify", "stats", "write")
+
+
+def new_cell(lib, name):
+    """
+    Add an empty cell to `lib` without registering it in
+    `gdspy.current_library`, so that several dies can be built in the
+    same process.
+
+    Return `Cell`
+    """
+    cell = gdspy.Cell(name, exclude_from_current=True)
+    lib.add(cell)
+    return cell
+
+
+def load_manifest(path):
+    """
+    Read a JSON or TOML (by file extension) manifest.
+
+    path : manifest file
+
+    Return `dict`
+    """
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(path, "rb") as fin:
+            return tomllib.load(fin)
+    with open(path) as fin:
+        return json.load(fin)
+
+
+def build_grating(lib, spec, base_dir=".", layers=None):
+    """
+    Add a grating cell and its optional surrounding cell to `lib`.
+
+    spec     : `name`, `builder` (key of `BUILDERS`), `params` (builder
+               keyword arguments; `incidence_angle` in degrees can
+               replace `sin_theta`) and optional `surround` with `name`,
+               `width`, `small_margin`, `length`, `direction` and
+               `final_distance`; or `gds` (file relative to `base_dir`),
+               optional `cell` and `rotation` to import an external
+               grating with `import_cell` (with a rotation, the imported
+               cell keeps its own name and is referenced by `name`)
+    base_dir : directory against which `gds` is resolved
+    layers   : selection of layers; a builder or surrounding outside of
+               it is skipped, leaving an empty cell
+
+    Return `(grating, surround)` cells, `surround` may be None
+    """
+    params = dict(spec.get("params", {}))
+    if "gds" in spec:
+        infile = os.path.join(base_dir, spec["gds"])
+        if spec.get("rotation"):
+            # the imported cell keeps its name and is placed rotated
+            grat = new_cell(lib, spec["name"])
+            grat.add(gdspy.CellReference(import_cell(infile, spec.get("cell")), (0, 0), spec["rotation"]))
+        else:
+            grat = import_cell(infile, spec.get("cell"), spec["name"])
+        lib.add(grat, include_dependencies=True)
+    else:
+        if "incidence_angle" in params:
+            params["sin_theta"] = numpy.sin(numpy.pi * params.pop("incidence_angle") / 180)
+        params["position"] = tuple(params.get("position", (0, 0)))
+        grat = new_cell(lib, spec["name"])
+        if layer_selected(params.get("layer", 0), params.get("datatype", 0), layers):
+            grat.add(BUILDERS[spec.get("builder", "grating_lumerical")](**params))
+
+    sur = spec.get("surround")
+    if sur is None:
+        return grat, None
+    grat_sur = new_cell(lib, sur["name"])
+    if not layer_selected(0, 0, layers):
+        return grat, grat_sur
+    small_margin = sur.get("small_margin", 5.0)
+    p = gdspy.Path(
+        small_margin, (0, 0), number_of_paths=2, distance=small_margin + sur["width"]
+    )
+    p.segment(
+        sur["length"],
+        sur.get("direction", params.get("direction", "+y")),
+        final_distance=sur.get("final_distance"),
+    )
+    grat_sur.add(p)
+    return grat, grat_sur
+
+
+def build_waveguide(spec):
+    """
+    Double-trench waveguide from a start point and relative segments.
+
+    spec : `points` (start), `segments` (relative end points), `width`,
+           `offset`, optional `bend_radius` and `layer`
+
+    Return `FlexPath`
+    """
+    kwargs = {}
+    if spec.get("bend_radius"):
+        kwargs = {"corners": "circular bend", "bend_radius": spec["bend_radius"]}
+    path = gdspy.FlexPath(
+        [tuple(p) for p in spec["points"]],
+        width=spec.get("width", [5.0, 5.0]),
+        offset=spec.get("offset", 5.5),
+        gdsii_path=True,
+        layer=spec.get("layer", 0),
+        **kwargs
+    )
+    for seg in spec.get("segments", []):
+        path.segment(tuple(seg), relative=True)
+    return path
+
+
+def build_gratings(lib, specs, base_dir=".", layers=None):
+    """
+    Add the grating cells of `specs` to `lib`.
+
+    Return `(cells, surrounds)`: cells by name (gratings, their
+    dependencies and surroundings) and the surrounding cell (or None) of
+    each grating
+    """
+    cells = {}
+    surrounds = {}
+    for grat_spec in specs:
+        grat, grat_sur = build_grating(lib, grat_spec, base_dir, layers)
+        for dependency in grat.get_dependencies(True):
+            cells[dependency.name] = dependency
+        cells[grat.name] = grat
+        surrounds[grat.name] = grat_sur
+        if grat_sur is not None:
+            cells[grat_sur.name] = grat_sur
+    return cells, surrounds
+
+
+def block_arguments(block, base_dir=".", block_defaults=None):
+    """
+    Arguments of one D2NN block: `block` over `block_defaults` over
+    `BLOCK_DEFAULTS`, with `mask_dir` resolved against `base_dir`.
+
+    Return `dict`
+    """
+    kw = dict(BLOCK_DEFAULTS)
+    kw.update(block_defaults or {})
+    kw.update(block)
+    kw["mask_dir"] = os.path.join(base_dir, kw["mask_dir"])
+    return kw
+
+
+def build_block(c, block, cells, surrounds, base_dir=".", block_defaults=None, double_cell=None, **kwargs):
+    """
+    Add one D2NN block to cell `c` with `d2nn_construct`.
+
+    block       : `mask_dir`, `grating`, `double` and any `d2nn_construct`
+                  argument overriding `block_defaults` and `BLOCK_DEFAULTS`
+    double_cell : cell receiving the `_double` variant of a block with
+                  `double` set
+    kwargs      : further `d2nn_construct` arguments, such as `load`
+    """
+    kw = block_arguments(block, base_dir, block_defaults)
+    kw.update(kwargs)
+    if kw.pop("double", False):
+        if double_cell is None:
+            raise ValueError("Block {} needs a cell for its double-sided variant.".format(kw["mask_dir"]))
+        kw["double_cell"] = double_cell
+    grat_name = kw.pop("grating")
+    mask_dir = kw.pop("mask_dir")
+    return d2nn_construct(
+        c,
+        mask_dir,
+        grat=cells[grat_name],
+        grat_sur=surrounds[grat_name],
+        **kw
+    )
+
+
+def build_waveguides(c, spec, cells):
+    """
+    Add the `waveguides` and `references` of a die to cell `c`.
+    """
+    for wg in spec.get("waveguides", []):
+        c.add(build_waveguide(wg))
+    for ref in spec.get("references", []):
+        c.add(
+            gdspy.CellArray(
+                cells[ref["cell"]],
+                1,
+                1,
+                (0, 0),
+                tuple(ref.get("origin", (0, 0))),
+                ref.get("rotation"),
+                x_reflection=ref.get("x_reflection", False),
+            )
+        )
+    return c
+
+
+def build_structures(spec, cells):
+    """
+    Cells `<top>_<name>` of the `structures` of a die, built like its
+    waveguides and references (see `build_waveguides`).
+
+    Return list of `Cell`
+    """
+    result = []
+    for structure in spec.get("structures", []):
+        c = gdspy.Cell(shard_cell_name(spec, structure["name"]), exclude_from_current=True)
+        result.append(build_waveguides(c, structure, cells))
+    return result
+
+
+def die_ports(spec, block_defaults=None, offsets=None):
+    """
+    Named ports of a die: 'block<i>.out<k>' for the D2NN outputs and
+    '<structure>.<port>' for the `ports` of the structures (`position`
+    and `direction`).
+
+    offsets : translations of the blocks then the structures when the die
+              is placed, None for `y_min` and `origin`
+
+    Return dictionary of `Port` by name
+    """
+    ports = {}
+    structures = spec.get("structures", [])
+    blocks = spec.get("blocks", [])
+    if offsets is None:
+        offsets = [(0, 0)] * len(blocks) + [s.get("origin", (0, 0)) for s in structures]
+    for i, (block, offset) in enumerate(zip(blocks, offsets)):
+        for name, port in d2nn_ports(**block_arguments(block, ".", block_defaults)).items():
+            name = "block{}.{}".format(i, name)
+            ports[name] = move_port(port, offset, name)
+    for structure, offset in zip(structures, offsets[len(blocks):]):
+        for name, port in structure.get("ports", {}).items():
+            name = "{}.{}".format(structure["name"], name)
+            ports[name] = move_port(Port(name, tuple(port["position"]), port["direction"]), offset)
+    return ports
+
+
+def build_routes(c, spec, ports, boxes=None):
+    """
+    Add the waveguides of the `routes` of a die to cell `c`, routed
+    around everything already in `c`.
+
+    spec  : die with `routes`: `nets` (pairs of port names) and `Router`
+            arguments (`pitch`, `clearance`, `bend_radius`, `width`,
+            `offset`, `layer`); the routing area is the extent of `c`
+            grown by `margin` (default 1000)
+    ports : dictionary of `Port` by name (see `die_ports`)
+    boxes : `BoundingBoxes` cache
+
+    Return list of `FlexPath`
+    """
+    routes = dict(spec["routes"])
+    nets = routes.pop("nets")
+    margin = routes.pop("margin", 1000)
+    missing = {name for net in nets for name in net} - set(ports)
+    if missing:
+        raise ValueError("Unknown ports in routes of die {}: {}.".format(spec.get("name"), ", ".join(sorted(missing))))
+    boxes = BoundingBoxes() if boxes is None else boxes
+    box = boxes.get(c)
+    router = Router((box[0] - margin, box[1] + margin), **routes)
+    router.add_cell(c, boxes)
+    paths = router.route_all([(ports[a], ports[b]) for a, b in nets])
+    c.add(paths)
+    return paths
+
+
+def build_fill(c, spec, boxes=None):
+    """
+    Add the dummy fill of a die to cell `c`, around everything already
+    in `c`.
+
+    spec  : die with `fill`, the `dummy_fill` arguments (`keepout` and
+            `keepout_layers` as lists)
+    boxes : `BoundingBoxes` cache
+
+    Return fill `Cell`
+    """
+    fill = dict(spec["fill"])
+    fill["keepout"] = [tuple(map(tuple, box)) for box in fill.get("keepout", ())]
+    if fill.get("keepout_layers") is not None:
+        fill["keepout_layers"] = [tuple(l) if isinstance(l, list) else l for l in fill["keepout_layers"]]
+    cell, arrays = dummy_fill(c, boxes=boxes, **fill)
+    c.add(arrays)
+    return cell
+
+
+def build_proximity(cells, spec):
+    """
+    Assign the dose classes of a die to the polygons under `cells` (the
+    top cell and its double-sided variant), in one `proximity_correction`
+    so the cells both reference get one class from all their instances.
+
+    spec : die with `proximity`, the `proximity_correction` arguments
+           (`layers` as in `parse_layers`)
+
+    Return `(doses, counts)` for all the cells
+    """
+    kwargs = dict(spec["proximity"])
+    kwargs["layers"] = parse_layers(kwargs.get("layers"))
+    return proximity_correction(cells, **kwargs)
+
+
+def build_die(spec, base_dir=".", shared_gratings=(), block_defaults=None):
+    """
+    Build the library of one die.
+
+    spec            : die description (see module documentation)
+    base_dir        : directory against which mask paths are resolved
+    shared_gratings : grating specs added before the die's own
+    block_defaults  : values overriding `BLOCK_DEFAULTS` for every block
+
+    Return `(GdsLibrary, timings)` with the seconds spent in each stage
+    """
+    timings = {}
+    lib = gdspy.GdsLibrary(name=spec.get("name", "library"))
+    layers = parse_layers(spec.get("layers"))
+    top = spec.get("top", "Positive")
+    grat_specs = list(shared_gratings) + list(spec.get("gratings", []))
+    wanted = spec.get("cells")
+    with_top = wanted is None or top in wanted or top + "_double" in wanted
+    if not with_top:
+        # only the selected gratings are needed
+        grat_specs = [
+            g for g in grat_specs
+            if g["name"] in wanted or g.get("surround", {}).get("name") in wanted
+        ]
+
+    t0 = time.perf_counter()
+    cells, surrounds = build_gratings(lib, grat_specs, base_dir, layers)
+    c = new_cell(lib, top)
+    timings["gratings"] = time.perf_counter() - t0
+    if not with_top:
+        return lib, timings
+
+    t0 = time.perf_counter()
+    placement = spec.get("placement")
+    double = None
+    placed = []
+    for i, block in enumerate(spec.get("blocks", [])):
+        if block.get("double") and double is None:
+            double = new_cell(lib, c.name + "_double")
+        if placement is None:
+            build_block(c, block, cells, surrounds, base_dir, block_defaults, double, layers=layers)
+            continue
+        block_cell = gdspy.Cell(shard_cell_name(spec, "block{}".format(i)), exclude_from_current=True)
+        block_double = None
+        if block.get("double"):
+            block_double = gdspy.Cell(block_cell.name + "_double", exclude_from_current=True)
+        build_block(block_cell, block, cells, surrounds, base_dir, block_defaults, block_double, layers=layers)
+        placed.append((block_cell, block_double))
+    timings["blocks"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    structures = build_structures(spec, cells)
+    boxes = BoundingBoxes()
+    offsets = None
+    if placement is None:
+        for cell, structure in zip(structures, spec.get("structures", [])):
+            c.add(gdspy.CellReference(cell, tuple(structure.get("origin", (0, 0)))))
+    else:
+        placed.extend((cell, None) for cell in structures)
+        offsets = place_cells(c, placed, placement, boxes, double)
+    build_waveguides(c, spec, cells)
+    if spec.get("routes") is not None:
+        build_routes(c, spec, die_ports(spec, block_defaults, offsets), boxes)
+    if spec.get("fill") is not None:
+        boxes.invalidate(c)
+        build_fill(c, spec, boxes)
+    timings["waveguides"] = time.perf_counter() - t0
+    if spec.get("proximity") is not None:
+        t0 = time.perf_counter()
+        build_proximity([c] if double is None else [c, double], spec)
+        timings["proximity"] = time.perf_counter() - t0
+    # block, structure and tile cells
+    lib.add(c)
+    if double is not None:
+        lib.add(double)
+    return lib, timings
+
+
+def check_layout(spec, lib_or_cells, name=None):
+    """
+    Estimate the written size of a die (or shard) with `layout_stats`.
+
+    Raise `ValueError` if it exceeds the `max_gds_bytes` or `max_shots`
+    of `spec`.
+
+    Return `stats` dictionary with `gds_bytes_estimate` and
+    `shots_estimate`
+    """
+    layout = layout_stats(lib_or_cells, name=name)
+    for key, value in (("max_gds_bytes", layout["gds_bytes"]), ("max_shots", layout["shots"])):
+        if spec.get(key) is not None and value > spec[key]:
+            raise ValueError(
+                "Die {} exceeds {}: estimated {:.0f}, limit {}.".format(
+                    spec.get("name"), key, value, spec[key]
+                )
+            )
+    return {"gds_bytes_estimate": layout["gds_bytes"], "shots_estimate": layout["shots"]}
+
+
+def output_paths(spec, output_dir="."):
+    """
+    Output file of a die and its optional plain copy (None).
+    """
+    outfile = os.path.join(output_dir, spec.get("output", spec["name"] + ".gds"))
+    plain = spec.get("plain_output")
+    return outfile, None if plain is None else os.path.join(output_dir, plain)
+
+
+def build_and_write(spec, base_dir=".", output_dir=".", shared_gratings=(), block_defaults=None):
+    """
+    Build one die and write it to `output_dir`.
+
+    Return `(output path, timings, stats)`, `stats` holding the estimated
+    size and shot count and the vertex counts before and after
+    simplification if it was requested
+    """
+    lib, timings = build_die(spec, base_dir, shared_gratings, block_defaults)
+    if spec.get("layers") is not None or spec.get("cells") is not None:
+        lib = filter_library(lib, parse_layers(spec.get("layers")), spec.get("cells"))
+    stats = {}
+    if spec.get("max_deviation") is not None:
+        t0 = time.perf_counter()
+        before, after = simplify_library(lib, spec["max_deviation"])
+        timings["simplify"] = time.perf_counter() - t0
+        stats["vertices_before"] = before
+        stats["vertices_after"] = after
+    t0 = time.perf_counter()
+    stats.update(check_layout(spec, lib))
+    timings["stats"] = time.perf_counter() - t0
+    outfile, plain = output_paths(spec, output_dir)
+    t0 = time.perf_counter()
+    write_gds(lib, outfile, plain)
+    timings["write"] = time.perf_counter() - t0
+    return outfile, timings, stats
+
+
+def shard_names(spec):
+    """
+    Shards of a die: 'gratings', one 'block<i>' per D2NN block and
+    'waveguides'.
+    """
+    blocks = ["block{}".format(i) for i in range(len(spec.get("blocks", [])))]
+    return ["gratings"] + blocks + ["waveguides"]
+
+
+def shard_cell_name(spec, shard):
+    return "{}_{}".format(spec.get("top", "Positive"), shard)
+
+
+def build_shard(spec, shard, base_dir=".", output_dir=".", shared_gratings=(), block_defaults=None):
+    """
+    Build one shard of a die and write it to its own GDS file.  The
+    `layers` of the die apply, its `cells` do not.
+
+    The grating cells are rebuilt in every shard that references them
+    but only written in the 'gratings' shard.  Blocks and waveguides go
+    to cells named `<top>_<shard>`, the double-sided variant of a block
+    to `<top>_<shard>_double`.
+
+    Return `(output path, timings, stats)` as `build_and_write`
+    """
+    timings = {}
+    lib = gdspy.GdsLibrary(name=shard)
+    t0 = time.perf_counter()
+    layers = parse_layers(spec.get("layers"))
+    cells, surrounds = build_gratings(
+        lib, list(shared_gratings) + list(spec.get("gratings", [])), base_dir, layers
+    )
+    timings["gratings"] = time.perf_counter() - t0
+
+    if shard == "gratings":
+        written = list(cells.values())
+    else:
+        c = new_cell(lib, shard_cell_name(spec, shard))
+        written = [c]
+        t0 = time.perf_counter()
+        if shard == "waveguides":
+            build_waveguides(c, spec, cells)
+            for cell, structure in zip(build_structures(spec, cells), spec.get("structures", [])):
+                c.add(gdspy.CellReference(cell, tuple(structure.get("origin", (0, 0)))))
+                written.append(cell)
+            timings["waveguides"] = time.perf_counter() - t0
+        else:
+            block = spec["blocks"][int(shard[len("block"):])]
+            double = None
+            if block.get("double"):
+                double = new_cell(lib, c.name + "_double")
+            build_block(c, block, cells, surrounds, base_dir, block_defaults, double, layers=layers)
+            timings["blocks"] = time.perf_counter() - t0
+            if double is not None:
+                written.append(double)
+            for cell in list(written):
+                written.extend(t for t in cell.get_dependencies(False) if t.name not in cells)
+    written = [filter_cell(cell, layers) for cell in written]
+
+    stats = {}
+    if spec.get("max_deviation") is not None:
+        t0 = time.perf_counter()
+        for cell in written:
+            before, after = simplify_cell(cell, spec["max_deviation"])
+            stats["vertices_before"] = stats.get("vertices_before", 0) + before
+            stats["vertices_after"] = stats.get("vertices_after", 0) + after
+        timings["simplify"] = time.perf_counter() - t0
+
+    # limits apply to each shard, the sums are reported for the die
+    t0 = time.perf_counter()
+    stats.update(check_layout(spec, written, name=shard))
+    timings["stats"] = time.perf_counter() - t0
+
+    outfile = os.path.join(output_dir, "{}_{}.gds".format(spec["name"], shard))
+    t0 = time.perf_counter()
+    write_cells(outfile, written, name=shard, unit=lib.unit, precision=lib.precision)
+    timings["write"] = time.perf_counter() - t0
+    return outfile, timings, stats
+
+
+def build_and_write_sharded(
+    spec, base_dir=".", output_dir=".", shared_gratings=(), block_defaults=None, jobs=1
+):
+    """
+    Build one die as shards written concurrently by `jobs` processes.
+
+    The shards go to `<output_dir>/<die name>/` next to a small
+    top-level file holding only the top cell, which references the block
+    and waveguide cells by name (and `<top>_double` for double-sided
+    blocks).  `merge_gds` joins them for tape-out.
+
+    Return `(top-level file, timings, stats)` with stage times and
+    statistics summed over shards
+    """
+    for key in ("placement", "routes", "fill", "proximity"):
+        if spec.get(key) is not None:
+            raise ValueError("Die {} with {} cannot be built in shards.".format(spec["name"], key))
+    shard_dir = os.path.join(output_dir, spec["name"])
+    os.makedirs(shard_dir, exist_ok=True)
+    args = (base_dir, shard_dir, shared_gratings, block_defaults)
+    shards = shard_names(spec)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(build_shard, spec, s, *args) for s in shards]
+            results = [f.result() for f in futures]
+    else:
+        results = [build_shard(spec, s, *args) for s in shards]
+
+    timings = {}
+    stats = {}
+    for _, shard_timings, shard_stats in results:
+        for stage, seconds in shard_timings.items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        for key, value in shard_stats.items():
+            stats[key] = stats.get(key, 0) + value
+
+    t0 = time.perf_counter()
+    top = gdspy.Cell(spec.get("top", "Positive"), exclude_from_current=True)
+    for shard in shards[1:]:
+        placeholder = gdspy.Cell(shard_cell_name(spec, shard), exclude_from_current=True)
+        top.add(gdspy.CellArray(placeholder, 1, 1, (0, 0), (0, 0)))
+    tops = [top]
+    for shard, block in zip(shards[1:-1], spec.get("blocks", [])):
+        if block.get("double"):
+            if len(tops) == 1:
+                tops.append(gdspy.Cell(top.name + "_double", exclude_from_current=True))
+            placeholder = gdspy.Cell(
+                shard_cell_name(spec, shard) + "_double", exclude_from_current=True
+            )
+            tops[1].add(gdspy.CellArray(placeholder, 1, 1, (0, 0), (0, 0)))
+    outfile, plain = output_paths(spec, output_dir)
+    write_cells(outfile, tops, name=spec["name"], plain=plain)
+    timings["write"] = timings.get("write", 0.0) + time.perf_counter() - t0
+    return outfile, timings, stats
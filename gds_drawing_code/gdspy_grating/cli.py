@@ -0,0 +1,398 @@
+"""
+Command-line entry point: ``python -m gdspy_grating <command> ...``
+
+    python -m gdspy_grating build manifests/d2nn_dies.json --jobs 4
+    python -m gdspy_grating build manifests/d2nn_dies.json --die test --shard
+    python -m gdspy_grating merge test_merged.gds manifests/build/test.gds manifests/build/test
+    python -m gdspy_grating diff test.gds tmp2.gds
+    python -m gdspy_grating convert test.gds test.gds.gz
+    python -m gdspy_grating watch manifests/d2nn_dies.json --die test
+    python -m gdspy_grating verify manifests/d2nn_dies.json --die test
+    python -m gdspy_grating index test.gds --cell PGrat_lumerical -o grating.gds
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _print_report(rows, wall, out=sys.stdout):
+    from .build import STAGES
+
+    header = "{:<20}" + "{:>11}" * (len(STAGES) + 1) + "  {}"
+    line = "{:<20}" + "{:>11.3f}" * (len(STAGES) + 1) + "  {}"
+    out.write(header.format("die", *(STAGES + ("total", "output"))) + "\n")
+    for name, outfile, timings, stats in rows:
+        values = [timings.get(s, 0.0) for s in STAGES]
+        out.write(line.format(name, *(values + [sum(values), outfile])) + "\n")
+    for name, outfile, timings, stats in rows:
+        if "shots_estimate" in stats:
+            out.write(
+                "{}: estimated {} bytes and {:.0f} shots before writing\n".format(
+                    name, stats["gds_bytes_estimate"], stats["shots_estimate"]
+                )
+            )
+        elif "gds_bytes_estimate" in stats:
+            out.write("{}: estimated {} bytes\n".format(name, stats["gds_bytes_estimate"]))
+        if "vertices_before" in stats:
+            out.write(
+                "{}: {} vertices simplified to {}\n".format(
+                    name, stats["vertices_before"], stats["vertices_after"]
+                )
+            )
+    out.write("{} dies in {:.3f} s\n".format(len(rows), wall))
+
+
+def build_command(args):
+    from .build import load_manifest, build_and_write, build_and_write_sharded
+
+    if args.pipeline:
+        from .pipeline import build_and_write_pipelined as build_and_write
+    if args.memory_budget is not None:
+        from .store import build_and_write_stored as build_and_write
+
+    manifest = load_manifest(args.manifest)
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    output_dir = args.output_dir or manifest.get("output_dir", ".")
+    if not os.path.isabs(output_dir) and args.output_dir is None:
+        output_dir = os.path.join(base_dir, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    dies = manifest["dies"]
+    if args.die:
+        dies = [d for d in dies if d["name"] in args.die]
+    if args.simplify is not None:
+        dies = [dict(d, max_deviation=args.simplify) for d in dies]
+    if args.max_size is not None:
+        dies = [dict(d, max_gds_bytes=args.max_size) for d in dies]
+    if args.layers is not None:
+        dies = [dict(d, layers=args.layers) for d in dies]
+    if args.cells is not None:
+        dies = [dict(d, cells=args.cells) for d in dies]
+    if args.memory_budget is not None:
+        dies = [dict(d, memory_budget=args.memory_budget) for d in dies]
+    common = (
+        base_dir,
+        output_dir,
+        manifest.get("gratings", []),
+        manifest.get("block_defaults"),
+    )
+
+    t0 = time.perf_counter()
+    if args.jobs > 1 and len(dies) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            if args.shard:
+                futures = [pool.submit(build_and_write_sharded, d, *common) for d in dies]
+            else:
+                futures = [pool.submit(build_and_write, d, *common) for d in dies]
+            results = [f.result() for f in futures]
+    elif args.shard:
+        # a single die: its shards are the unit of parallelism
+        results = [build_and_write_sharded(d, *common, jobs=args.jobs) for d in dies]
+    else:
+        results = [build_and_write(d, *common) for d in dies]
+    wall = time.perf_counter() - t0
+
+    _print_report(
+        [(d["name"],) + result for d, result in zip(dies, results)],
+        wall,
+    )
+    return 0
+
+
+def merge_command(args):
+    from .compressed import is_gds
+    from .shards import merge_gds
+
+    infiles = []
+    for path in args.inputs:
+        if os.path.isdir(path):
+            infiles.extend(
+                os.path.join(path, f) for f in sorted(os.listdir(path)) if is_gds(f)
+            )
+        else:
+            infiles.append(path)
+    t0 = time.perf_counter()
+    counts = merge_gds(args.output, infiles)
+    for infile, n in counts.items():
+        print("{:>6} cells  {}".format(n, infile))
+    print("merged {} cells into {} in {:.3f} s".format(
+        sum(counts.values()), args.output, time.perf_counter() - t0
+    ))
+    return 0
+
+
+def diff_command(args):
+    from .diff import diff_libraries, format_diff
+
+    t0 = time.perf_counter()
+    result = diff_libraries(args.a, args.b, args.grid)
+    if args.cell:
+        result = {name: result[name] for name in args.cell if name in result}
+    print(format_diff(result))
+    changed = [name for name, cell in result.items() if cell["status"] != "same"]
+    print("{} of {} cells differ ({:.3f} s)".format(len(changed), len(result), time.perf_counter() - t0))
+    return 1 if changed else 0
+
+
+def convert_command(args):
+    from .compressed import convert_gds
+
+    t0 = time.perf_counter()
+    size = convert_gds(args.input, args.output, args.plain, args.level)
+    written = [args.output] + ([args.plain] if args.plain else [])
+    print("{} bytes of GDS from {} to {} in {:.3f} s".format(
+        size,
+        args.input,
+        ", ".join("{} ({} bytes)".format(f, os.path.getsize(f)) for f in written),
+        time.perf_counter() - t0,
+    ))
+    return 0
+
+
+def density_command(args):
+    from .compressed import read_gds
+    from .density import density_maps, window_density
+
+    t0 = time.perf_counter()
+    lib = read_gds(args.input)
+    if args.cell:
+        cell = lib.cells[args.cell]
+    else:
+        cell = max(lib.top_level(), key=lambda c: len(c.get_dependencies(True)))
+    origin, maps = density_maps(cell, args.pitch)
+    window = max(1, int(round(args.window / args.pitch)))
+    print("{:<12}{:>10}{:>10}{:>10}".format("layer", "mean", "min", "max"))
+    for (layer, datatype), cover in maps.items():
+        density = window_density(cover, window)
+        print("{:<12}{:>10.4f}{:>10.4f}{:>10.4f}".format(
+            "{}/{}".format(layer, datatype), cover.mean(), density.min(), density.max()
+        ))
+    shape = next(iter(maps.values())).shape if maps else (0, 0)
+    print("{} on a {} x {} grid from ({:g}, {:g}) ({:.3f} s)".format(
+        cell.name, shape[0], shape[1], origin[0], origin[1], time.perf_counter() - t0
+    ))
+    return 0
+
+
+def verify_command(args):
+    from .build import load_manifest
+    from .extract import verify_die
+
+    manifest = load_manifest(args.manifest)
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    output_dir = args.output_dir or manifest.get("output_dir", ".")
+    if not os.path.isabs(output_dir) and args.output_dir is None:
+        output_dir = os.path.join(base_dir, output_dir)
+    dies = manifest["dies"]
+    if args.die:
+        dies = [d for d in dies if d["name"] in args.die]
+    t0 = time.perf_counter()
+    worst = 0.0
+    print("{:<20}{:>7}{:>10}{:>7}{:>12}".format("die", "block", "variant", "layer", "difference"))
+    for spec in dies:
+        for block, variant, layer, error in verify_die(
+            spec, base_dir, output_dir, manifest.get("block_defaults"), args.max_value
+        ):
+            print("{:<20}{:>7}{:>10}{:>7}{:>12.2e}".format(spec["name"], block, variant or "-", layer, error))
+            worst = max(worst, error)
+    print("{} dies, largest difference {:.2e} ({:.3f} s)".format(len(dies), worst, time.perf_counter() - t0))
+    return 1 if worst > args.tolerance else 0
+
+
+def index_command(args):
+    from .index import CellIndex, index_path
+
+    t0 = time.perf_counter()
+    with CellIndex(args.input, args.cache_dir) as index:
+        print("{} structures of {} indexed in {} ({:.3f} s)".format(
+            len(index), args.input, index_path(args.input, args.cache_dir), time.perf_counter() - t0
+        ))
+        for name in args.cell or []:
+            box = index.bounding_box(name)
+            print("{:<24}{:>8} dependencies  {}".format(
+                name, len(index.dependencies(name)) - 1, "empty" if box is None else box.tolist()
+            ))
+        if args.output:
+            t0 = time.perf_counter()
+            count = index.write(args.output, args.cell or index.top_level())
+            print("{} structures copied to {} in {:.3f} s".format(count, args.output, time.perf_counter() - t0))
+    return 0
+
+
+def watch_command(args):
+    from .watch import DieWatcher
+
+    t0 = time.perf_counter()
+    watcher = DieWatcher(args.manifest, args.die, args.output_dir)
+    print("built {} in {:.3f} s -> {}, watching (Ctrl-C to stop)".format(
+        args.die, time.perf_counter() - t0, watcher.outfile
+    ))
+    sys.stdout.flush()
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="gdspy_grating", description="Grating and D2NN layout tools."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build the dies of a manifest")
+    build.add_argument("manifest", help="JSON or TOML manifest")
+    build.add_argument(
+        "-j", "--jobs", type=int, default=1, help="number of dies built in parallel"
+    )
+    build.add_argument(
+        "-o",
+        "--output-dir",
+        help="directory for the GDS files (default: manifest 'output_dir' "
+        "relative to the manifest, or the manifest directory)",
+    )
+    build.add_argument(
+        "--die", action="append", help="only build this die (can be repeated)"
+    )
+    build.add_argument(
+        "--simplify",
+        type=float,
+        metavar="DEVIATION",
+        help="simplify polygons with this maximal vertex deviation (um)",
+    )
+    build.add_argument(
+        "--max-size",
+        type=int,
+        metavar="BYTES",
+        help="refuse to write a die (or shard) estimated larger than this",
+    )
+    build.add_argument(
+        "--layers",
+        action="append",
+        metavar="LAYER[/DATATYPE]",
+        help="only generate and write this layer (can be repeated)",
+    )
+    build.add_argument(
+        "--cells",
+        action="append",
+        metavar="CELL",
+        help="only write this cell and its dependencies (can be repeated)",
+    )
+    build.add_argument(
+        "--shard",
+        action="store_true",
+        help="write the gratings, each D2NN block and the waveguides of a die "
+        "to separate files under <output-dir>/<die>/, next to a small top-level file",
+    )
+    build.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="read masks, build geometry and write finished cells of a die "
+        "concurrently (one cell per block, as in a merged --shard build)",
+    )
+    build.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="BYTES",
+        help="keep at most this many bytes of cells in memory, spilling finished "
+        "blocks to a local cache (one cell per block, as in a merged --shard build)",
+    )
+    build.set_defaults(func=build_command)
+
+    merge = commands.add_parser(
+        "merge", help="merge a top-level file and its shards into one GDS file"
+    )
+    merge.add_argument("output", help="merged GDS file")
+    merge.add_argument(
+        "inputs", nargs="+", help="GDS files or directories of shards"
+    )
+    merge.set_defaults(func=merge_command)
+
+    diff = commands.add_parser(
+        "diff", help="compare two GDS files cell by cell (exit status 1 if they differ)"
+    )
+    diff.add_argument("a", help="first GDS file")
+    diff.add_argument("b", help="second GDS file")
+    diff.add_argument(
+        "--cell", action="append", help="only report this cell (can be repeated)"
+    )
+    diff.add_argument(
+        "--grid",
+        type=float,
+        help="snapping grid for the comparison in um (default: database unit of the first file)",
+    )
+    diff.set_defaults(func=diff_command)
+
+    convert = commands.add_parser(
+        "convert",
+        help="copy a GDS file between compressions, chosen by file name "
+        "('.gz', '.xz', '.zst' or plain)",
+    )
+    convert.add_argument("input", help="GDS file, possibly compressed")
+    convert.add_argument("output", help="output GDS file")
+    convert.add_argument("--plain", help="also write an uncompressed copy to this file")
+    convert.add_argument("--level", type=int, help="compression level")
+    convert.set_defaults(func=convert_command)
+
+    density = commands.add_parser(
+        "density", help="report the windowed pattern density of every layer of a GDS file"
+    )
+    density.add_argument("input", help="GDS file, possibly compressed")
+    density.add_argument(
+        "--cell", help="cell to measure (default: the top-level cell with the most dependencies)"
+    )
+    density.add_argument("--pitch", type=float, default=10.0, help="grid pitch in um (default 10)")
+    density.add_argument("--window", type=float, default=100.0, help="window side in um (default 100)")
+    density.set_defaults(func=density_command)
+
+    verify = commands.add_parser(
+        "verify", help="extract the masks of built dies from their GDS files and compare them with the sources"
+    )
+    verify.add_argument("manifest", help="JSON or TOML manifest")
+    verify.add_argument("--die", action="append", help="only verify this die (can be repeated)")
+    verify.add_argument("-o", "--output-dir", help="directory of the GDS files")
+    verify.add_argument(
+        "--max-value", type=float, default=2.0, help="largest mask value (default 2)"
+    )
+    verify.add_argument(
+        "--tolerance", type=float, default=0.05, help="largest accepted difference (default 0.05)"
+    )
+    verify.set_defaults(func=verify_command)
+
+    index = commands.add_parser(
+        "index", help="index the structures of a GDS file for random access and copy some of them"
+    )
+    index.add_argument("input", help="plain GDS file")
+    index.add_argument(
+        "--cell", action="append", help="report this structure (can be repeated)"
+    )
+    index.add_argument(
+        "-o", "--output", help="copy the --cell structures and their dependencies to this GDS file"
+    )
+    index.add_argument("--cache-dir", help="directory of the index (default: next to the file)")
+    index.set_defaults(func=index_command)
+
+    watch = commands.add_parser(
+        "watch",
+        help="build a die, then rebuild the blocks whose masks change and the "
+        "whole die when the manifest changes",
+    )
+    watch.add_argument("manifest", help="JSON or TOML manifest")
+    watch.add_argument("--die", required=True, help="die to build")
+    watch.add_argument("-o", "--output-dir", help="directory for the GDS file")
+    watch.add_argument(
+        "--interval", type=float, default=0.2, help="seconds between polls (default 0.2)"
+    )
+    watch.set_defaults(func=watch_command)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "pipeline", False) and args.shard:
+        parser.error("--pipeline and --shard cannot be combined")
+    if getattr(args, "cells", None) and (args.pipeline or args.shard):
+        parser.error("--cells cannot be combined with --pipeline or --shard")
+    if getattr(args, "memory_budget", None) is not None and (args.pipeline or args.shard or args.cells):
+        parser.error("--memory-budget cannot be combined with --pipeline, --shard or --cells")
+    return args.func(args)
@@ -0,0 +1,188 @@
+"""
+Compressed GDS files, read and written as streams.
+
+The compression follows the file name: '.gz' (gzip), '.xz' (lzma) or
+'.zst' (Zstandard, needs the `zstandard` package); any other name is a
+plain GDS file.  Data goes through the (de)compressor as it is produced
+or consumed, one cell or one chunk at a time, so the uncompressed stream
+is never held in memory.  Output can be duplicated to a plain copy in
+the same pass.
+"""
+
+import contextlib
+import gzip
+import lzma
+import os
+import tempfile
+import gdspy
+
+#: compression of each file name suffix
+CODECS = {".gz": "gzip", ".gzip": "gzip", ".xz": "xz", ".zst": "zstd", ".zstd": "zstd"}
+
+
+def codec(path):
+    """
+    Compression of a file from its name: 'gzip', 'xz', 'zstd' or None.
+    """
+    for suffix, name in CODECS.items():
+        if str(path).lower().endswith(suffix):
+            return name
+    return None
+
+
+def is_gds(path):
+    """
+    True for a GDS file name, compressed or not (e.g. 'a.gds.gz').
+    """
+    name = str(path).lower()
+    for suffix in CODECS:
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+            break
+    return name.endswith(".gds")
+
+
+def open_gds(path, mode="rb", compression=None, level=None):
+    """
+    Open a GDS file for binary streaming.
+
+    path        : file name
+    mode        : 'rb' or 'wb'
+    compression : 'gzip', 'xz', 'zstd' or None, by default from `path`
+                  (see `codec`)
+    level       : compression level, None for the codec default
+
+    Return file object
+    """
+    if mode not in ("rb", "wb"):
+        raise ValueError("Mode must be 'rb' or 'wb', not {!r}.".format(mode))
+    compression = codec(path) if compression is None else compression
+    if compression is None:
+        return open(path, mode)
+    if compression == "gzip":
+        return gzip.open(path, mode, **({} if level is None else {"compresslevel": level}))
+    if compression == "xz":
+        return lzma.open(path, mode, **({} if level is None else {"preset": level}))
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Zstandard compressed GDS files need the zstandard package.")
+        if mode == "rb":
+            return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        compressor = zstandard.ZstdCompressor(**({} if level is None else {"level": level}))
+        return compressor.stream_writer(open(path, "wb"), closefd=True)
+    raise ValueError("Unknown compression {!r}.".format(compression))
+
+
+class TeeFile(object):
+    """
+    Binary output written to several files at once.
+    """
+
+    def __init__(self, *files):
+        self.files = files
+
+    def write(self, data):
+        for f in self.files:
+            f.write(data)
+        return len(data)
+
+    def writelines(self, lines):
+        for data in lines:
+            self.write(data)
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_output(path, plain=None, compression=None, level=None):
+    """
+    Open a GDS file for writing (see `open_gds`), duplicated to the plain
+    file `plain` if given.
+
+    Return file object
+    """
+    fout = open_gds(path, "wb", compression, level)
+    if plain is None:
+        return fout
+    return TeeFile(fout, open(plain, "wb"))
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Unique temporary file in the directory of `path`, moved over `path`
+    once the block completes and removed if it fails, so processes
+    writing the same file at once never publish a partial one.
+
+    Yield name of the temporary file
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".")
+    os.close(fd)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+@contextlib.contextmanager
+def atomic_output(path, mode="wb"):
+    """
+    Write `path` through a temporary file (see `atomic_path`).
+
+    Yield file object
+    """
+    with atomic_path(path) as tmp:
+        with open(tmp, mode) as fout:
+            yield fout
+
+
+def read_gds(infile, **kwargs):
+    """
+    Read a GDS file, compressed or not, into a new `GdsLibrary`.
+
+    kwargs : `GdsLibrary.read_gds` arguments
+
+    Return `GdsLibrary`
+    """
+    with open_gds(infile) as fin:
+        return gdspy.GdsLibrary(infile=fin, **kwargs)
+
+
+def write_gds(lib, outfile, plain=None, level=None):
+    """
+    Write a `GdsLibrary` to `outfile`, compressed by its name, and to
+    the plain file `plain` if given.  Cells are serialized one at a time
+    into the stream.
+
+    Return `outfile`
+    """
+    with open_output(outfile, plain, level=level) as fout:
+        lib.write_gds(fout)
+    return outfile
+
+
+def convert_gds(infile, outfile, plain=None, level=None, chunk_size=1 << 20):
+    """
+    Copy a GDS file between compressions (e.g. 'test.gds' to
+    'test.gds.gz' or back), `chunk_size` bytes at a time.
+
+    Return number of uncompressed bytes copied
+    """
+    size = 0
+    with open_gds(infile) as fin, open_output(outfile, plain, level=level) as fout:
+        for chunk in iter(lambda: fin.read(chunk_size), b""):
+            fout.write(chunk)
+            size += len(chunk)
+    return size
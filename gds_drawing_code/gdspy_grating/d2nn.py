@@ -0,0 +1,330 @@
+import os
+import functools
+import numpy
+import gdspy
+from .partial import layer_selected
+
+
+@functools.lru_cache(maxsize=64)
+def _read_mask(filename, mtime_ns, size):
+    import scipy.io as sio
+
+    post = sio.loadmat(filename)["save_mask_phase"]
+    post.flags.writeable = False
+    return post
+
+
+def load_mask(filepath, index, variant=""):
+    '''
+    Load the `save_mask_phase` array of one D2NN layer.
+
+    filepath : directory holding the `mask_length_0_<index>.mat` files
+               (Windows separators such as '1_7\\' are accepted)
+    index    : layer index
+    variant  : file name suffix, '_double' for the double-sided masks
+
+    Masks are cached by file name and modification time, so a file is
+    read once per process however many blocks or variants use it; the
+    returned array is read-only.  scipy is only imported here, the first
+    time a mask is loaded.
+    '''
+    filename = os.path.join(
+        filepath.replace("\\", "/"), "mask_length_0_" + str(index) + variant + ".mat"
+    )
+    st = os.stat(filename)
+    return _read_mask(os.path.abspath(filename), st.st_mtime_ns, st.st_size)
+
+
+def post_table(post, pixel_step=10, pixel_pitch=0.03, min_half_width=0.01):
+    '''
+    Post runs of one D2NN layer, relative to the bottom of the layer.
+
+    post           : `save_mask_phase` array of the layer
+    pixel_step     : one post every `pixel_step` mask pixels (the pixel in
+                     the middle of each group), 1 for full resolution
+    pixel_pitch    : mask pixel size along y
+    min_half_width : posts with a smaller half width are skipped
+
+    Consecutive posts with the same half width that touch each other are
+    run-length encoded into one run, so a full-resolution layer gives
+    about as many runs as the mask has transitions.
+
+    Return `(y0, y1)` arrays with the extent of each run
+    '''
+    post = numpy.asarray(post, dtype=float).ravel()
+    grid_width = pixel_step * pixel_pitch
+    n = post.size // pixel_step
+    half = post[pixel_step // 2:n * pixel_step:pixel_step] * 0.05 / 2
+    index = numpy.flatnonzero(half > min_half_width)
+    half = half[index]
+    # a run continues while the neighbour is the next post, has the same
+    # half width and overlaps or touches the current one
+    joined = (
+        (numpy.diff(index) == 1)
+        & (half[1:] == half[:-1])
+        & (2 * half[1:] >= grid_width)
+    )
+    first = numpy.concatenate(([True], ~joined))
+    last = numpy.concatenate((~joined, [True]))
+    center = grid_width * index + grid_width / 2
+    return center[first] - half[first], center[last] + half[last]
+
+
+def post_rectangles(post, x_start, y_min, pixel_step=10, pixel_pitch=0.03, post_length=0.4):
+    '''
+    Rectangles of the posts of one D2NN layer (see `post_table`), from
+    `x_start` to `x_start - post_length`.
+
+    Return `numpy.ndarray[N, 4, 2]`
+    '''
+    y0, y1 = post_table(post, pixel_step, pixel_pitch)
+    y0 = y0 + y_min
+    y1 = y1 + y_min
+    x0 = numpy.full_like(y0, x_start)
+    x1 = x0 - post_length
+    return numpy.stack(
+        (
+            numpy.stack((x0, y0), -1),
+            numpy.stack((x0, y1), -1),
+            numpy.stack((x1, y1), -1),
+            numpy.stack((x1, y0), -1),
+        ),
+        1,
+    )
+
+
+def _tile_label(i):
+    return str(i).replace("-", "m")
+
+
+def tile_posts(cell, rectangles, tile_size, layer=0, prefix=None):
+    '''
+    Add post rectangles to `cell` through square tile cells.
+
+    cell       : cell referencing the tiles
+    rectangles : `numpy.ndarray[N, 4, 2]` (see `post_rectangles`)
+    tile_size  : tile side; a post goes to the tile holding its center
+    layer      : GDSII layer of the posts
+    prefix     : tile names are `<prefix>_<i>_<j>` ('m' for minus signs),
+                 `<cell name>_tile` by default
+
+    Tiles keep absolute coordinates and are referenced at the origin.  A
+    tile already referenced by `cell` is extended.
+
+    Return list of the tile cells that received posts
+    '''
+    rectangles = numpy.asarray(rectangles, dtype=float)
+    if rectangles.shape[0] == 0:
+        return []
+    prefix = cell.name + "_tile" if prefix is None else prefix
+    ij = numpy.floor(rectangles.mean(1) / tile_size).astype(int)
+    order = numpy.lexsort((ij[:, 1], ij[:, 0]))
+    ij = ij[order]
+    rectangles = rectangles[order]
+    split = numpy.flatnonzero((numpy.diff(ij, axis=0) != 0).any(1)) + 1
+    first = numpy.concatenate(([0], split))
+    tiles = {
+        ref.ref_cell.name: ref.ref_cell
+        for ref in cell.references
+        if isinstance(ref.ref_cell, gdspy.Cell)
+    }
+    touched = []
+    for rect, (i, j) in zip(numpy.split(rectangles, split), ij[first]):
+        name = "{}_{}_{}".format(prefix, _tile_label(i), _tile_label(j))
+        tile = tiles.get(name)
+        if tile is None:
+            tile = gdspy.Cell(name, exclude_from_current=True)
+            cell.add(gdspy.CellReference(tile))
+            tiles[name] = tile
+        tile.add(gdspy.PolygonSet(rect, layer=layer))
+        touched.append(tile)
+    return touched
+
+
+def tile_query(cell, window):
+    '''
+    Cells referenced by `cell` (e.g. the tiles of `tile_posts`) whose
+    bounding box intersects `window` ((x0, y0), (x1, y1)), tested on the
+    stacked bounding boxes at once.
+
+    Return list of cells
+    '''
+    cells = [ref.ref_cell for ref in cell.references if isinstance(ref.ref_cell, gdspy.Cell)]
+    boxes = [c.get_bounding_box() for c in cells]
+    cells = [c for c, b in zip(cells, boxes) if b is not None]
+    if not cells:
+        return []
+    boxes = numpy.array([b for b in boxes if b is not None])
+    (x0, y0), (x1, y1) = window
+    hit = (
+        (boxes[:, 0, 0] <= x1)
+        & (boxes[:, 1, 0] >= x0)
+        & (boxes[:, 0, 1] <= y1)
+        & (boxes[:, 1, 1] >= y0)
+    )
+    return [c for c, h in zip(cells, hit) if h]
+
+
+def d2nn_construct(c, filepath, x_max, y_min, layer_distance, input_distance, num_layers, grat, grat_sur, small_margin, wg_len, polygon_layer=0, pixel_step=10, pixel_pitch=0.03, double_cell=None, double_offset=(0.8, 0), load=load_mask, layers=None, tile_size=None, input_height=None, outputs=True):
+    '''
+    wg_len: output vertical waveguide length
+    grat_sur: surrounding cell of the gratings, None for gratings that
+        bring their own (e.g. imported with `import_cell`)
+    pixel_step: one post every `pixel_step` mask pixels, 1 for full resolution
+    pixel_pitch: mask pixel size along y
+    double_cell: if given, the same block is also drawn into this cell
+        from the `_double` masks, each post doubled by a second post
+        shifted by `double_offset`; both mask variants are read in the
+        same pass over the layers and the markers, waveguides and
+        grating references are shared by the two cells
+    double_offset: (dx, dy) of the second post, the default puts it on
+        the other side of the layer line with a 0.4 gap
+    load: function called as `load_mask(filepath, index, variant)` for
+        each layer in order, e.g. to take masks prefetched by a
+        pipelined build
+    layers: selection of layers (see `parse_layers`); when the post layer
+        is not selected no mask is read and no post is drawn
+    tile_size: if given, the posts go to tile cells of this side
+        referenced by `c` (and `double_cell`), see `tile_posts`; the
+        tiles must be added to the library with the cell, e.g. with
+        `lib.add(c, include_dependencies=True)`
+    input_height: height of the input aperture framed by the markers, by
+        default the length of the masks (number of pixels times
+        `pixel_pitch`, 900 for 30000 pixels), 900 if no mask is read
+    outputs: False leaves out the output waveguides and gratings, so the
+        outputs can be routed elsewhere (see `d2nn_ports` and `Router`)
+    '''
+    #propagate towards left
+    #add structure
+    #filepath = 'H:\\tiankuang\\Projects\\chip-wavefront-shaping-D2NN\\modulator-design-200nm-lateral-range\\harmonic-testing-matlab-validation\\1209_5layer_30000pixel_sample(100uminput)\\'
+    #post_widths = dict()
+    x_offset = x_max-input_distance
+    for i in range(num_layers):
+        if not layer_selected(polygon_layer, 0, layers):
+            break
+        post = load(filepath, i, "")
+        if input_height is None:
+            input_height = numpy.size(post) * pixel_pitch
+        x_start = -i*layer_distance + x_offset
+        rect = post_rectangles(post, x_start, y_min, pixel_step, pixel_pitch)
+        if tile_size:
+            tile_posts(c, rect, tile_size, polygon_layer)
+        else:
+            c.add(gdspy.PolygonSet(rect, layer=polygon_layer))
+        if double_cell is not None:
+            post = load(filepath, i, "_double")
+            rect = post_rectangles(post, x_start, y_min, pixel_step, pixel_pitch)
+            rect = numpy.concatenate((rect, rect + numpy.asarray(double_offset, dtype=float)))
+            if tile_size:
+                tile_posts(double_cell, rect, tile_size, polygon_layer)
+            else:
+                double_cell.add(gdspy.PolygonSet(rect, layer=polygon_layer))
+    frame = (len(c.polygons), len(c.paths), len(c.references))
+    if input_height is None:
+        input_height = 900
+
+
+    #input marker
+    m_width = 50
+    m_x = x_max + m_width 
+    m_y = 0 + y_min
+    c.add(gdspy.Polygon([(m_x, m_y), (m_x-m_width, m_y), (m_x-m_width, m_y-m_width), (m_x, m_y-m_width), (m_x, m_y)]))
+    m_width = 50
+    m_x = x_max + m_width
+    m_y = input_height + m_width + y_min
+    c.add(gdspy.Polygon([(m_x, m_y), (m_x-m_width, m_y), (m_x-m_width, m_y-m_width), (m_x, m_y-m_width), (m_x, m_y)]))
+
+    m_width = 150
+    mk_width = 50
+    m_x = x_max + m_width
+    c.add(gdspy.Polygon([(m_x, y_min-mk_width), (m_x-m_width+mk_width, y_min-mk_width), \
+        (m_x-m_width+mk_width, y_min), (m_x-m_width, y_min), \
+        (m_x-m_width, y_min+input_height), (m_x-m_width+mk_width, y_min+input_height), \
+         (m_x-m_width+mk_width, y_min+input_height+mk_width), (m_x, y_min+input_height+mk_width), \
+             (m_x, y_min-mk_width)], layer=3))
+
+
+    if outputs:
+        #add waveguide
+        y_offset = [600+y_min, 300+y_min]
+        x_start = -num_layers*layer_distance+x_offset
+        bend_radius = 150
+        width = 0.5
+        wg_horizon = [-300, -300]
+        wg_verticl = [wg_len, -wg_len]
+        for i in range(2):
+            #one time
+            path = gdspy.FlexPath(
+                [(x_start, y_offset[i])],
+                width=[small_margin, small_margin],
+                offset = small_margin + width,
+                corners="circular bend",
+                bend_radius=bend_radius,
+                gdsii_path=True,
+            )
+            #path.segment((0, 600 - wg_gap * i), relative=True)
+            path.segment((wg_horizon[i], 0), relative=True)
+            path.segment((0, wg_verticl[i]), relative=True)
+            c.add(path)
+
+            # #two time
+            # path = gdspy.FlexPath(
+            #     [(x_start, y_offset[i]+(small_margin + width)/2)],
+            #     width=[small_margin],
+            #     #offset = small_margin + width,
+            #     corners="circular bend",
+            #     bend_radius=bend_radius,
+            #     gdsii_path=True,
+            # )
+            # #path.segment((0, 600 - wg_gap * i), relative=True)
+            # path.segment((wg_horizon[i], 0), relative=True)
+            # path.segment((0, wg_verticl[i]), relative=True)
+            # c.add(path)
+
+            # path = gdspy.FlexPath(
+            #     [(x_start, y_offset[i]-(small_margin + width)/2)],
+            #     width=[small_margin],
+            #     #offset = small_margin + width,
+            #     corners="circular bend",
+            #     bend_radius=bend_radius,
+            #     gdsii_path=True,
+            # )
+            #path.segment((0, 600 - wg_gap * i), relative=True)
+            #path.segment((wg_horizon[i], 0), relative=True)
+            #path.segment((0, wg_verticl[i]), relative=True)
+            c.add(path)
+
+
+        #grating coupler
+        c.add(
+            gdspy.CellArray(
+                grat, 1, 1, (0, 0), (x_start+wg_horizon[0], y_offset[0]+wg_len) 
+            )
+        )
+        #surrounding of grating
+        if grat_sur is not None:
+            c.add(
+                gdspy.CellArray(
+                    grat_sur, 1, 1, (0, 0), (x_start+wg_horizon[0], y_offset[0]+wg_len) 
+                )
+            )
+        #grating coupler
+        c.add(
+            gdspy.CellArray(
+                grat, 1, 1, (0, 0), (x_start+wg_horizon[1], y_offset[1]-wg_len), 180
+            )
+        )
+        #surrounding of grating
+        if grat_sur is not None:
+            c.add(
+                gdspy.CellArray(
+                    grat_sur, 1, 1, (0, 0), (x_start+wg_horizon[1], y_offset[1]-wg_len), 180
+                )
+            )
+    if double_cell is not None:
+        double_cell.add(c.polygons[frame[0]:] + c.paths[frame[1]:] + c.references[frame[2]:])
+
+
+
+
+    return c
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""
+Pattern density maps and dummy fill.
+
+Each layer is rasterized onto a coarse grid in one vectorized pass: a
+polygon is split into the signed columns between its edges and the
+bottom of the grid, each column is deposited at its four corners with
+linear weights, and two cumulative sums give the covered fraction of
+every grid cell (exact for rectangles such as the posts, accurate to
+within one grid cell along slanted or curved edges).  Windowed density
+is the box convolution of that map, computed from its summed-area
+table.  Dummy fill goes where the windowed density is below a target,
+away from everything drawn, as arrays of a single fill cell.
+"""
+
+import numpy
+import gdspy
+from .placement import BoundingBoxes
+from .transform import flatten
+
+
+def grid_box(box, pitch):
+    """
+    `box` ((x0, y0), (x1, y1)) grown to whole multiples of `pitch`.
+
+    Return `(origin, shape)` of the grid covering it
+    """
+    box = numpy.asarray(box, dtype=float)
+    low = numpy.floor(box[0] / pitch) * pitch
+    shape = numpy.maximum(1, numpy.ceil((box[1] - low) / pitch - 1e-9).astype(int))
+    return low, tuple(int(n) for n in shape)
+
+
+def coverage(polygons, origin, shape, pitch):
+    """
+    Fraction of each grid cell covered by a list of polygons.
+
+    polygons : list of `[N, 2]` arrays
+    origin   : lower left corner of the grid
+    shape    : number of grid cells along x and y
+    pitch    : grid cell size
+
+    Return `numpy.ndarray[shape]`, indexed by (x, y) cell, clipped to
+    [0, 1]
+    """
+    if len(polygons) == 0:
+        return numpy.zeros(shape)
+    sizes = numpy.array([len(p) for p in polygons])
+    return stacked_coverage(numpy.concatenate(polygons), sizes, origin, shape, pitch)
+
+
+def stacked_coverage(points, sizes, origin, shape, pitch):
+    """
+    `coverage` of polygons given as stacked vertices `points` and the
+    vertex count of each polygon `sizes` (see `flatten`).
+    """
+    nx, ny = shape
+    if sizes.size == 0:
+        return numpy.zeros(shape)
+    points = (points - origin) / pitch
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+    nxt = numpy.arange(1, points.shape[0] + 1)
+    nxt[starts + sizes - 1] = starts
+    x = points[:, 0]
+    y = points[:, 1]
+    # orientation of each polygon, so both windings count positively
+    orient = numpy.sign(numpy.add.reduceat(x * y[nxt] - x[nxt] * y, starts))
+    orient = numpy.repeat(orient, sizes)
+    xa, ya, xb, yb = x, y, x[nxt], y[nxt]
+    # edges split into pieces at most one grid cell wide
+    pieces = numpy.maximum(1, numpy.ceil(numpy.abs(xb - xa))).astype(int)
+    edge = numpy.repeat(numpy.arange(xa.size), pieces)
+    k = numpy.arange(edge.size) - numpy.repeat(numpy.cumsum(pieces) - pieces, pieces)
+    n = pieces[edge]
+    dx = (xb - xa)[edge]
+    x0 = xa[edge] + dx * k / n
+    x1 = xa[edge] + dx * (k + 1) / n
+    y1 = ya[edge] + (yb - ya)[edge] * (k + 0.5) / n
+    weight = -numpy.sign(dx) * orient[edge]
+    keep = (weight != 0) & (x0 != x1)
+    low = numpy.clip(numpy.minimum(x0, x1)[keep], 0, nx)
+    high = numpy.clip(numpy.maximum(x0, x1)[keep], 0, nx)
+    top = numpy.clip(y1[keep], 0, ny)
+    weight = weight[keep]
+    # each column [low, high] x [0, top] deposited at its corners; a
+    # cumulative sum of linear (cloud-in-cell) weights along an axis is
+    # the covered length of each cell
+    xi, xw = _corners(low, high)
+    yi, yw = _corners(numpy.zeros_like(top), top)
+    index = (xi[:, :, None] * (ny + 2) + yi[:, None, :]).ravel()
+    values = (weight[:, None, None] * xw[:, :, None] * yw[:, None, :]).ravel()
+    deposits = numpy.bincount(index, values, (nx + 2) * (ny + 2)).reshape(nx + 2, ny + 2)
+    result = deposits.cumsum(0).cumsum(1)[:nx, :ny]
+    # rounding leaves residues in the empty cells
+    result[result < 1e-9] = 0.0
+    return numpy.clip(result, 0.0, 1.0)
+
+
+def _corners(start, end):
+    """
+    Grid indices `[N, 4]` and signed linear weights of interval ends.
+    """
+    i0 = numpy.floor(start).astype(int)
+    i1 = numpy.floor(end).astype(int)
+    t0 = start - i0
+    t1 = end - i1
+    index = numpy.stack((i0, i0 + 1, i1, i1 + 1), axis=1)
+    weight = numpy.stack((1 - t0, t0, t1 - 1, -t1), axis=1)
+    return index, weight
+
+
+def density_maps(cell, pitch=10.0, box=None, boxes=None):
+    """
+    Covered fraction of a coarse grid for every layer of a cell, with
+    all references flattened (see `flatten`).
+
+    cell  : `Cell`
+    pitch : grid cell size
+    box   : area of the grid, by default the bounding box of `cell`
+    boxes : `BoundingBoxes` cache used for the default `box`
+
+    Return `(origin, maps)` with the lower left corner of the grid and a
+    dictionary of `coverage` arrays by (layer, datatype)
+    """
+    if box is None:
+        box = (BoundingBoxes() if boxes is None else boxes).get(cell)
+        if box is None:
+            return numpy.zeros(2), {}
+    origin, shape = grid_box(box, pitch)
+    points, sizes, layers, datatypes = flatten(cell)
+    vertex_spec = numpy.repeat(layers * 65536 + datatypes, sizes)
+    maps = {}
+    for spec in numpy.unique(layers * 65536 + datatypes).tolist():
+        selected = (layers * 65536 + datatypes) == spec
+        maps[divmod(spec, 65536)] = stacked_coverage(points[vertex_spec == spec], sizes[selected], origin, shape, pitch)
+    return origin, maps
+
+
+def window_density(cover, window):
+    """
+    Mean coverage within a square window around each grid cell (box
+    convolution), counting only the cells inside the grid.
+
+    cover  : `coverage` array
+    window : window side in grid cells (rounded up to an odd number)
+
+    Return array of the shape of `cover`
+    """
+    half = int(window) // 2
+    table = numpy.zeros((cover.shape[0] + 1, cover.shape[1] + 1))
+    table[1:, 1:] = cover.cumsum(0).cumsum(1)
+    i = numpy.arange(cover.shape[0])
+    j = numpy.arange(cover.shape[1])
+    i0 = numpy.clip(i - half, 0, cover.shape[0])[:, None]
+    i1 = numpy.clip(i + half + 1, 0, cover.shape[0])[:, None]
+    j0 = numpy.clip(j - half, 0, cover.shape[1])[None, :]
+    j1 = numpy.clip(j + half + 1, 0, cover.shape[1])[None, :]
+    total = table[i1, j1] - table[i0, j1] - table[i1, j0] + table[i0, j0]
+    return numpy.maximum(total, 0.0) / ((i1 - i0) * (j1 - j0))
+
+
+def _dilate(mask, cells):
+    """
+    Grid cells within `cells` cells (square neighborhood) of `mask`.
+    """
+    if cells <= 0:
+        return mask
+    return window_density(mask.astype(float), 2 * cells + 1) > 0
+
+
+def _rectangles(mask):
+    """
+    Cover a boolean grid with rectangles: runs along x of each row,
+    merged with the identical runs of the following rows.
+
+    Return list of `(i0, j0, columns, rows)`
+    """
+    result = []
+    open_runs = {}
+    for j in range(mask.shape[1] + 1):
+        runs = set()
+        if j < mask.shape[1]:
+            edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], mask[:, j].astype(numpy.int8), [0]))))
+            runs = set(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+        for run in set(open_runs) - runs:
+            j0 = open_runs.pop(run)
+            result.append((run[0], j0, run[1] - run[0], j - j0))
+        for run in runs - set(open_runs):
+            open_runs[run] = j
+    return sorted(result, key=lambda r: (r[1], r[0]))
+
+
+def dummy_fill(
+    cell,
+    layer=2,
+    datatype=0,
+    target=0.2,
+    pitch=10.0,
+    window=100.0,
+    size=2.5,
+    fill_pitch=5.0,
+    clearance=20.0,
+    keepout=(),
+    keepout_layers=None,
+    box=None,
+    name=None,
+    boxes=None,
+):
+    """
+    Dummy fill of a cell on one layer.
+
+    layer, datatype : GDSII layer and datatype of the fill squares
+    target          : windowed density of `layer` below which fill is
+                      added
+    pitch           : density grid cell size, a multiple of `fill_pitch`
+    window          : side of the density window
+    size            : side of a fill square
+    fill_pitch      : spacing of the fill squares
+    clearance       : minimal distance between fill and the geometry on
+                      `keepout_layers` (every layer of the cell by
+                      default), the optical regions
+    keepout         : additional boxes ((x0, y0), (x1, y1)) kept empty,
+                      e.g. the free-space region between D2NN layers
+    box             : area to fill, by default the bounding box of `cell`
+    name            : name of the fill cell (default '<cell>_fill')
+    boxes           : `BoundingBoxes` cache
+
+    Every empty grid cell clear of the keep-out regions and whose
+    window is below `target` is filled with `(pitch / fill_pitch)**2`
+    squares; the filled cells are covered by rectangles, each one a
+    `CellArray` of the fill cell.  The cell itself is not modified.
+
+    Return `(fill Cell, list of CellArray)`
+    """
+    count = int(round(pitch / fill_pitch))
+    if count < 1 or abs(count * fill_pitch - pitch) > 1e-9 * pitch:
+        raise ValueError("Fill pitch {} does not divide the grid pitch {}.".format(fill_pitch, pitch))
+    if size > fill_pitch:
+        raise ValueError("Fill size {} exceeds the fill pitch {}.".format(size, fill_pitch))
+    fill = gdspy.Cell(name or "{}_fill".format(cell.name), exclude_from_current=True)
+    margin = 0.5 * (fill_pitch - size)
+    fill.add(gdspy.Rectangle((margin, margin), (margin + size, margin + size), layer, datatype))
+    origin, maps = density_maps(cell, pitch, box, boxes)
+    if not maps:
+        return fill, []
+    shape = next(iter(maps.values())).shape
+    cover = numpy.clip(sum((m for (l, _), m in maps.items() if l == layer), numpy.zeros(shape)), 0.0, 1.0)
+    occupied = numpy.zeros(shape, dtype=bool)
+    for (l, d), m in maps.items():
+        if keepout_layers is None or l in keepout_layers or (l, d) in keepout_layers:
+            occupied |= m > 0
+    blocked = _dilate(occupied, int(numpy.ceil(clearance / pitch)))
+    for (x0, y0), (x1, y1) in keepout:
+        i0, j0 = numpy.floor((numpy.array((x0, y0)) - clearance - origin) / pitch).astype(int)
+        i1, j1 = numpy.ceil((numpy.array((x1, y1)) + clearance - origin) / pitch).astype(int)
+        blocked[max(i0, 0):max(i1, 0), max(j0, 0):max(j1, 0)] = True
+    wanted = ~blocked & (window_density(cover, max(1, int(round(window / pitch)))) < target)
+    arrays = [
+        gdspy.CellArray(
+            fill,
+            columns * count,
+            rows * count,
+            (fill_pitch, fill_pitch),
+            (origin[0] + i * pitch, origin[1] + j * pitch),
+        )
+        for i, j, columns, rows in _rectangles(wanted)
+    ]
+    return fill, arrays
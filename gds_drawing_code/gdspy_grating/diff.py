@@ -0,0 +1,344 @@
+"""
+Geometric comparison of two layouts, cell by cell.
+
+Each polygon is snapped to the database grid and put in a canonical form
+(repeated and collinear vertices dropped, counterclockwise, starting at
+its lowest vertex), so identical polygons compare equal whatever their
+order in the file or the writer that closed them.  A structural hash of
+every cell decides first whether it changed.  In a changed cell the
+polygons present on both sides are matched exactly, and the XOR area is
+only computed for the rest: polygons whose bounding box meets nothing
+on the other side contribute their own area, and gdspy's boolean runs
+on each cluster of overlapping ones separately.
+"""
+
+import collections
+import hashlib
+import numpy
+import gdspy
+from .compressed import read_gds
+
+
+def _simplify(points, sizes):
+    """
+    Drop the repeated vertices (such as a closing vertex equal to the
+    first one) and the collinear ones of stacked integer polygons, until
+    none is left.
+
+    Return `(points, sizes)`
+    """
+    while points.shape[0]:
+        starts = numpy.cumsum(sizes) - sizes
+        owner = numpy.repeat(numpy.arange(sizes.size), sizes)
+        local = numpy.arange(points.shape[0]) - starts[owner]
+        before = points - points[starts[owner] + (local - 1) % sizes[owner]]
+        after = points[starts[owner] + (local + 1) % sizes[owner]] - points
+        repeated = (before == 0).all(1)
+        if repeated.any():
+            # one copy of each repeated vertex is kept
+            keep = ~repeated
+        else:
+            keep = before[:, 0] * after[:, 1] != before[:, 1] * after[:, 0]
+        if keep.all():
+            break
+        points = points[keep]
+        sizes = numpy.bincount(owner[keep], minlength=sizes.size)
+    return points, sizes
+
+
+def _polygon_groups(cell, grid):
+    """
+    Canonical polygons of a cell grouped by (layer, datatype, vertices);
+    polygons left with fewer than 3 vertices (no area) are dropped.
+
+    Return dictionary of `(rows, polygons)`: integer rows `[M, 2 * n]`
+    and the original polygons, in the same order
+    """
+    polygons = []
+    specs = []
+    polygonsets = list(cell.polygons) + [p.to_polygonset() for p in cell.paths]
+    for ps in polygonsets:
+        polygons.extend(ps.polygons)
+        specs.extend(zip(ps.layers, ps.datatypes))
+    if not polygons:
+        return {}
+    sizes = numpy.array([len(p) for p in polygons])
+    points = numpy.round(numpy.concatenate(polygons) / grid).astype(numpy.int64)
+    points, sizes = _simplify(points, sizes)
+    starts = numpy.cumsum(sizes) - sizes
+    groups = collections.defaultdict(list)
+    for i, (spec, n) in enumerate(zip(specs, sizes.tolist())):
+        if n >= 3:
+            groups[(int(spec[0]), int(spec[1]), n)].append(i)
+    result = {}
+    for key, members in groups.items():
+        n = key[2]
+        members = numpy.array(members)
+        group = points[starts[members, None] + numpy.arange(n)]
+        x = group[:, :, 0]
+        y = group[:, :, 1]
+        area = (x * numpy.roll(y, -1, 1) - numpy.roll(x, -1, 1) * y).sum(1)
+        group[area < 0] = group[area < 0, ::-1]
+        start = numpy.argmin(group[:, :, 0] * (1 << 32) + group[:, :, 1], 1)
+        index = (numpy.arange(n)[None, :] + start[:, None]) % n
+        rows = numpy.take_along_axis(group, index[:, :, None], 1).reshape(members.size, 2 * n)
+        result[key] = (rows, [polygons[i] for i in members.tolist()])
+    return result
+
+
+def _reference_keys(cell, grid):
+    keys = []
+    for ref in cell.references:
+        name = ref.ref_cell.name if isinstance(ref.ref_cell, gdspy.Cell) else ref.ref_cell
+        columns = getattr(ref, "columns", 1)
+        rows = getattr(ref, "rows", 1)
+        # the spacing along a single column or row places nothing, so a
+        # 1x1 array keys as a plain reference
+        spacing = numpy.array(getattr(ref, "spacing", (0, 0)), dtype=float) * [columns > 1, rows > 1]
+        keys.append(
+            (
+                name,
+                tuple(int(v) for v in numpy.round(numpy.array(ref.origin) / grid)),
+                float(ref.rotation or 0) % 360,
+                float(ref.magnification or 1),
+                bool(ref.x_reflection),
+                columns,
+                rows,
+                tuple(int(v) for v in numpy.round(spacing / grid)),
+            )
+        )
+    return collections.Counter(keys)
+
+
+def _label_keys(cell, grid):
+    return collections.Counter(
+        (
+            label.text,
+            tuple(int(v) for v in numpy.round(numpy.array(label.position) / grid)),
+            int(label.layer),
+            int(label.texttype),
+        )
+        for label in cell.labels
+    )
+
+
+def cell_signature(cell, grid=1e-3):
+    """
+    Canonical content of a cell and its structural hash.
+
+    Return `(digest, groups, references, labels)`
+    """
+    groups = _polygon_groups(cell, grid)
+    references = _reference_keys(cell, grid)
+    labels = _label_keys(cell, grid)
+    digest = hashlib.sha1()
+    for key in sorted(groups):
+        rows = groups[key][0]
+        digest.update(repr(key).encode())
+        digest.update(numpy.sort(rows.view("V{}".format(rows.shape[1] * 8)).ravel()).tobytes())
+    digest.update(repr(sorted(references.items())).encode())
+    digest.update(repr(sorted(labels.items())).encode())
+    return digest.hexdigest(), groups, references, labels
+
+
+def _unmatched(rows_a, rows_b):
+    """
+    Rows of `rows_a` and `rows_b` without an identical row on the other
+    side (as multisets).
+
+    Return `(index in a, index in b)`
+    """
+    void = "V{}".format(rows_a.shape[1] * 8)
+    both = numpy.concatenate((rows_a, rows_b)).view(void).ravel()
+    _, inverse = numpy.unique(both, return_inverse=True)
+    inverse = inverse.ravel()
+    inv_a = inverse[: rows_a.shape[0]]
+    inv_b = inverse[rows_a.shape[0]:]
+    size = inverse.max() + 1
+    count_a = numpy.bincount(inv_a, minlength=size)
+    count_b = numpy.bincount(inv_b, minlength=size)
+
+    def excess(inv, other):
+        order = numpy.argsort(inv, kind="stable")
+        sorted_inv = inv[order]
+        first = numpy.searchsorted(sorted_inv, sorted_inv)
+        occurrence = numpy.empty_like(order)
+        occurrence[order] = numpy.arange(inv.size) - first
+        return numpy.flatnonzero(occurrence >= other[inv])
+
+    return excess(inv_a, count_b), excess(inv_b, count_a)
+
+
+def _area(polygons):
+    return sum(
+        0.5 * abs(numpy.dot(p[:, 0], numpy.roll(p[:, 1], -1)) - numpy.dot(numpy.roll(p[:, 0], -1), p[:, 1]))
+        for p in polygons
+    )
+
+
+def _bboxes(polygons):
+    return numpy.array([(p[:, 0].min(), p[:, 1].min(), p[:, 0].max(), p[:, 1].max()) for p in polygons])
+
+
+def _clusters(size, first, second):
+    """
+    Connected components of a graph of `size` nodes and edges
+    `first[k]`-`second[k]`, by label propagation.
+
+    Return the smallest node of the component of every node
+    """
+    labels = numpy.arange(size)
+    while True:
+        updated = labels.copy()
+        numpy.minimum.at(updated, first, labels[second])
+        numpy.minimum.at(updated, second, labels[first])
+        updated = updated[updated]
+        if (updated == labels).all():
+            return labels
+        labels = updated
+
+
+def xor_area(polygons_a, polygons_b, grid=1e-3, chunk=2048):
+    """
+    Area of the XOR of two lists of polygons.  Polygons whose bounding
+    box meets no other box count with their own area; the others are
+    split into clusters of overlapping boxes (on either side), and a
+    boolean runs on each cluster.
+    """
+    polygons = list(polygons_a) + list(polygons_b)
+    if not polygons:
+        return 0.0
+    boxes = _bboxes(polygons)
+    first = []
+    second = []
+    for i in range(0, len(polygons), chunk):
+        a = boxes[i:i + chunk, None]
+        overlap = (
+            (a[..., 0] <= boxes[None, :, 2])
+            & (a[..., 2] >= boxes[None, :, 0])
+            & (a[..., 1] <= boxes[None, :, 3])
+            & (a[..., 3] >= boxes[None, :, 1])
+        )
+        ia, jb = numpy.nonzero(overlap)
+        # every box meets itself
+        ia += i
+        first.append(ia[ia != jb])
+        second.append(jb[ia != jb])
+    first = numpy.concatenate(first)
+    second = numpy.concatenate(second)
+    hit = numpy.zeros(len(polygons), dtype=bool)
+    hit[first] = True
+    area = _area([p for p, h in zip(polygons, hit) if not h])
+    labels = _clusters(hit.size, first, second)
+    nodes = numpy.flatnonzero(hit)
+    nodes = nodes[numpy.argsort(labels[nodes], kind="stable")]
+    bounds = numpy.flatnonzero(numpy.diff(labels[nodes])) + 1
+    for cluster in numpy.split(nodes, bounds):
+        if cluster.size == 0:
+            continue
+        side = cluster < len(polygons_a)
+        in_a = [polygons[k] for k in cluster[side].tolist()]
+        in_b = [polygons[k] for k in cluster[~side].tolist()]
+        # gdspy returns a lone operand as is, so a one-sided cluster is
+        # merged with 'or'
+        result = gdspy.boolean(
+            in_a or in_b,
+            in_b if in_a else [],
+            "xor" if in_a and in_b else "or",
+            precision=grid,
+        )
+        if result is not None:
+            area += result.area()
+    return area
+
+
+def diff_cells(cell_a, cell_b, grid=1e-3, signature_a=None, signature_b=None):
+    """
+    Compare two cells (references are compared, not followed).
+
+    Return dictionary with `status` ('same' or 'different'), `layers`
+    mapping `(layer, datatype)` to the numbers of unmatched polygons
+    `only_a`, `only_b` and their `xor_area`, and the numbers of
+    unmatched `references` and `labels` as `(only_a, only_b)`
+    """
+    digest_a, groups_a, refs_a, labels_a = signature_a or cell_signature(cell_a, grid)
+    digest_b, groups_b, refs_b, labels_b = signature_b or cell_signature(cell_b, grid)
+    result = {"status": "same", "layers": {}, "references": (0, 0), "labels": (0, 0)}
+    if digest_a == digest_b:
+        return result
+    result["status"] = "different"
+    unmatched = collections.defaultdict(lambda: ([], []))
+    for key in set(groups_a) | set(groups_b):
+        rows_a, polygons_a = groups_a.get(key, (None, []))
+        rows_b, polygons_b = groups_b.get(key, (None, []))
+        if rows_a is None:
+            only_a, only_b = [], range(len(polygons_b))
+        elif rows_b is None:
+            only_a, only_b = range(len(polygons_a)), []
+        else:
+            only_a, only_b = _unmatched(rows_a, rows_b)
+        unmatched[key[:2]][0].extend(polygons_a[i] for i in only_a)
+        unmatched[key[:2]][1].extend(polygons_b[i] for i in only_b)
+    for layer, (polygons_a, polygons_b) in sorted(unmatched.items()):
+        if polygons_a or polygons_b:
+            result["layers"][layer] = {
+                "only_a": len(polygons_a),
+                "only_b": len(polygons_b),
+                "xor_area": float(xor_area(polygons_a, polygons_b, grid)),
+            }
+    result["references"] = (
+        sum((refs_a - refs_b).values()),
+        sum((refs_b - refs_a).values()),
+    )
+    result["labels"] = (
+        sum((labels_a - labels_b).values()),
+        sum((labels_b - labels_a).values()),
+    )
+    return result
+
+
+def diff_libraries(lib_a, lib_b, grid=None):
+    """
+    Compare two libraries cell by cell (by name).
+
+    lib_a, lib_b : `GdsLibrary` or GDS file names (possibly compressed)
+    grid         : snapping grid in user units (default: the database
+                   unit of `lib_a`)
+
+    Return dictionary of `diff_cells` results by cell name, with status
+    'only_a' or 'only_b' for cells defined on one side only
+    """
+    if not isinstance(lib_a, gdspy.GdsLibrary):
+        lib_a = read_gds(lib_a)
+    if not isinstance(lib_b, gdspy.GdsLibrary):
+        lib_b = read_gds(lib_b)
+    if grid is None:
+        grid = lib_a.precision / lib_a.unit
+    result = {}
+    for name in sorted(set(lib_a.cells) | set(lib_b.cells)):
+        if name not in lib_b.cells:
+            result[name] = {"status": "only_a"}
+        elif name not in lib_a.cells:
+            result[name] = {"status": "only_b"}
+        else:
+            result[name] = diff_cells(lib_a.cells[name], lib_b.cells[name], grid)
+    return result
+
+
+def format_diff(result):
+    """
+    Text report of `diff_libraries`.
+    """
+    lines = []
+    for name, cell in result.items():
+        lines.append("{:<24}{}".format(name, cell["status"]))
+        for (layer, datatype), d in cell.get("layers", {}).items():
+            lines.append(
+                "    {}/{}: {} only in a, {} only in b, XOR area {:.6g}".format(
+                    layer, datatype, d["only_a"], d["only_b"], d["xor_area"]
+                )
+            )
+        for key in ("references", "labels"):
+            if any(cell.get(key, (0, 0))):
+                lines.append("    {}: {} only in a, {} only in b".format(key, *cell[key]))
+    return "\n".join(lines)
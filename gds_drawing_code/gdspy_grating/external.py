@@ -0,0 +1,209 @@
+"""
+Cells imported from external GDS files, such as vendor grating couplers.
+
+The parsed geometry of a file is kept in a binary sidecar
+(`<file>.cells.npz` next to it, or in `cache_dir`) holding the SHA-1 of
+the file it came from; a file whose content changed is parsed again.
+Files already imported in the process are not read again either.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import zipfile
+import zlib
+import numpy
+import gdspy
+from .compressed import atomic_output, read_gds
+
+_imported = {}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    SHA-1 hex digest of the content of a file.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as fin:
+        for chunk in iter(lambda: fin.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sidecar_path(infile, cache_dir=None):
+    """
+    File name of the cache of `infile`.
+    """
+    directory = os.path.dirname(os.path.abspath(infile)) if cache_dir is None else cache_dir
+    return os.path.join(directory, os.path.basename(infile) + ".cells.npz")
+
+
+def _save_sidecar(path, digest, lib):
+    meta = {"sha1": digest, "cells": []}
+    arrays = {}
+    for i, cell in enumerate(lib.cells.values()):
+        polygonsets = list(cell.polygons) + [p.to_polygonset() for p in cell.paths]
+        polygons = [p for ps in polygonsets for p in ps.polygons]
+        arrays["points{}".format(i)] = (
+            numpy.concatenate(polygons) if polygons else numpy.zeros((0, 2))
+        )
+        arrays["sizes{}".format(i)] = numpy.array([len(p) for p in polygons], dtype=int)
+        arrays["layers{}".format(i)] = numpy.array(
+            [l for ps in polygonsets for l in ps.layers], dtype=int
+        )
+        arrays["datatypes{}".format(i)] = numpy.array(
+            [d for ps in polygonsets for d in ps.datatypes], dtype=int
+        )
+        references = []
+        for ref in cell.references:
+            name = ref.ref_cell.name if isinstance(ref.ref_cell, gdspy.Cell) else ref.ref_cell
+            references.append(
+                {
+                    "cell": name,
+                    "origin": [float(v) for v in ref.origin],
+                    "rotation": ref.rotation,
+                    "magnification": ref.magnification,
+                    "x_reflection": bool(ref.x_reflection),
+                    "columns": getattr(ref, "columns", 1),
+                    "rows": getattr(ref, "rows", 1),
+                    "spacing": [float(v) for v in getattr(ref, "spacing", (0, 0))],
+                }
+            )
+        labels = [
+            {
+                "text": label.text,
+                "position": [float(v) for v in label.position],
+                "layer": int(label.layer),
+                "texttype": int(label.texttype),
+            }
+            for label in cell.labels
+        ]
+        meta["cells"].append({"name": cell.name, "references": references, "labels": labels})
+    with atomic_output(path) as fout:
+        numpy.savez(fout, meta=numpy.array(json.dumps(meta)), **arrays)
+
+
+def _load_sidecar(path, digest):
+    # a truncated or corrupt sidecar is stale, as one of another file
+    try:
+        return _read_sidecar(path, digest)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile, zlib.error):
+        return None
+
+
+def _read_sidecar(path, digest):
+    data = numpy.load(path, allow_pickle=False)
+    with data:
+        meta = json.loads(str(data["meta"]))
+        if meta["sha1"] != digest:
+            return None
+        cells = {}
+        for i, spec in enumerate(meta["cells"]):
+            cell = gdspy.Cell(spec["name"], exclude_from_current=True)
+            sizes = data["sizes{}".format(i)]
+            if sizes.size > 0:
+                polygons = numpy.split(data["points{}".format(i)], numpy.cumsum(sizes)[:-1])
+                layers = data["layers{}".format(i)].tolist()
+                datatypes = data["datatypes{}".format(i)].tolist()
+                polygonset = gdspy.PolygonSet([], 0, 0)
+                polygonset.polygons = polygons
+                polygonset.layers = layers
+                polygonset.datatypes = datatypes
+                cell.add(polygonset)
+            for label in spec["labels"]:
+                cell.add(
+                    gdspy.Label(
+                        label["text"], label["position"], layer=label["layer"], texttype=label["texttype"]
+                    )
+                )
+            cells[spec["name"]] = (cell, spec["references"])
+    for cell, references in cells.values():
+        for ref in references:
+            target = cells[ref["cell"]][0] if ref["cell"] in cells else ref["cell"]
+            if ref["columns"] == 1 and ref["rows"] == 1:
+                element = gdspy.CellReference(
+                    target, ref["origin"], ref["rotation"], ref["magnification"], ref["x_reflection"]
+                )
+            else:
+                element = gdspy.CellArray(
+                    target,
+                    ref["columns"],
+                    ref["rows"],
+                    ref["spacing"],
+                    ref["origin"],
+                    ref["rotation"],
+                    ref["magnification"],
+                    ref["x_reflection"],
+                )
+            cell.add(element)
+    return {name: cell for name, (cell, _) in cells.items()}
+
+
+def import_cells(infile, cache_dir=None):
+    """
+    All cells of a GDS file, from the sidecar cache when it is current.
+
+    infile    : GDS file
+    cache_dir : directory of the sidecar (default: next to `infile`)
+
+    Coordinates are in micrometers (see `gdspy.GdsLibrary.read_gds`) and
+    paths are stored by their polygonal outline.  The cells are not
+    registered in `gdspy.current_library`.
+
+    Return dictionary of `Cell` by name
+    """
+    digest = file_digest(infile)
+    key = (os.path.abspath(infile), digest)
+    if key not in _imported:
+        sidecar = sidecar_path(infile, cache_dir)
+        cells = _load_sidecar(sidecar, digest) if os.path.exists(sidecar) else None
+        if cells is None:
+            lib = read_gds(infile)
+            _save_sidecar(sidecar, digest, lib)
+            cells = _load_sidecar(sidecar, digest)
+        _imported[key] = cells
+    return _imported[key]
+
+
+def import_cell(infile, cell=None, name=None, cache_dir=None):
+    """
+    Import one cell of an external GDS file, e.g. as the `grat` argument
+    of `d2nn_construct`.
+
+    infile    : GDS file
+    cell      : name of the cell, may be omitted if the file has a single
+                top-level cell
+    name      : new name of the returned cell (its dependencies keep
+                their names)
+    cache_dir : directory of the sidecar cache
+
+    Return a new `Cell` on every call, so it can be modified or added to
+    several libraries; it references the imported dependencies (shared
+    between calls) and `lib.add(cell, include_dependencies=True)` adds
+    them all
+    """
+    cells = import_cells(infile, cache_dir)
+    if cell is None:
+        referenced = {
+            ref.ref_cell.name
+            for c in cells.values()
+            for ref in c.references
+            if isinstance(ref.ref_cell, gdspy.Cell)
+        }
+        tops = [n for n in cells if n not in referenced]
+        if len(tops) != 1:
+            raise ValueError(
+                "File {} has {} top-level cells, choose one of: {}.".format(
+                    infile, len(tops), ", ".join(tops)
+                )
+            )
+        cell = tops[0]
+    if cell not in cells:
+        raise ValueError("Cell {} not found in {}.".format(cell, infile))
+    source = cells[cell]
+    result = gdspy.Cell(cell if name is None else name, exclude_from_current=True)
+    result.add(copy.deepcopy(source.polygons))
+    result.add(copy.deepcopy(source.labels))
+    result.add([copy.copy(ref) for ref in source.references])
+    return result
@@ -0,0 +1,299 @@
+"""
+Reverse extraction: D2NN masks recovered from the posts of a GDS file.
+
+The file is scanned record by record and only the boundaries of the post
+layer are kept; the rectangles written by gdspy have a fixed 64-byte
+layout, so each one is recognized with a single match and its corners
+are decoded afterwards for all posts at once.  No polygon object is
+created.  The posts of each D2NN layer are then binned onto the
+`grid_width` pitch: a rectangle is one post, or a run of touching posts
+of the same width (see `post_table`), and gives back the mask value of
+every post it covers.
+"""
+
+import re
+import struct
+import numpy
+from . import gdsstream
+from .build import block_arguments, output_paths, shard_cell_name
+from .compressed import open_gds
+from .d2nn import load_mask
+from .transform import apply, record_matrices
+
+
+def _rectangle_pattern(layer):
+    # BOUNDARY, LAYER, DATATYPE (any), XY with 5 points, ENDEL
+    return re.compile(
+        b"\x00\x04\x08\x00\x00\x06\x0d\x02"
+        + re.escape(struct.pack(">h", layer))
+        + b"\x00\x06\x0e\x02..\x00\x2c\x10\x03.{40}\x00\x04\x11\x00",
+        re.DOTALL,
+    )
+
+
+class PostLayer(object):
+    """
+    Boxes of the polygons on one layer of a GDS file (compressed or not,
+    see `open_gds`), structure by structure.
+
+    infile : GDS file
+    layer  : GDSII layer of the posts
+
+    References are kept by structure name and resolved by `boxes`.
+    """
+
+    def __init__(self, infile, layer=2):
+        self.layer = layer
+        self._local = {}
+        self._references = {}
+        with open_gds(infile) as fin:
+            data = fin.read()
+        self.unit, self.precision = 1.0e-6, 1.0e-9
+        fast = _rectangle_pattern(layer)
+        view = numpy.frombuffer(data, dtype=numpy.uint8)
+        rectangles = []
+        polygons = []
+        references = []
+        name = None
+        element = None
+        pos = 0
+        while pos + 4 <= len(data):
+            size = (data[pos] << 8) | data[pos + 1]
+            rec_type = data[pos + 2]
+            if size < 4:
+                raise ValueError("Invalid GDSII record of size {} at byte {}.".format(size, pos))
+            if rec_type == gdsstream.BOUNDARY and fast.match(data, pos):
+                rectangles.append(pos + 20)
+                pos += 64
+                continue
+            record = data[pos : pos + size]
+            if rec_type == gdsstream.UNITS:
+                self.unit, self.precision = gdsstream.record_units(record)
+            elif rec_type == gdsstream.STRNAME:
+                name = gdsstream.record_string(record)
+            elif rec_type in (gdsstream.BOUNDARY, gdsstream.BOX):
+                element = {"type": rec_type}
+            elif rec_type in (gdsstream.SREF, gdsstream.AREF):
+                element = {"type": rec_type, "strans": 0, "mag": None, "angle": None}
+            elif element is not None:
+                if rec_type == gdsstream.LAYER:
+                    element["layer"] = gdsstream.record_int16(record)[0]
+                elif rec_type == gdsstream.SNAME:
+                    element["name"] = gdsstream.record_string(record)
+                elif rec_type == gdsstream.STRANS:
+                    element["strans"] = struct.unpack(">H", record[4:6])[0]
+                elif rec_type == gdsstream.MAG:
+                    element["mag"] = gdsstream.eight_byte_real(record[4:12])
+                elif rec_type == gdsstream.ANGLE:
+                    element["angle"] = gdsstream.eight_byte_real(record[4:12])
+                elif rec_type == gdsstream.COLROW:
+                    element["colrow"] = gdsstream.record_int16(record)
+                elif rec_type == gdsstream.XY:
+                    element["xy"] = numpy.frombuffer(record, dtype=">i4", offset=4).reshape(-1, 2)
+                elif rec_type == gdsstream.ENDEL:
+                    if element["type"] in (gdsstream.SREF, gdsstream.AREF):
+                        references.append(element)
+                    elif element.get("layer") == layer:
+                        polygons.append(element["xy"])
+                    element = None
+            elif rec_type == gdsstream.ENDSTR:
+                boxes = [numpy.zeros((0, 4))]
+                if rectangles:
+                    index = numpy.array(rectangles)[:, None] + numpy.arange(40)
+                    xy = view[index].view(">i4").reshape(-1, 5, 2)[:, :4]
+                    boxes.append(numpy.hstack((xy.min(1), xy.max(1))))
+                if polygons:
+                    boxes.append(numpy.array([numpy.hstack((p.min(0), p.max(0))) for p in polygons]))
+                self._local[name] = numpy.concatenate(boxes).astype(float)
+                self._references[name] = references
+                rectangles, polygons, references = [], [], []
+            elif rec_type == gdsstream.ENDLIB:
+                break
+            pos += size
+        scale = self.precision / self.unit
+        for name in self._local:
+            self._local[name] *= scale
+            for ref in self._references[name]:
+                ref["xy"] = ref["xy"] * scale
+
+    @property
+    def structures(self):
+        """
+        Names of the structures of the file.
+        """
+        return list(self._local)
+
+    def top_level(self):
+        """
+        Names of the structures not referenced by any other.
+        """
+        referenced = {ref["name"] for refs in self._references.values() for ref in refs}
+        return [name for name in self._local if name not in referenced]
+
+    def boxes(self, cell=None):
+        """
+        Boxes `[N, 4]` (x0, y0, x1, y1) of the polygons on the layer under
+        structure `cell` (all top-level structures by default), in user
+        units, every reference resolved.
+        """
+        names = self.top_level() if cell is None else [cell]
+        missing = [name for name in names if name not in self._local]
+        if missing:
+            raise ValueError("Structure {} not found.".format(missing[0]))
+        # instances of every structure, one level of the hierarchy at a time
+        level = {name: [numpy.eye(3)[None]] for name in names}
+        result = [numpy.zeros((0, 4))]
+        while level:
+            following = {}
+            for name, matrices in level.items():
+                matrices = numpy.concatenate(matrices)
+                local = self._local.get(name)
+                if local is not None and local.shape[0]:
+                    corners = local[:, [[0, 1], [2, 1], [2, 3], [0, 3]]]
+                    points = apply(matrices, corners).reshape(-1, 4, 2)
+                    result.append(numpy.hstack((points.min(1), points.max(1))))
+                for ref in self._references.get(name, ()):
+                    following.setdefault(ref["name"], []).append(
+                        (matrices[:, None] @ record_matrices(ref)[None]).reshape(-1, 3, 3)
+                    )
+            level = following
+        return numpy.concatenate(result)
+
+
+def post_values(y0, y1, pixel_step=10, pixel_pitch=0.03, max_value=2.0, tolerance=1e-3):
+    """
+    Posts of the rectangles `y0` to `y1` of one D2NN layer (relative to
+    the bottom of the layer), the inverse of `post_table`.
+
+    A rectangle of length `L` is `k + 1` touching posts of half width
+    `(L - k * grid_width) / 2` centered on the grid; as every other `k`
+    fits the geometry, the fewest posts whose mask value (half width /
+    0.025) does not exceed `max_value` are taken.  This is exact when
+    the mask values of the touching posts span less than
+    `grid_width / 0.025` (1.2 at full resolution) below `max_value`.
+
+    Return `(index, value)`: the grid index (post number) and mask value
+    of every post
+    """
+    grid_width = pixel_step * pixel_pitch
+    y0 = numpy.asarray(y0, dtype=float)
+    length = numpy.asarray(y1, dtype=float) - y0
+    max_half = max_value * 0.05 / 2 + tolerance
+    count = numpy.maximum(0, numpy.ceil((length - 2 * max_half) / grid_width - 1e-9)).astype(int)
+    # the first post is centered on the grid, so `count` has the parity
+    # of the rectangle's position
+    center = (y0 + 0.5 * (length - count * grid_width)) / grid_width - 0.5
+    count += numpy.abs(center - numpy.round(center)) > 0.25
+    half = 0.5 * (length - count * grid_width)
+    first = numpy.round((y0 + half) / grid_width - 0.5).astype(int)
+    posts = count + 1
+    index = numpy.repeat(first, posts) + numpy.arange(posts.sum()) - numpy.repeat(numpy.cumsum(posts) - posts, posts)
+    return index, numpy.repeat(half / 0.025, posts)
+
+
+def extract_layers(
+    boxes,
+    x_max,
+    y_min,
+    layer_distance,
+    input_distance,
+    num_layers,
+    pixel_step=10,
+    pixel_pitch=0.03,
+    post_length=0.4,
+    pixels=None,
+    max_value=2.0,
+    **kwargs
+):
+    """
+    Masks of the D2NN layers of one block from post boxes (see
+    `PostLayer.boxes`), with the block arguments of `d2nn_construct`
+    (other arguments are ignored).
+
+    pixels : length of the masks, by default the shortest one holding
+             every post
+    max_value : see `post_values`
+
+    Every mask pixel gets the value of the post of its `pixel_step`
+    group, so `post_table` of an extracted mask gives back the drawn
+    posts.
+
+    Return list of `numpy.ndarray[1, pixels]`, one per layer
+    """
+    boxes = numpy.asarray(boxes, dtype=float).reshape(-1, 4)
+    x_offset = x_max - input_distance
+    grid_width = pixel_step * pixel_pitch
+    posts = []
+    for i in range(num_layers):
+        x_start = -i * layer_distance + x_offset
+        band = (numpy.abs(boxes[:, 2] - x_start) < 0.5 * post_length) & (
+            numpy.abs(boxes[:, 0] - (x_start - post_length)) < 0.5 * post_length
+        )
+        posts.append(post_values(boxes[band, 1] - y_min, boxes[band, 3] - y_min, pixel_step, pixel_pitch, max_value))
+    if pixels is None:
+        last = max([index.max() + 1 for index, _ in posts if index.size] or [0])
+        pixels = last * pixel_step
+    masks = []
+    for index, value in posts:
+        grid = numpy.zeros(-(-pixels // pixel_step))
+        keep = (index >= 0) & (index < grid.size)
+        grid[index[keep]] = value[keep]
+        masks.append(numpy.repeat(grid, pixel_step)[:pixels].reshape(1, pixels))
+    return masks
+
+
+def compare_mask(extracted, post, pixel_step=10, min_half_width=0.01):
+    """
+    Largest difference between an extracted mask and its source at the
+    sampled pixels, the source posts too narrow to be drawn (see
+    `post_table`) counting as 0.
+    """
+    extracted = numpy.asarray(extracted, dtype=float).ravel()
+    post = numpy.asarray(post, dtype=float).ravel()
+    n = post.size // pixel_step
+    source = post[pixel_step // 2 : n * pixel_step : pixel_step]
+    source = numpy.where(source * 0.05 / 2 > min_half_width, source, 0.0)
+    sample = numpy.zeros(n)
+    m = min(n, extracted.size // pixel_step)
+    sample[:m] = extracted[pixel_step // 2 : m * pixel_step : pixel_step]
+    if extracted.size // pixel_step > n:
+        # posts beyond the source mask
+        return max(numpy.abs(sample - source).max(initial=0.0), numpy.abs(extracted[n * pixel_step :]).max())
+    return numpy.abs(sample - source).max(initial=0.0)
+
+
+def verify_die(spec, base_dir=".", output_dir=".", block_defaults=None, max_value=2.0):
+    """
+    Extract the masks of every block of a built die from its GDS file and
+    compare them with the source masks (and the `_double` masks of
+    double-sided blocks).
+
+    The posts of block `i` are read under `<top>_block<i>` when the file
+    has it (placed, pipelined or stored builds), under the top cell
+    otherwise.
+
+    Return list of `(block index, variant, layer index, largest
+    difference)`
+    """
+    outfile, _ = output_paths(spec, output_dir)
+    top = spec.get("top", "Positive")
+    readers = {}
+    result = []
+    for i, block in enumerate(spec.get("blocks", [])):
+        kw = block_arguments(block, base_dir, block_defaults)
+        layer = kw["polygon_layer"]
+        if layer not in readers:
+            readers[layer] = PostLayer(outfile, layer)
+        reader = readers[layer]
+        name = shard_cell_name(spec, "block{}".format(i))
+        cell = name if name in reader.structures else top
+        variants = [("", cell)]
+        if kw.get("double"):
+            variants.append(("_double", cell + "_double"))
+        for variant, cell in variants:
+            boxes = reader.boxes(cell)
+            sources = [load_mask(kw["mask_dir"], j, variant) for j in range(kw["num_layers"])]
+            masks = extract_layers(boxes, pixels=sources[0].size, max_value=max_value, **kw)
+            for j, (mask, source) in enumerate(zip(masks, sources)):
+                result.append((i, variant, j, compare_mask(mask, source, kw.get("pixel_step", 10))))
+    return result
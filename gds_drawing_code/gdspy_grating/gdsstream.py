@@ -0,0 +1,104 @@
+"""
+Record-level access to GDSII streams.
+
+These helpers read and write raw records without building gdspy
+objects, for tools that only need to copy, index or scan a file.
+"""
+
+import struct
+
+HEADER = 0x00
+BGNLIB = 0x01
+LIBNAME = 0x02
+UNITS = 0x03
+ENDLIB = 0x04
+BGNSTR = 0x05
+STRNAME = 0x06
+ENDSTR = 0x07
+BOUNDARY = 0x08
+PATH = 0x09
+SREF = 0x0A
+AREF = 0x0B
+TEXT = 0x0C
+LAYER = 0x0D
+DATATYPE = 0x0E
+WIDTH = 0x0F
+XY = 0x10
+ENDEL = 0x11
+SNAME = 0x12
+COLROW = 0x13
+STRANS = 0x1A
+MAG = 0x1B
+ANGLE = 0x1C
+PATHTYPE = 0x21
+BOX = 0x2D
+BOXTYPE = 0x2E
+BGNEXTN = 0x30
+ENDEXTN = 0x31
+
+
+def raw_records(infile, chunk_size=1 << 20):
+    """
+    Iterate over the records of a GDSII stream.
+
+    infile     : file opened in binary mode
+    chunk_size : number of bytes read at a time
+
+    Yield `(record type, record bytes)`, the bytes including the 4-byte
+    record header.  Only one chunk is kept in memory at a time.
+    """
+    buf = b""
+    pos = 0
+    while True:
+        if len(buf) - pos < 4 or len(buf) - pos < struct.unpack(">H", buf[pos:pos + 2])[0]:
+            chunk = infile.read(chunk_size)
+            if not chunk:
+                return
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        size = struct.unpack(">H", buf[pos:pos + 2])[0]
+        if size < 4:
+            raise ValueError("Invalid GDSII record of size {}.".format(size))
+        rec_type = buf[pos + 2]
+        yield rec_type, buf[pos:pos + size]
+        pos += size
+        if rec_type == ENDLIB:
+            return
+
+
+def record_string(data):
+    """
+    Decode the ASCII payload of a string record (e.g. STRNAME, SNAME).
+    """
+    return data[4:].rstrip(b"\0").decode("ascii")
+
+
+def record_int16(data):
+    """
+    Decode the payload of a 2-byte integer record (e.g. LAYER).
+    """
+    return struct.unpack(">{}h".format((len(data) - 4) // 2), data[4:])
+
+
+def eight_byte_real(data):
+    """
+    Decode one GDSII 8-byte real.
+    """
+    short1, short2, long3 = struct.unpack(">HHL", data)
+    exponent = (short1 & 0x7F00) // 256 - 64
+    mantissa = (((short1 & 0x00FF) * 65536 + short2) * 4294967296 + long3) / 72057594037927936.0
+    if short1 & 0x8000:
+        return -mantissa * 16.0 ** exponent
+    return mantissa * 16.0 ** exponent
+
+
+def record_units(data):
+    """
+    Decode a UNITS record.
+
+    Return `(unit, precision)` in meters, as in `gdspy.get_gds_units`
+    """
+    db_user = eight_byte_real(data[4:12])
+    db_meters = eight_byte_real(data[12:20])
+    return db_meters / db_user, db_meters
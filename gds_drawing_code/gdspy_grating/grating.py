@@ -0,0 +1,177 @@
+######################################################################
+#                                                                    #
+#  Copyright 2009-2019 Lucas Heitzmann Gabrielli.                    #
+#  This file is part of gdspy, distributed under the terms of the    #
+#  Boost Software License - Version 1.0.  See the accompanying       #
+#  LICENSE file or <http://www.boost.org/LICENSE_1_0.txt>            #
+#                                                                    #
+######################################################################
+
+import numpy
+import gdspy
+from .apodization import apodized_grating
+from .simplify import simplify_polygonset
+from .transform import direction_matrix, transform_polygonset
+
+
+def _orient(p, direction, position):
+    """
+    Rotate a grating built along +y to `direction` around `position`.
+    """
+    if direction in ("-x", "+x", "-y"):
+        return transform_polygonset(p, direction_matrix(direction, position))
+    return p
+
+
+def grating_demo(
+    period,
+    number_of_teeth,
+    fill_frac,
+    width,
+    position,
+    direction,
+    lda=1,
+    sin_theta=0,
+    focus_distance=-1,
+    focus_width=-1,
+    tolerance=0.001,
+    layer=0,
+    datatype=0,
+    max_deviation=None,
+):
+    """
+    Straight or focusing grating.
+
+    period          : grating period
+    number_of_teeth : number of teeth in the grating
+    fill_frac       : filling fraction of the teeth (w.r.t. the period)
+    width           : width of the grating
+    position        : grating position (feed point)
+    direction       : one of {'+x', '-x', '+y', '-y'}
+    lda             : free-space wavelength
+    sin_theta       : sine of incidence angle
+    focus_distance  : focus distance (negative for straight grating)
+    focus_width     : if non-negative, the focusing area is included in
+                      the result (usually for negative resists) and this
+                      is the width of the waveguide connecting to the
+                      grating
+    tolerance       : same as in `path.parametric`
+    layer           : GDSII layer number
+    datatype        : GDSII datatype number
+    max_deviation   : if set, the teeth are simplified so that no
+                      removed vertex is farther than this from the
+                      outline (see `simplify_polygons`)
+
+    Return `PolygonSet`
+    """
+    if focus_distance < 0:
+        p = gdspy.L1Path(
+            (
+                position[0] - 0.5 * width,
+                position[1] + 0.5 * (number_of_teeth - 1 + fill_frac) * period,
+            ),
+            "+x",
+            period * fill_frac,
+            [width],
+            [],
+            number_of_teeth,
+            period,
+            layer=layer,
+            datatype=datatype,
+        )
+    else:
+        neff = lda / float(period) + sin_theta
+        qmin = int(focus_distance / float(period) + 0.5)
+        p = gdspy.Path(period * fill_frac, position)
+        c3 = neff ** 2 - sin_theta ** 2
+        w = 0.5 * width
+        for q in range(qmin, qmin + number_of_teeth):
+            c1 = q * lda * sin_theta
+            c2 = (q * lda) ** 2
+            p.parametric(
+                lambda t: (
+                    width * t - w,
+                    (c1 + neff * numpy.sqrt(c2 - c3 * (width * t - w) ** 2)) / c3,
+                ),
+                tolerance=tolerance,
+                max_points=0,
+                layer=layer,
+                datatype=datatype,
+            )
+            p.x = position[0]
+            p.y = position[1]
+        sz = p.polygons[0].shape[0] // 2
+        if focus_width == 0:
+            p.polygons[0] = numpy.vstack((p.polygons[0][:sz, :], [position]))
+        elif focus_width > 0:
+            p.polygons[0] = numpy.vstack(
+                (
+                    p.polygons[0][:sz, :],
+                    [
+                        (position[0] + 0.5 * focus_width, position[1]),
+                        (position[0] - 0.5 * focus_width, position[1]),
+                    ],
+                )
+            )
+        if max_deviation is not None:
+            simplify_polygonset(p, max_deviation)
+        p.fracture()
+    return _orient(p, direction, position)
+
+
+def grating_lumerical(
+    period,
+    number_of_teeth,
+    fill_frac,
+    width,
+    position,
+    direction,
+    lda=1,
+    sin_theta=0,
+    focus_distance=-1,
+    focus_width=-1,
+    tolerance=0.001,
+    layer=0,
+    datatype=0,
+    max_deviation=None,
+):
+    """
+    Straight or focusing apodized grating.
+
+    period          : grating period, or its profile along the teeth as a
+                      table or function of the tooth index
+    number_of_teeth : number of teeth in the grating
+    fill_frac       : filling fraction of the teeth (w.r.t. the period),
+                      or its profile (see `apodization_profile`)
+    width           : width of the grating
+    position        : grating position (feed point)
+    direction       : one of {'+x', '-x', '+y', '-y'}
+    lda             : free-space wavelength
+    sin_theta       : sine of incidence angle
+    focus_distance  : focus distance (negative for straight grating)
+    focus_width     : width of the focusing grating at `focus_distance`
+                      (tan(focusing angle) = focus_width / focus_distance)
+    tolerance       : same as in `path.parametric`
+    layer           : GDSII layer number
+    datatype        : GDSII datatype number
+    max_deviation   : if set, the teeth are simplified so that no
+                      removed vertex is farther than this from the
+                      outline (see `simplify_polygons`)
+
+    Return `PolygonSet`
+    """
+    p = apodized_grating(
+        period,
+        number_of_teeth,
+        fill_frac,
+        width,
+        position,
+        focus_distance=focus_distance,
+        focus_width=focus_width,
+        tolerance=tolerance,
+        layer=layer,
+        datatype=datatype,
+    )
+    if max_deviation is not None:
+        simplify_polygonset(p, max_deviation)
+    return _orient(p, direction, position)
@@ -0,0 +1,411 @@
+"""
+Random-access index of large GDS files.
+
+One scan of a file records, for every structure, the byte range of its
+records, the structures it references and its bounding box.  The index
+is kept in a JSON sidecar (`<file>.index.json` next to it, or in
+`cache_dir`) holding the size and modification time of the file it
+describes, and the file is scanned again when they change.
+
+A `CellIndex` memory-maps the file and decodes only the structures asked
+for and their dependencies: their byte ranges are parsed by gdspy behind
+the library header, so the rest of the file is never read.
+"""
+
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import numpy
+import gdspy
+from . import gdsstream
+from .compressed import atomic_output, codec, open_output
+from .transform import apply, record_matrices
+
+#: format of the sidecar, stored in it
+INDEX_VERSION = 1
+
+# BOUNDARY, LAYER, DATATYPE, then the XY record of a polygon as gdspy
+# writes it
+_BOUNDARY = re.compile(b"\x00\x04\x08\x00\x00\x06\x0d\x02..\x00\x06\x0e\x02..", re.DOTALL)
+_ENDEL = b"\x00\x04\x11\x00"
+# a run of 4-corner polygons (posts, fill, grating teeth), 64 bytes each
+_QUADS = re.compile(
+    b"(?:\x00\x04\x08\x00\x00\x06\x0d\x02..\x00\x06\x0e\x02..\x00\x2c\x10\x03.{40}\x00\x04\x11\x00)+", re.DOTALL
+)
+
+
+def index_path(infile, cache_dir=None):
+    """
+    File name of the index of `infile`.
+    """
+    directory = os.path.dirname(os.path.abspath(infile)) if cache_dir is None else cache_dir
+    return os.path.join(directory, os.path.basename(infile) + ".index.json")
+
+
+def _xy_box(view, starts, counts, runs=(), lengths=(), chunk=1 << 18):
+    """
+    Box `(low, high)` in database units of the XY payloads of `counts`
+    points at byte offsets `starts` and of the runs of `lengths`
+    4-corner polygons at offsets `runs` (see `_QUADS`), or None without
+    points.
+    """
+    lengths = numpy.asarray(lengths, dtype=numpy.int64)
+    quads = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+    quads = numpy.repeat(numpy.asarray(runs, dtype=numpy.int64), lengths) + 64 * quads + 20
+    starts = numpy.concatenate((numpy.asarray(starts, dtype=numpy.int64), quads))
+    counts = numpy.concatenate((numpy.asarray(counts, dtype=numpy.int64), numpy.full(quads.size, 5)))
+    low = high = None
+    # a bounded number of points decoded at a time
+    bounds = numpy.searchsorted(numpy.cumsum(counts), numpy.arange(chunk, counts.sum(), chunk))
+    for s, c in zip(numpy.split(starts, bounds), numpy.split(counts, bounds)):
+        if c.sum() == 0:
+            continue
+        lengths = 8 * c
+        index = numpy.arange(lengths.sum()) + numpy.repeat(s - (numpy.cumsum(lengths) - lengths), lengths)
+        xy = view[index].view(">i4").reshape(-1, 2)
+        lo = xy.min(0)
+        hi = xy.max(0)
+        low = lo if low is None else numpy.minimum(low, lo)
+        high = hi if high is None else numpy.maximum(high, hi)
+    return None if low is None else (low, high)
+
+
+def _path_box(points, width, pathtype=0, extensions=(0, 0)):
+    """
+    Box `(low, high)` of a GDSII path: its segments grown by half the
+    width on both sides and its ends by the extension of `pathtype`
+    (round ends counted as square ones).
+    """
+    points = numpy.asarray(points, dtype=float)
+    half = 0.5 * abs(width)
+    direction = numpy.diff(points, axis=0)
+    length = numpy.hypot(direction[:, 0], direction[:, 1])
+    direction = direction / numpy.where(length > 0, length, 1)[:, None]
+    if direction.shape[0] == 0 or half == 0:
+        return points.min(0), points.max(0)
+    normal = direction[:, ::-1] * (-1, 1)
+    begin, end = {1: (half, half), 2: (half, half), 4: extensions}.get(pathtype, (0, 0))
+    starts = points[:-1].copy()
+    stops = points[1:].copy()
+    starts[0] -= begin * direction[0]
+    stops[-1] += end * direction[-1]
+    corners = numpy.concatenate((starts + half * normal, starts - half * normal, stops + half * normal, stops - half * normal))
+    return corners.min(0), corners.max(0)
+
+
+def scan_gds(data):
+    """
+    Index the structures of a GDSII stream held in memory (e.g. a
+    memory-mapped file) in a single pass.
+
+    Polygons written by gdspy are recognized with one match, and runs of
+    4-corner polygons such as posts with a single one, then skipped
+    whole; their coordinates are only decoded, for all of them at once,
+    to get the box of their structure.  Paths count with their width and
+    end extensions (see `_path_box`), text is left out (as in
+    `Cell.get_bounding_box`).
+
+    Return dictionary with the `unit` and `precision` of the library, the
+    byte size of its `header` (before the first structure) and the
+    `cells`, by name in file order, each with the byte range `offset` to
+    `end` of its records, the names of the structures it `references`
+    and its bounding `box` ((x0, y0), (x1, y1)) with its dependencies,
+    None if empty
+    """
+    view = numpy.frombuffer(data, dtype=numpy.uint8)
+    unit, precision = 1.0e-6, 1.0e-9
+    header = None
+    cells = {}
+    name = None
+    offset = None
+    element = None
+    starts = []
+    counts = []
+    runs = []
+    lengths = []
+    references = []
+    extents = []
+    pos = 0
+    while pos + 4 <= len(data):
+        size = (data[pos] << 8) | data[pos + 1]
+        rec_type = data[pos + 2]
+        if size < 4:
+            raise ValueError("Invalid GDSII record of size {} at byte {}.".format(size, pos))
+        if rec_type == gdsstream.BOUNDARY and _BOUNDARY.match(data, pos):
+            run = _QUADS.match(data, pos)
+            if run is not None:
+                runs.append(pos)
+                lengths.append((run.end() - pos) // 64)
+                pos = run.end()
+                continue
+            xy = pos + 16
+            xy_size = (data[xy] << 8) | data[xy + 1]
+            end = xy + xy_size
+            if data[xy + 2] == gdsstream.XY and data[end : end + 4] == _ENDEL:
+                starts.append(xy + 4)
+                counts.append((xy_size - 4) // 8)
+                pos = end + 4
+                continue
+        record = data[pos : pos + size]
+        if rec_type == gdsstream.UNITS:
+            unit, precision = gdsstream.record_units(record)
+        elif rec_type == gdsstream.BGNSTR:
+            header = pos if header is None else header
+            offset = pos
+        elif rec_type == gdsstream.STRNAME:
+            name = gdsstream.record_string(record)
+        elif rec_type in (gdsstream.BOUNDARY, gdsstream.BOX):
+            element = {"type": rec_type}
+        elif rec_type == gdsstream.PATH:
+            element = {"type": rec_type, "width": 0, "pathtype": 0, "extensions": [0, 0]}
+        elif rec_type in (gdsstream.SREF, gdsstream.AREF):
+            element = {"type": rec_type, "strans": 0, "mag": None, "angle": None}
+        elif rec_type == gdsstream.TEXT:
+            element = None
+        elif element is not None:
+            if rec_type == gdsstream.WIDTH:
+                element["width"] = struct.unpack(">i", record[4:8])[0]
+            elif rec_type == gdsstream.PATHTYPE:
+                element["pathtype"] = gdsstream.record_int16(record)[0]
+            elif rec_type in (gdsstream.BGNEXTN, gdsstream.ENDEXTN):
+                element["extensions"][rec_type - gdsstream.BGNEXTN] = struct.unpack(">i", record[4:8])[0]
+            elif rec_type == gdsstream.SNAME:
+                element["name"] = gdsstream.record_string(record)
+            elif rec_type == gdsstream.STRANS:
+                element["strans"] = struct.unpack(">H", record[4:6])[0]
+            elif rec_type == gdsstream.MAG:
+                element["mag"] = gdsstream.eight_byte_real(record[4:12])
+            elif rec_type == gdsstream.ANGLE:
+                element["angle"] = gdsstream.eight_byte_real(record[4:12])
+            elif rec_type == gdsstream.COLROW:
+                element["colrow"] = gdsstream.record_int16(record)
+            elif rec_type == gdsstream.XY:
+                if "name" in element or element["type"] == gdsstream.PATH:
+                    element["xy"] = numpy.frombuffer(record, dtype=">i4", offset=4).reshape(-1, 2)
+                else:
+                    starts.append(pos + 4)
+                    counts.append((size - 4) // 8)
+            elif rec_type == gdsstream.ENDEL:
+                if "name" in element:
+                    references.append(element)
+                elif element["type"] == gdsstream.PATH and "xy" in element:
+                    extents.append(_path_box(element["xy"], element["width"], element["pathtype"], element["extensions"]))
+                element = None
+        elif rec_type == gdsstream.ENDSTR:
+            box = _xy_box(view, starts, counts, runs, lengths)
+            extents.extend([] if box is None else [box])
+            if extents:
+                box = (numpy.min([b[0] for b in extents], 0), numpy.max([b[1] for b in extents], 0))
+            cells[name] = {"offset": offset, "end": pos + size, "own": box, "elements": references}
+            starts, counts, runs, lengths, references, extents = [], [], [], [], [], []
+        elif rec_type == gdsstream.ENDLIB:
+            break
+        pos += size
+    scale = precision / unit
+    boxes = {}
+
+    def full_box(name):
+        # own box and the boxes of the referenced structures, placed
+        if name not in boxes:
+            cell = cells[name]
+            corners = []
+            if cell["own"] is not None:
+                corners.append(numpy.array(cell["own"], dtype=float) * scale)
+            for ref in cell["elements"]:
+                child = full_box(ref["name"]) if ref["name"] in cells else None
+                if child is None:
+                    continue
+                points = numpy.array((child[0], (child[1, 0], child[0, 1]), child[1], (child[0, 0], child[1, 1])))
+                points = apply(record_matrices(dict(ref, xy=ref["xy"] * scale)), points).reshape(-1, 2)
+                corners.append(numpy.array((points.min(0), points.max(0))))
+            boxes[name] = (
+                None
+                if not corners
+                else numpy.array((numpy.min([c[0] for c in corners], 0), numpy.max([c[1] for c in corners], 0)))
+            )
+        return boxes[name]
+
+    result = {}
+    for name, cell in cells.items():
+        box = full_box(name)
+        result[name] = {
+            "offset": cell["offset"],
+            "end": cell["end"],
+            "references": sorted({ref["name"] for ref in cell["elements"]}),
+            "box": None if box is None else box.tolist(),
+        }
+    return {
+        "unit": unit,
+        "precision": precision,
+        "header": len(data) if header is None else header,
+        "cells": result,
+    }
+
+
+def index_gds(infile, cache_dir=None, data=None):
+    """
+    Index of a plain GDS file (see `scan_gds`), from its sidecar when it
+    is current, otherwise from a new scan saved to the sidecar.
+
+    infile    : GDS file
+    cache_dir : directory of the sidecar (default: next to `infile`)
+    data      : content of `infile` if already mapped
+
+    Return dictionary
+    """
+    st = os.stat(infile)
+    path = index_path(infile, cache_dir)
+    try:
+        with open(path) as fin:
+            index = json.load(fin)
+        if (index.get("version"), index.get("size"), index.get("mtime_ns")) == (
+            INDEX_VERSION,
+            st.st_size,
+            st.st_mtime_ns,
+        ):
+            return index
+    except (OSError, ValueError):
+        pass
+    if data is None:
+        with open(infile, "rb") as fin, mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            index = scan_gds(data)
+    else:
+        index = scan_gds(data)
+    index.update(version=INDEX_VERSION, size=st.st_size, mtime_ns=st.st_mtime_ns)
+    with atomic_output(path, "w") as fout:
+        json.dump(index, fout)
+    return index
+
+
+class CellIndex(object):
+    """
+    Random access to the structures of a plain GDS file.
+
+    infile    : GDS file; compressed files cannot be mapped and must be
+                converted first (see `convert_gds`)
+    cache_dir : directory of the index sidecar (see `index_gds`)
+
+    The file is memory-mapped, so only the pages of the structures read
+    are loaded.  It must not change while the index is open.
+    """
+
+    def __init__(self, infile, cache_dir=None):
+        if codec(infile) is not None:
+            raise ValueError("Compressed file {} cannot be memory-mapped, convert it to a plain GDS file first.".format(infile))
+        self.infile = infile
+        self._file = open(infile, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = index_gds(infile, cache_dir, self._data)
+        self.unit = self.index["unit"]
+        self.precision = self.index["precision"]
+        self._cells = self.index["cells"]
+
+    def __contains__(self, name):
+        return name in self._cells
+
+    def __len__(self):
+        return len(self._cells)
+
+    @property
+    def names(self):
+        """
+        Names of the structures, in file order.
+        """
+        return list(self._cells)
+
+    def top_level(self):
+        """
+        Names of the structures not referenced by any other.
+        """
+        referenced = {child for cell in self._cells.values() for child in cell["references"]}
+        return [name for name in self._cells if name not in referenced]
+
+    def bounding_box(self, name):
+        """
+        Bounding box of a structure and its dependencies, from the index.
+
+        Return `numpy.ndarray[2, 2]` or None if empty
+        """
+        box = self._entry(name)["box"]
+        return None if box is None else numpy.array(box)
+
+    def _entry(self, name):
+        if name not in self._cells:
+            raise ValueError("Cell {} not found in {}.".format(name, self.infile))
+        return self._cells[name]
+
+    def dependencies(self, names):
+        """
+        Names of the structures `names` (a name or a list) and of all the
+        structures they reference, in file order.  References to missing
+        structures are left out.
+        """
+        names = [names] if isinstance(names, str) else list(names)
+        found = set()
+        while names:
+            name = names.pop()
+            if name not in found:
+                found.add(name)
+                names.extend(r for r in self._entry(name)["references"] if r in self._cells)
+        return [name for name in self._cells if name in found]
+
+    def raw(self, names):
+        """
+        A GDSII stream of the structures `names` and their dependencies:
+        the library header, their records copied from the file, and
+        ENDLIB.
+
+        Return bytes
+        """
+        parts = [self._data[: self.index["header"]]]
+        for name in self.dependencies(names):
+            entry = self._cells[name]
+            parts.append(self._data[entry["offset"] : entry["end"]])
+        parts.append(struct.pack(">2H", 4, 0x0400))
+        return b"".join(parts)
+
+    def read(self, names):
+        """
+        Decode the structures `names` and their dependencies, with
+        references linked between them.
+
+        Return dictionary of `Cell` by name, not registered in
+        `gdspy.current_library`
+        """
+        return gdspy.GdsLibrary(infile=io.BytesIO(self.raw(names))).cells
+
+    def cell(self, name):
+        """
+        Decode one structure and its dependencies (see `read`).
+
+        Return `Cell`
+        """
+        return self.read(name)[name]
+
+    def write(self, outfile, names, plain=None):
+        """
+        Copy the structures `names` and their dependencies to a new GDS
+        file, compressed by its name and duplicated to `plain` if given
+        (see `open_output`), without decoding them.
+
+        Return number of structures written
+        """
+        with open_output(outfile, plain) as fout:
+            fout.write(self.raw(names))
+        return len(self.dependencies(names))
+
+    def close(self):
+        """
+        Unmap and close the file.
+        """
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
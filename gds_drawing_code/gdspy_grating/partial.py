@@ -0,0 +1,122 @@
+"""
+Partial export: only some layers and cells of a layout.
+
+A selection of layers holds layer numbers (any datatype) and
+`(layer, datatype)` pairs.  The builders skip the posts and gratings
+outside the selection, and `filter_library` removes whatever else is
+left before writing, so the file stays a valid GDS with every
+referenced cell defined.
+"""
+
+import numpy
+import gdspy
+
+
+def parse_layers(specs):
+    """
+    Selection of layers from numbers, `[layer, datatype]` pairs or
+    'layer/datatype' strings (as given on the command line).
+
+    Return `set`, or None if `specs` is None
+    """
+    if specs is None:
+        return None
+    layers = set()
+    for spec in specs:
+        if isinstance(spec, str):
+            spec = [int(v) for v in spec.split("/")]
+            spec = spec[0] if len(spec) == 1 else spec
+        layers.add(tuple(spec) if isinstance(spec, (list, tuple)) else int(spec))
+    return layers
+
+
+def layer_selected(layer, datatype, layers):
+    """
+    True if `(layer, datatype)` is in the selection (None selects all).
+    """
+    return layers is None or layer in layers or (layer, datatype) in layers
+
+
+def selection_mask(layer, datatype, layers):
+    """
+    Vectorized `layer_selected` over arrays of layers and datatypes.
+
+    Return boolean `numpy.ndarray`
+    """
+    layer = numpy.asarray(layer, dtype=int)
+    if layers is None:
+        return numpy.ones(layer.shape, dtype=bool)
+    datatype = numpy.asarray(datatype, dtype=int)
+    numbers = [l for l in layers if not isinstance(l, tuple)]
+    pairs = [l * 65536 + d for l, d in (s for s in layers if isinstance(s, tuple))]
+    return numpy.isin(layer, numbers) | numpy.isin(layer * 65536 + datatype, pairs)
+
+
+def filter_cell(cell, layers):
+    """
+    Copy of `cell` without the polygons, paths and labels outside
+    `layers`.  A path with only some of its lines selected is replaced by
+    the selected part of its outline.  References are kept; elements are
+    shared with `cell` when entirely selected.
+
+    Return new `Cell` with the same name (`cell` itself if `layers` is
+    None)
+    """
+    if layers is None:
+        return cell
+    candidates = list(cell.polygons)
+    paths = []
+    for path in cell.paths:
+        keep = selection_mask(path.layers, path.datatypes, layers)
+        if keep.all():
+            paths.append(path)
+        elif keep.any():
+            candidates.append(path.to_polygonset())
+    polygons = []
+    for polygonset in candidates:
+        keep = selection_mask(polygonset.layers, polygonset.datatypes, layers)
+        if keep.all():
+            polygons.append(polygonset)
+        elif keep.any():
+            index = numpy.flatnonzero(keep)
+            part = gdspy.PolygonSet([], 0, 0)
+            part.polygons = [polygonset.polygons[i] for i in index]
+            part.layers = [polygonset.layers[i] for i in index]
+            part.datatypes = [polygonset.datatypes[i] for i in index]
+            polygons.append(part)
+    result = gdspy.Cell(cell.name, exclude_from_current=True)
+    result.add(polygons)
+    result.add(paths)
+    result.add([l for l in cell.labels if layer_selected(l.layer, l.texttype, layers)])
+    result.add(cell.references)
+    return result
+
+
+def filter_library(lib, layers=None, cells=None):
+    """
+    Library with only the selected layers and cells.
+
+    lib    : `GdsLibrary`, left unchanged
+    layers : selection of layers (see `parse_layers`), None for all
+    cells  : names of the cells to export with their dependencies, None
+             for all
+
+    Return new `GdsLibrary` with the same name and units
+    """
+    result = gdspy.GdsLibrary(name=lib.name, unit=lib.unit, precision=lib.precision)
+    if cells is None:
+        selected = list(lib.cells.values())
+    else:
+        missing = set(cells) - set(lib.cells)
+        if missing:
+            raise ValueError("Cells not in library: {}.".format(", ".join(sorted(missing))))
+        selected = set()
+        for name in cells:
+            selected.add(lib.cells[name])
+            selected.update(lib.cells[name].get_dependencies(True))
+        selected = [c for c in lib.cells.values() if c in selected]
+    for cell in selected:
+        # references still point to the unfiltered cells, which are only
+        # written by name
+        result.add(filter_cell(cell, layers), include_dependencies=False)
+    return result
@@ -0,0 +1,229 @@
+"""
+Pipelined build of one die: mask reading, geometry and writing overlap.
+
+A reader thread loads the masks of the coming layers, the calling thread
+generates the geometry of the current block and a writer thread
+serializes the cells that are already finished.  Both hand-offs go
+through bounded queues, so at most `prefetch` masks and `backlog`
+finished cells wait in memory; both threads are stopped and joined
+whether the build succeeds or fails.  The file has the cells of a merged
+sharded build: the top cell references one cell per block and the
+waveguide cell, which are released once written.  With `placement`,
+each block is placed as soon as it is built, from its bounding box.
+"""
+
+import os
+import queue
+import threading
+import time
+import gdspy
+from .compressed import open_output
+from .d2nn import load_mask
+from .partial import filter_cell, layer_selected, parse_layers
+from .placement import BoundingBoxes, Packer
+from .build import (
+    block_arguments,
+    build_block,
+    build_gratings,
+    build_structures,
+    build_waveguides,
+    output_paths,
+    shard_cell_name,
+)
+from .simplify import simplify_cell
+from .stats import cell_stats, header_bytes
+
+_DONE = object()
+
+
+def _read_masks(jobs, masks, stop):
+    try:
+        for job in jobs:
+            if stop.is_set():
+                return
+            masks.put((job, load_mask(*job)))
+    except BaseException as err:
+        masks.put((None, err))
+
+
+def _stop_reading(reading, masks, stop):
+    # the reader may be blocked on a full queue: drain it until it exits
+    stop.set()
+    while reading.is_alive():
+        try:
+            masks.get(timeout=0.05)
+        except queue.Empty:
+            pass
+    reading.join()
+
+
+def _write_cells(writer, cells, errors):
+    while True:
+        cell = cells.get()
+        if cell is _DONE:
+            return
+        if not errors:
+            try:
+                writer.write_cell(cell)
+            except BaseException as err:
+                # keep draining the queue so the producer never blocks
+                errors.append(err)
+
+
+def build_and_write_pipelined(
+    spec, base_dir=".", output_dir=".", shared_gratings=(), block_defaults=None, prefetch=4, backlog=2
+):
+    """
+    Build one die and write it while it is being built.
+
+    spec, base_dir, output_dir, shared_gratings, block_defaults : as in
+        `build_and_write`
+    prefetch : number of masks read ahead of the geometry
+    backlog  : number of finished cells waiting for the writer
+
+    The size estimate is accumulated per cell and `max_gds_bytes` is
+    checked before each cell is queued; an exceeded limit removes the
+    partial file.  `max_shots`, the `cells` selection, `routes`, `fill`
+    and `proximity` are not supported in this mode and raise
+    `ValueError`; `layers` is supported.
+
+    Return `(output path, timings, stats)` as `build_and_write`, the
+    'write' time being the wait for the writer after the last cell
+    """
+    for key in ("max_shots", "cells", "routes", "fill", "proximity"):
+        if spec.get(key) is not None:
+            raise ValueError("Die {} with {} cannot be pipelined.".format(spec["name"], key))
+    timings = {}
+    stats = {}
+    blocks = spec.get("blocks", [])
+    layers = parse_layers(spec.get("layers"))
+    jobs = []
+    for block in blocks:
+        kw = block_arguments(block, base_dir, block_defaults)
+        if not layer_selected(kw["polygon_layer"], 0, layers):
+            continue
+        for i in range(kw["num_layers"]):
+            jobs.append((kw["mask_dir"], i, ""))
+            if kw.get("double"):
+                jobs.append((kw["mask_dir"], i, "_double"))
+    masks = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    reading = threading.Thread(target=_read_masks, args=(jobs, masks, stop), daemon=True)
+
+    def load(filepath, index, variant):
+        job, post = masks.get()
+        if job is None:
+            raise post
+        if job != (filepath, index, variant):
+            raise RuntimeError("Mask {} read out of order, expected {}.".format(job, (filepath, index, variant)))
+        return post
+
+    lib = gdspy.GdsLibrary(name=spec["name"])
+    outfile, plain = output_paths(spec, output_dir)
+    fout = open_output(outfile, plain)
+    writer = gdspy.GdsWriter(fout, name=spec["name"], unit=lib.unit, precision=lib.precision)
+    finished = queue.Queue(maxsize=backlog)
+    errors = []
+    writing = threading.Thread(target=_write_cells, args=(writer, finished, errors), daemon=True)
+    writing.start()
+    stats["gds_bytes_estimate"] = header_bytes(spec["name"])
+    reading.start()
+
+    def emit(cell):
+        cell = filter_cell(cell, layers)
+        if spec.get("max_deviation") is not None:
+            t0 = time.perf_counter()
+            before, after = simplify_cell(cell, spec["max_deviation"])
+            stats["vertices_before"] = stats.get("vertices_before", 0) + before
+            stats["vertices_after"] = stats.get("vertices_after", 0) + after
+            timings["simplify"] = timings.get("simplify", 0.0) + time.perf_counter() - t0
+        t0 = time.perf_counter()
+        stats["gds_bytes_estimate"] += cell_stats(cell)["bytes"]
+        timings["stats"] = timings.get("stats", 0.0) + time.perf_counter() - t0
+        limit = spec.get("max_gds_bytes")
+        if limit is not None and stats["gds_bytes_estimate"] > limit:
+            raise ValueError(
+                "Die {} exceeds max_gds_bytes: estimated more than {}, limit {}.".format(
+                    spec["name"], stats["gds_bytes_estimate"], limit
+                )
+            )
+        if errors:
+            raise errors[0]
+        finished.put(cell)
+
+    try:
+        t0 = time.perf_counter()
+        cells, surrounds = build_gratings(
+            lib, list(shared_gratings) + list(spec.get("gratings", [])), base_dir, layers
+        )
+        timings["gratings"] = time.perf_counter() - t0
+        for cell in cells.values():
+            emit(cell)
+
+        top = gdspy.Cell(spec.get("top", "Positive"), exclude_from_current=True)
+        tops = [top]
+        boxes = BoundingBoxes()
+        packer = None if spec.get("placement") is None else Packer(**spec["placement"])
+        timings["blocks"] = 0.0
+        for i, block in enumerate(blocks):
+            t0 = time.perf_counter()
+            name = shard_cell_name(spec, "block{}".format(i))
+            c = gdspy.Cell(name, exclude_from_current=True)
+            double = None
+            if block.get("double"):
+                double = gdspy.Cell(name + "_double", exclude_from_current=True)
+            build_block(
+                c, block, cells, surrounds, base_dir, block_defaults, double, load=load, layers=layers
+            )
+            timings["blocks"] += time.perf_counter() - t0
+            for cell in [c] if double is None else [c, double]:
+                for tile in cell.get_dependencies(False):
+                    if tile.name not in cells:
+                        emit(tile)
+            emit(c)
+            offset = (0, 0) if packer is None else tuple(packer.place(boxes.union(c, double)))
+            top.add(gdspy.CellArray(gdspy.Cell(name, exclude_from_current=True), 1, 1, (0, 0), offset))
+            if double is not None:
+                emit(double)
+                if len(tops) == 1:
+                    tops.append(gdspy.Cell(top.name + "_double", exclude_from_current=True))
+                placeholder = gdspy.Cell(double.name, exclude_from_current=True)
+                tops[1].add(gdspy.CellArray(placeholder, 1, 1, (0, 0), offset))
+            del c, double
+
+        t0 = time.perf_counter()
+        for c, structure in zip(build_structures(spec, cells), spec.get("structures", [])):
+            emit(c)
+            if packer is None:
+                offset = tuple(structure.get("origin", (0, 0)))
+            else:
+                offset = tuple(packer.place(boxes.get(c)))
+            top.add(gdspy.CellReference(gdspy.Cell(c.name, exclude_from_current=True), offset))
+        c = gdspy.Cell(shard_cell_name(spec, "waveguides"), exclude_from_current=True)
+        build_waveguides(c, spec, cells)
+        top.add(gdspy.CellArray(gdspy.Cell(c.name, exclude_from_current=True), 1, 1, (0, 0), (0, 0)))
+        timings["waveguides"] = time.perf_counter() - t0
+        emit(c)
+        for cell in tops:
+            emit(cell)
+    except BaseException:
+        _stop_reading(reading, masks, stop)
+        finished.put(_DONE)
+        writing.join()
+        writer.close()
+        fout.close()
+        for path in (outfile, plain):
+            if path is not None:
+                os.remove(path)
+        raise
+
+    _stop_reading(reading, masks, stop)
+    t0 = time.perf_counter()
+    finished.put(_DONE)
+    writing.join()
+    writer.close()
+    fout.close()
+    timings["write"] = time.perf_counter() - t0
+    if errors:
+        raise errors[0]
+    return outfile, timings, stats
@@ -0,0 +1,222 @@
+"""
+Placement of blocks and structures on a die from their extents.
+
+`BoundingBoxes` keeps the bounding box of every cell it has seen: the
+geometry of a cell is measured once and the box of a cell with
+references is combined from the cached boxes of the referenced cells.
+Adding to a cell through `BoundingBoxes.add` extends its box and only
+drops the cached boxes of the cells above it, which are recombined
+without touching any polygon.  `Packer` lays boxes side by side in
+shelves, one at a time, so a die can be placed while it is built.
+"""
+
+import numpy
+import gdspy
+from .transform import apply, reference_matrices
+
+#: axis and sign of each direction
+AXES = {"+x": (0, 1), "-x": (0, -1), "+y": (1, 1), "-y": (1, -1)}
+
+
+def _union(boxes):
+    boxes = [b for b in boxes if b is not None]
+    if not boxes:
+        return None
+    boxes = numpy.array(boxes)
+    return numpy.array((boxes[:, 0].min(0), boxes[:, 1].max(0)))
+
+
+def _geometry_box(elements):
+    """
+    Bounding box of polygons and paths (references and labels are
+    ignored).
+    """
+    polygons = []
+    for element in elements:
+        if isinstance(element, gdspy.PolygonSet):
+            polygons.extend(element.polygons)
+        elif isinstance(element, (gdspy.FlexPath, gdspy.RobustPath)):
+            polygons.extend(element.to_polygonset().polygons)
+    if not polygons:
+        return None
+    points = numpy.concatenate(polygons)
+    return numpy.array((points.min(0), points.max(0)))
+
+
+class BoundingBoxes(object):
+    """
+    Cache of hierarchical bounding boxes by cell name.
+
+    A cell modified other than through `add` must be passed to
+    `invalidate`.
+    """
+
+    def __init__(self):
+        self._own = {}
+        self._boxes = {}
+        self._parents = {}
+
+    def _reference_box(self, reference):
+        box = self.get(reference.ref_cell)
+        if box is None:
+            return None
+        corners = numpy.array(((box[0, 0], box[0, 1]), (box[1, 0], box[0, 1]), (box[1, 0], box[1, 1]), (box[0, 0], box[1, 1])))
+        points = apply(reference_matrices(reference), corners).reshape(-1, 2)
+        return numpy.array((points.min(0), points.max(0)))
+
+    def _elements_box(self, cell_name, elements):
+        boxes = [_geometry_box(elements)]
+        for element in elements:
+            if isinstance(element, (gdspy.CellReference, gdspy.CellArray)) and isinstance(
+                element.ref_cell, gdspy.Cell
+            ):
+                self._parents.setdefault(element.ref_cell.name, set()).add(cell_name)
+                boxes.append(self._reference_box(element))
+        return _union(boxes)
+
+    def get(self, cell):
+        """
+        Bounding box of `cell` and everything it references.
+
+        Return `numpy.ndarray[2, 2]` ((x0, y0), (x1, y1)), or None for an
+        empty cell
+        """
+        if cell.name not in self._boxes:
+            if cell.name not in self._own:
+                self._own[cell.name] = _geometry_box(list(cell.polygons) + list(cell.paths))
+            references = self._elements_box(cell.name, cell.references)
+            self._boxes[cell.name] = _union((self._own[cell.name], references))
+        return self._boxes[cell.name]
+
+    def union(self, *cells):
+        """
+        Bounding box of `cells` together (None entries are skipped).
+        """
+        return _union([self.get(c) for c in cells if c is not None])
+
+    def add(self, cell, element):
+        """
+        Add `element` (or a list of elements) to `cell` and update the
+        cached boxes.
+
+        Return `cell`
+        """
+        cell.add(element)
+        elements = list(element) if isinstance(element, (list, tuple)) else [element]
+        if cell.name in self._own:
+            self._own[cell.name] = _union((self._own[cell.name], _geometry_box(elements)))
+        if cell.name in self._boxes:
+            self._boxes[cell.name] = _union((self._boxes[cell.name], self._elements_box(cell.name, elements)))
+            self._invalidate_parents(cell.name)
+        return cell
+
+    def _invalidate_parents(self, name):
+        for parent in self._parents.get(name, ()):
+            if self._boxes.pop(parent, False) is not False:
+                self._invalidate_parents(parent)
+
+    def invalidate(self, cell):
+        """
+        Forget the cached boxes of `cell` and of the cells above it.
+        """
+        self._own.pop(cell.name, None)
+        self._boxes.pop(cell.name, None)
+        self._invalidate_parents(cell.name)
+
+
+class Packer(object):
+    """
+    Place boxes one after the other in shelves.
+
+    spacing         : gap between neighbouring boxes and between shelves
+    direction       : direction along which the boxes of a shelf follow
+                      each other ('+x', '-x', '+y' or '-y')
+    shelf_direction : direction in which a new shelf is started, along
+                      the other axis
+    limit           : maximal length of a shelf along `direction`, None
+                      for a single shelf (a box longer than the limit gets
+                      a shelf of its own)
+    origin          : corner where the first shelf starts
+
+    The boxes of a shelf are aligned on the side facing `origin` across
+    the shelf.
+    """
+
+    def __init__(self, spacing=100.0, direction="+y", shelf_direction="-x", limit=None, origin=(0, 0)):
+        if direction not in AXES or shelf_direction not in AXES:
+            raise ValueError("Directions must be one of {}.".format(", ".join(AXES)))
+        self.axis, self.sign = AXES[direction]
+        self.cross, self.cross_sign = AXES[shelf_direction]
+        if self.axis == self.cross:
+            raise ValueError("Shelf direction {} is parallel to {}.".format(shelf_direction, direction))
+        self.spacing = spacing
+        self.limit = limit
+        self.origin = numpy.array(origin, dtype=float)
+        self._position = 0.0
+        self._shelf = 0.0
+        self._depth = 0.0
+        self._count = 0
+
+    def place(self, box):
+        """
+        Translation moving a box ((x0, y0), (x1, y1)) to the next free
+        place; an empty box (None) is not moved and takes no place.
+
+        Return `numpy.ndarray[2]`
+        """
+        if box is None:
+            return numpy.zeros(2)
+        box = numpy.asarray(box, dtype=float)
+        length, depth = (box[1] - box[0])[[self.axis, self.cross]]
+        start = self._position + (self.spacing if self._count else 0.0)
+        if self._count and self.limit is not None and start + length > self.limit:
+            self._shelf += self._depth + self.spacing
+            self._position = self._depth = 0.0
+            self._count = 0
+            start = 0.0
+        offset = numpy.zeros(2)
+        for axis, sign, distance in ((self.axis, self.sign, start), (self.cross, self.cross_sign, self._shelf)):
+            if sign > 0:
+                offset[axis] = self.origin[axis] + distance - box[0, axis]
+            else:
+                offset[axis] = self.origin[axis] - distance - box[1, axis]
+        self._position = start + length
+        self._depth = max(self._depth, depth)
+        self._count += 1
+        return offset
+
+
+def pack(boxes, **kwargs):
+    """
+    Translations placing `boxes` in order with a `Packer` built from
+    `kwargs`.
+
+    Return `numpy.ndarray[N, 2]`
+    """
+    packer = Packer(**kwargs)
+    return numpy.array([packer.place(box) for box in boxes]).reshape(-1, 2)
+
+
+def place_cells(top, placed, placement, boxes=None, double_top=None):
+    """
+    Reference cells from `top` at the places given by a `Packer`.
+
+    top        : cell receiving the references
+    placed     : list of `(cell, double)` pairs in placement order,
+                 `double` being the double-sided variant of `cell` (or
+                 None), referenced from `double_top` at the same place
+    placement  : `Packer` arguments
+    boxes      : `BoundingBoxes` cache shared with the caller
+
+    Return array of the translations
+    """
+    boxes = BoundingBoxes() if boxes is None else boxes
+    packer = Packer(**placement)
+    offsets = []
+    for cell, double in placed:
+        offset = packer.place(boxes.union(cell, double))
+        boxes.add(top, gdspy.CellReference(cell, tuple(offset)))
+        if double is not None:
+            double_top.add(gdspy.CellReference(double, tuple(offset)))
+        offsets.append(offset)
+    return numpy.array(offsets).reshape(-1, 2)
@@ -0,0 +1,213 @@
+"""
+E-beam proximity correction: a dose class for every polygon, encoded as
+its GDSII datatype.
+
+The exposure deposited by the beam follows a double-Gaussian point
+spread function
+
+    f(r) = (exp(-r**2 / alpha**2) / (pi * alpha**2)
+            + eta * exp(-r**2 / beta**2) / (pi * beta**2)) / (1 + eta)
+
+The forward range `alpha` (tens of nm) is much shorter than the spacing
+of the posts and grating teeth, so the forward term only depends on the
+polygon itself and is computed for each polygon from its size.  The
+backscattered term is the pattern coverage (see `coverage`) convolved by
+FFT with the Gaussian of range `beta` on a grid of a fraction of `beta`,
+sampled at each polygon.  A polygon needs a dose inversely proportional
+to its exposure (1 for a large exposed area); the doses are quantized
+into geometric classes.  A cell placed several times (e.g. a grating),
+under one top cell or several, gets the mean exposure of all its
+instances, which share its datatypes.
+"""
+
+import numpy
+import gdspy
+from .density import grid_box, stacked_coverage
+from .partial import selection_mask
+from .transform import apply, flatten, instance_matrices
+
+
+def backscatter_kernel(beta, pitch):
+    """
+    Backscattering Gaussian of range `beta` sampled on a grid of `pitch`
+    out to 3 `beta`, normalized to a unit sum.
+    """
+    radius = max(1, int(numpy.ceil(3 * beta / pitch)))
+    r = numpy.arange(-radius, radius + 1) * pitch
+    g = numpy.exp(-(r / beta) ** 2)
+    kernel = g[:, None] * g[None, :]
+    return kernel / kernel.sum()
+
+
+def backscatter(cover, beta, pitch):
+    """
+    Backscattered exposure of a coverage map (the fraction of the
+    backscattered energy received by each grid cell), computed by FFT
+    convolution with `backscatter_kernel`; the pattern is empty outside
+    the grid.
+    """
+    from scipy.fft import irfft2, next_fast_len, rfft2
+
+    kernel = backscatter_kernel(beta, pitch)
+    radius = kernel.shape[0] // 2
+    shape = [next_fast_len(n + 2 * radius, real=True) for n in cover.shape]
+    spectrum = rfft2(cover, shape) * rfft2(kernel, shape)
+    result = irfft2(spectrum, shape)
+    return result[radius : radius + cover.shape[0], radius : radius + cover.shape[1]]
+
+
+def forward_fraction(width, length, alpha):
+    """
+    Part of the forward-scattered exposure of a `width` x `length`
+    rectangle received at its center.
+    """
+    from scipy.special import erf
+
+    return erf(width / (2 * alpha)) * erf(length / (2 * alpha))
+
+
+def _sample(grid, origin, pitch, points):
+    """
+    Bilinear interpolation of a grid of cell values at `points` [..., 2].
+    """
+    u = (points - origin) / pitch - 0.5
+    i = numpy.floor(u).astype(int)
+    t = u - i
+    nx, ny = grid.shape
+    i0 = numpy.clip(i[..., 0], 0, nx - 1)
+    i1 = numpy.clip(i[..., 0] + 1, 0, nx - 1)
+    j0 = numpy.clip(i[..., 1], 0, ny - 1)
+    j1 = numpy.clip(i[..., 1] + 1, 0, ny - 1)
+    tx = t[..., 0]
+    ty = t[..., 1]
+    return (
+        grid[i0, j0] * (1 - tx) * (1 - ty)
+        + grid[i1, j0] * tx * (1 - ty)
+        + grid[i0, j1] * (1 - tx) * ty
+        + grid[i1, j1] * tx * ty
+    )
+
+
+def _polygon_shapes(points, sizes):
+    """
+    Bounding box center, width and length of stacked polygons: the
+    length is the longer box side and the width the area divided by it,
+    exact for rectangles and close for thin curved teeth.
+    """
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+    low = numpy.minimum.reduceat(points, starts)
+    high = numpy.maximum.reduceat(points, starts)
+    x = points[:, 0]
+    y = points[:, 1]
+    nxt = numpy.arange(1, points.shape[0] + 1)
+    nxt[starts + sizes - 1] = starts
+    area = 0.5 * numpy.abs(numpy.add.reduceat(x * y[nxt] - x[nxt] * y, starts))
+    length = (high - low).max(1)
+    width = numpy.where(length > 0, area / numpy.where(length > 0, length, 1), 0)
+    return 0.5 * (low + high), width, length
+
+
+def dose_classes(doses, classes=16, min_dose=1.0, max_dose=5.0):
+    """
+    Quantize doses into `classes` geometric bins between `min_dose` and
+    `max_dose` (doses outside are clipped).
+
+    Return `(class index of each dose, dose of each class)`, the dose of
+    a class being the geometric center of its bin
+    """
+    edges = numpy.geomspace(min_dose, max_dose, classes + 1)
+    index = numpy.clip(numpy.searchsorted(edges, doses, side="right") - 1, 0, classes - 1)
+    return index, numpy.sqrt(edges[:-1] * edges[1:])
+
+
+def proximity_correction(
+    cells,
+    layers=None,
+    alpha=0.03,
+    beta=10.0,
+    eta=0.6,
+    pitch=None,
+    classes=16,
+    min_dose=1.0,
+    max_dose=5.0,
+    datatype=0,
+):
+    """
+    Assign a dose class to every polygon under `cells`, in place.
+
+    cells    : `Cell` or list of top cells exposed separately (e.g. a die
+               and its double-sided variant); each is its own pattern
+               for the backscattering, and the cells they share get the
+               mean exposure of their instances under all of them
+    layers   : selection of the exposed layers (see `parse_layers`),
+               None for all; only their geometry exposes and only their
+               polygons get a class
+    alpha    : forward scattering range
+    beta     : backscattering range
+    eta      : ratio of backscattered to forward energy
+    pitch    : backscatter grid pitch, `beta / 4` by default
+    classes, min_dose, max_dose : dose quantization (see `dose_classes`)
+    datatype : datatype of the first class; a polygon of class `k` gets
+               datatype `datatype + k`
+
+    Paths expose but keep their datatype.
+
+    Return `(doses, counts)`: the dose of each class and the number of
+    polygons (counted once per cell) assigned to it
+    """
+    pitch = beta / 4.0 if pitch is None else pitch
+    doses = dose_classes(numpy.zeros(0), classes, min_dose, max_dose)[1]
+    counts = numpy.zeros(classes, dtype=int)
+    # selected polygons of every cell, their shape and the backscattered
+    # exposure summed over their instances
+    shapes = {}
+    for top in [cells] if isinstance(cells, gdspy.Cell) else cells:
+        points, sizes, layer, dtype = flatten(top)
+        selected = selection_mask(layer, dtype, layers)
+        if not selected.any():
+            continue
+        vertices = numpy.repeat(selected, sizes)
+        points = points[vertices]
+        sizes = sizes[selected]
+        origin, shape = grid_box((points.min(0), points.max(0)), pitch)
+        back = backscatter(stacked_coverage(points, sizes, origin, shape, pitch), beta, pitch)
+        for name, (c, matrices) in instance_matrices(top).items():
+            if name not in shapes:
+                owners = []
+                polygons = []
+                for ps in c.polygons:
+                    chosen = numpy.flatnonzero(selection_mask(ps.layers, ps.datatypes, layers))
+                    if chosen.size:
+                        owners.append((ps, chosen))
+                        polygons.extend(ps.polygons[k] for k in chosen.tolist())
+                if not polygons:
+                    shapes[name] = None
+                    continue
+                local = numpy.concatenate(polygons)
+                center, width, length = _polygon_shapes(local, numpy.array([len(p) for p in polygons]))
+                shapes[name] = {
+                    "owners": owners,
+                    "center": center,
+                    "forward": forward_fraction(width, length, alpha),
+                    "received": 0.0,
+                    "instances": 0,
+                }
+            entry = shapes[name]
+            if entry is not None:
+                entry["received"] = entry["received"] + _sample(back, origin, pitch, apply(matrices, entry["center"])).sum(0)
+                entry["instances"] += matrices.shape[0]
+    # classes are written once every top cell is sampled, as the
+    # selection may depend on the datatypes
+    for entry in shapes.values():
+        if entry is None:
+            continue
+        exposure = (entry["forward"] + eta * entry["received"] / entry["instances"]) / (1 + eta)
+        index = dose_classes(1 / numpy.maximum(exposure, 1e-12), classes, min_dose, max_dose)[0]
+        counts += numpy.bincount(index, minlength=classes)
+        start = 0
+        for ps, chosen in entry["owners"]:
+            datatypes = numpy.array(ps.datatypes)
+            datatypes[chosen] = datatype + index[start : start + chosen.size]
+            ps.datatypes = datatypes.tolist()
+            start += chosen.size
+    return doses, counts
@@ -0,0 +1,294 @@
+"""
+Waveguide routing between named ports on a coarse occupancy grid.
+
+The die is rasterized once: every obstacle box (the instances of the
+cells placed on the die, taken from the cached `BoundingBoxes`, and the
+polygons of the top cell itself) is grown by the clearance and half the
+waveguide width and marked on the grid in one vectorized pass, so a
+route is never checked against individual polygons.  Nets are searched
+with A* over Manhattan paths whose straight runs are long enough for
+`bend_radius` corners; each routed net becomes an obstacle for the next
+ones.
+"""
+
+import collections
+import heapq
+import itertools
+import numpy
+import gdspy
+from .placement import BoundingBoxes
+from .transform import apply, reference_matrices
+
+#: unit vector of each direction
+VECTORS = {"+x": (1, 0), "-x": (-1, 0), "+y": (0, 1), "-y": (0, -1)}
+
+_STEPS = numpy.array(list(VECTORS.values()))
+_INDEX = {d: i for i, d in enumerate(VECTORS)}
+
+Port = collections.namedtuple("Port", ("name", "position", "direction"))
+Port.__doc__ = """
+Waveguide end: `position` and the `direction` ('+x', '-x', '+y' or
+'-y') in which a waveguide leaves it.
+"""
+
+
+def move_port(port, offset=(0, 0), name=None):
+    """
+    Copy of `port` translated by `offset`, optionally renamed.
+    """
+    return Port(
+        port.name if name is None else name,
+        (port.position[0] + offset[0], port.position[1] + offset[1]),
+        port.direction,
+    )
+
+
+def d2nn_ports(x_max, y_min, layer_distance, input_distance, num_layers, **kwargs):
+    """
+    Output ports 'out0' and 'out1' of a D2NN block built by
+    `d2nn_construct` with the same arguments (other arguments are
+    ignored), where its output waveguides start.
+
+    Return dictionary of `Port` by name
+    """
+    x_start = -num_layers * layer_distance + x_max - input_distance
+    return {
+        "out0": Port("out0", (x_start, 600 + y_min), "-x"),
+        "out1": Port("out1", (x_start, 300 + y_min), "-x"),
+    }
+
+
+def polygon_boxes(polygons):
+    """
+    Bounding boxes `[N, 4]` (x0, y0, x1, y1) of a list of polygons.
+    """
+    if len(polygons) == 0:
+        return numpy.zeros((0, 4))
+    sizes = numpy.array([len(p) for p in polygons])
+    points = numpy.concatenate(polygons)
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+    return numpy.hstack(
+        (numpy.minimum.reduceat(points, starts), numpy.maximum.reduceat(points, starts))
+    )
+
+
+def cell_obstacles(cell, boxes=None):
+    """
+    Obstacle boxes `[N, 4]` of a cell: one box per instance of each
+    referenced cell (from `boxes`, a `BoundingBoxes` cache) and one per
+    polygon or path of the cell itself.
+    """
+    boxes = BoundingBoxes() if boxes is None else boxes
+    polygonsets = list(cell.polygons) + [p.to_polygonset() for p in cell.paths]
+    result = [polygon_boxes([p for ps in polygonsets for p in ps.polygons])]
+    for ref in cell.references:
+        if not isinstance(ref.ref_cell, gdspy.Cell):
+            continue
+        box = boxes.get(ref.ref_cell)
+        if box is None:
+            continue
+        corners = numpy.array(((box[0, 0], box[0, 1]), (box[1, 0], box[0, 1]), (box[1, 0], box[1, 1]), (box[0, 0], box[1, 1])))
+        points = apply(reference_matrices(ref), corners)
+        result.append(numpy.hstack((points.min(1), points.max(1))))
+    return numpy.concatenate(result)
+
+
+class Router(object):
+    """
+    Router of waveguides within `box` ((x0, y0), (x1, y1)).
+
+    pitch       : grid pitch
+    clearance   : minimal distance between a waveguide and an obstacle
+                  or another routed waveguide
+    bend_radius : radius of the corners
+    width       : widths of the parallel lines of the waveguide (as in
+                  `gdspy.FlexPath`), e.g. `[5, 5]` for a double trench
+    offset      : distance between the lines
+    layer       : GDSII layer of the waveguides
+
+    Routed waveguides keep `clearance` up to half a pitch, which is
+    covered by growing obstacles by an extra half pitch.
+    """
+
+    def __init__(self, box, pitch=25.0, clearance=10.0, bend_radius=150.0, width=(5.0, 5.0), offset=5.5, layer=0):
+        self.pitch = float(pitch)
+        self.clearance = clearance
+        self.bend_radius = bend_radius
+        self.width = list(width) if numpy.ndim(width) else [width]
+        self.offset = offset
+        self.layer = layer
+        self.half_width = 0.5 * offset * (len(self.width) - 1) + 0.5 * max(self.width)
+        self.origin = numpy.array(box[0], dtype=float)
+        shape = numpy.ceil((numpy.array(box[1]) - self.origin) / self.pitch).astype(int) + 1
+        self.blocked = numpy.zeros(tuple(shape), dtype=bool)
+        # straight runs: before the first corner, and between two corners
+        self._stub = int(numpy.ceil(bend_radius / self.pitch)) + 1
+        self._run = int(numpy.ceil(2 * bend_radius / self.pitch)) + 1
+
+    def node(self, position):
+        """
+        Nearest grid node of `position`.
+        """
+        return tuple(int(v) for v in numpy.round((numpy.asarray(position) - self.origin) / self.pitch))
+
+    def add_obstacles(self, boxes, margin=None):
+        """
+        Mark obstacle boxes `[N, 4]` grown by `margin` (by default the
+        clearance, half the waveguide width and half a pitch).
+        """
+        boxes = numpy.asarray(boxes, dtype=float).reshape(-1, 4)
+        if boxes.shape[0] == 0:
+            return
+        if margin is None:
+            margin = self.clearance + self.half_width + 0.5 * self.pitch
+        shape = numpy.array(self.blocked.shape)
+        low = numpy.ceil((boxes[:, :2] - margin - self.origin) / self.pitch).astype(int)
+        high = numpy.floor((boxes[:, 2:] + margin - self.origin) / self.pitch).astype(int)
+        low = numpy.clip(low, 0, shape)
+        high = numpy.clip(high + 1, 0, shape)
+        keep = (high > low).all(1)
+        low = low[keep]
+        high = high[keep]
+        # 2D difference array: +1/-1 at the corners, then prefix sums
+        count = numpy.zeros(tuple(shape + 1), dtype=numpy.int32)
+        numpy.add.at(count, (low[:, 0], low[:, 1]), 1)
+        numpy.add.at(count, (high[:, 0], low[:, 1]), -1)
+        numpy.add.at(count, (low[:, 0], high[:, 1]), -1)
+        numpy.add.at(count, (high[:, 0], high[:, 1]), 1)
+        self.blocked |= count.cumsum(0).cumsum(1)[:-1, :-1] > 0
+
+    def add_cell(self, cell, boxes=None):
+        """
+        Mark the obstacles of a cell (see `cell_obstacles`).
+        """
+        self.add_obstacles(cell_obstacles(cell, boxes))
+
+    def _free(self, i, j):
+        return 0 <= i < self.blocked.shape[0] and 0 <= j < self.blocked.shape[1] and not self.blocked[i, j]
+
+    def _search(self, start, start_dir, goal, goal_dir):
+        """
+        A* from node `start` heading `start_dir` to node `goal`, arriving
+        in any direction but `goal_dir`.
+
+        Return list of `(node, direction index)` or None
+        """
+        blocked = self.blocked.tolist()
+        nx, ny = self.blocked.shape
+
+        def free(i, j):
+            return 0 <= i < nx and 0 <= j < ny and not blocked[i][j]
+
+        best = {}
+        order = itertools.count()
+        queue = [(0, 0, next(order), start, start_dir, None)]
+        parents = {}
+        turn_cost = 2
+        while queue:
+            _, cost, _, node, d, parent = heapq.heappop(queue)
+            state = (node, d)
+            if state in parents:
+                continue
+            parents[state] = parent
+            if node == goal and d != goal_dir:
+                result = [state]
+                while parents[result[-1]] is not None:
+                    result.append(parents[result[-1]])
+                return result[::-1]
+            i, j = node
+            for e, (dx, dy) in enumerate(VECTORS.values()):
+                if e == d:
+                    length, extra = 1, 0
+                elif e == d ^ 1:
+                    continue
+                else:
+                    length, extra = self._run, turn_cost
+                if not all(free(i + dx * k, j + dy * k) for k in range(1, length + 1)):
+                    continue
+                target = (i + dx * length, j + dy * length)
+                new_cost = cost + length + extra
+                if best.get((target, e), numpy.inf) <= new_cost:
+                    continue
+                best[(target, e)] = new_cost
+                h = abs(target[0] - goal[0]) + abs(target[1] - goal[1])
+                heapq.heappush(queue, (new_cost + h, new_cost, next(order), target, e, state))
+        return None
+
+    def route(self, start, end):
+        """
+        Route one waveguide from `Port` `start` to `Port` `end` and mark
+        it as an obstacle.
+
+        Return list of points from `start.position` to `end.position`
+
+        Raise `ValueError` if no route exists
+        """
+        s_dir = _INDEX[start.direction]
+        e_dir = _INDEX[end.direction]
+        s_node = tuple(int(v) for v in numpy.array(self.node(start.position)) + _STEPS[s_dir] * self._stub)
+        e_node = tuple(int(v) for v in numpy.array(self.node(end.position)) + _STEPS[e_dir] * self._stub)
+        states = None
+        if self._free(*s_node) and self._free(*e_node):
+            states = self._search(s_node, s_dir, e_node, e_dir)
+        if states is None:
+            raise ValueError("No route from {} to {}.".format(start.name, end.name))
+        # straight runs and the grid nodes where they turn
+        runs = [s_dir]
+        corners = []
+        for (node, d), (_, following) in zip(states, states[1:]):
+            if following != d:
+                runs.append(following)
+                corners.append(node)
+        if runs[-1] != e_dir ^ 1:
+            runs.append(e_dir ^ 1)
+            corners.append(e_node)
+        # each run is a line of constant x or y: a grid line, except for
+        # the first and last runs which go through the ports
+        fixed = [1 - _STEPS[r].nonzero()[0][0] for r in runs]
+        lines = [self.origin[f] + self.pitch * corners[k][f] for k, f in enumerate(fixed[:-1])]
+        lines[0:1] = [start.position[fixed[0]]]
+        lines.append(end.position[fixed[-1]])
+        if len(runs) == 1 and abs(lines[0] - lines[1]) > 1e-9:
+            raise ValueError("Ports {} and {} face each other off axis.".format(start.name, end.name))
+        points = [tuple(start.position)]
+        for k in range(len(runs) - 1):
+            point = [0.0, 0.0]
+            point[fixed[k]] = lines[k]
+            point[fixed[k + 1]] = lines[k + 1]
+            points.append(tuple(point))
+        points.append(tuple(end.position))
+        self.add_obstacles(
+            polygon_boxes([numpy.array((p, q)) for p, q in zip(points, points[1:])]),
+            self.clearance + 2 * self.half_width + 0.5 * self.pitch,
+        )
+        return points
+
+    def path(self, points):
+        """
+        `FlexPath` along routed `points` with circular bends.
+        """
+        return gdspy.FlexPath(
+            points,
+            width=self.width if len(self.width) > 1 else self.width[0],
+            offset=self.offset,
+            corners="circular bend",
+            bend_radius=self.bend_radius,
+            gdsii_path=True,
+            layer=self.layer,
+        )
+
+    def route_all(self, nets):
+        """
+        Route a batch of nets, the shortest ones first.
+
+        nets : list of `(Port, Port)`
+
+        Return list of `FlexPath` in the order of `nets`
+        """
+        length = [
+            abs(a.position[0] - b.position[0]) + abs(a.position[1] - b.position[1]) for a, b in nets
+        ]
+        paths = [None] * len(nets)
+        for k in numpy.argsort(length, kind="stable"):
+            paths[k] = self.path(self.route(*nets[k]))
+        return paths
@@ -0,0 +1,138 @@
+"""
+Sharded GDS output: cells split over several files written concurrently,
+and a stream merge that joins the shards back into one file.
+"""
+
+import hashlib
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import gdspy
+from . import gdsstream
+from .compressed import open_gds, open_output
+
+
+def write_cells(outfile, cells, name="library", unit=1.0e-6, precision=1.0e-9, plain=None):
+    """
+    Write `cells` (without their dependencies) to a GDS file, compressed
+    according to its name (see `open_gds`), and to the plain copy
+    `plain` if given.
+
+    References to cells that are not written are kept by name, so they
+    can be resolved from another shard by `merge_gds`.
+
+    Return `outfile`
+    """
+    with open_output(outfile, plain) as fout:
+        writer = gdspy.GdsWriter(fout, name=name, unit=unit, precision=precision)
+        for cell in cells:
+            writer.write_cell(cell)
+        writer.close()
+    return outfile
+
+
+def write_shards(shards, directory, top=None, name="library", unit=1.0e-6, precision=1.0e-9, jobs=1):
+    """
+    Write groups of cells to separate GDS files concurrently.
+
+    shards    : dictionary of lists of cells, each list is written to
+                `<directory>/<name>_<key>.gds`
+    directory : output directory
+    top       : optional cell written alone to `<directory>/<name>.gds`
+    name      : library name and file name prefix
+    unit      : unit size (as in `GdsLibrary`)
+    precision : precision (as in `GdsLibrary`)
+    jobs      : number of worker processes
+
+    Return list of written files, top-level file first
+    """
+    os.makedirs(directory, exist_ok=True)
+    tasks = [
+        (os.path.join(directory, "{}_{}.gds".format(name, key)), cells, key)
+        for key, cells in shards.items()
+    ]
+    if top is not None:
+        tasks.insert(0, (os.path.join(directory, name + ".gds"), [top], name))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(write_cells, outfile, cells, key, unit, precision)
+                for outfile, cells, key in tasks
+            ]
+            return [f.result() for f in futures]
+    return [write_cells(outfile, cells, key, unit, precision) for outfile, cells, key in tasks]
+
+
+def merge_gds(outfile, infiles):
+    """
+    Merge GDS files into one by copying their structures record by record.
+
+    Geometry is never decoded and compressed inputs and output are
+    streamed (see `open_gds`).  The header comes from the first file and
+    all files must use the same units.  A cell defined in several files
+    is written once if the definitions are identical (ignoring the
+    timestamps), otherwise a `ValueError` is raised.  A warning lists
+    references that no input defines.
+
+    outfile : output file name
+    infiles : input GDS files, e.g. a top-level file and its shards
+
+    Return dictionary with the number of `cells` written per input file
+    """
+    written = {}
+    referenced = set()
+    counts = {}
+    units = None
+    with open_gds(outfile, "wb") as fout:
+        for index, infile in enumerate(infiles):
+            counts[infile] = 0
+            structure = None
+            with open_gds(infile) as fin:
+                for rec_type, data in gdsstream.raw_records(fin):
+                    if rec_type == gdsstream.UNITS:
+                        if units is None:
+                            units = data
+                            fout.write(data)
+                        elif data != units:
+                            raise ValueError(
+                                "Units of {} ({}, {}) differ from {} ({}, {}).".format(
+                                    infile,
+                                    *gdsstream.record_units(data),
+                                    infiles[0],
+                                    *gdsstream.record_units(units)
+                                )
+                            )
+                    elif rec_type in (gdsstream.HEADER, gdsstream.BGNLIB, gdsstream.LIBNAME):
+                        if index == 0:
+                            fout.write(data)
+                    elif rec_type == gdsstream.BGNSTR:
+                        structure = [data]
+                    elif structure is None:
+                        continue
+                    else:
+                        structure.append(data)
+                        if rec_type == gdsstream.SNAME:
+                            referenced.add(gdsstream.record_string(data))
+                        elif rec_type == gdsstream.ENDSTR:
+                            name = gdsstream.record_string(structure[1])
+                            digest = hashlib.sha1(b"".join(structure[1:])).digest()
+                            if name in written:
+                                if written[name] != digest:
+                                    raise ValueError(
+                                        "Cell {} has different definitions in the merged files.".format(name)
+                                    )
+                            else:
+                                fout.writelines(structure)
+                                written[name] = digest
+                                counts[infile] += 1
+                            structure = None
+        fout.write(b"\x00\x04\x04\x00")
+    missing = referenced - set(written)
+    if missing:
+        warnings.warn(
+            "Merged file {} references undefined cells: {}.".format(
+                outfile, ", ".join(sorted(missing))
+            ),
+            stacklevel=2,
+        )
+    return counts
@@ -0,0 +1,150 @@
+"""
+Vertex simplification of polygons before output.
+
+Near-collinear vertices are removed first, then a Douglas-Peucker pass
+drops every vertex that lies within `max_deviation` of the simplified
+outline.  Every removed vertex is within `max_deviation` of the result,
+and each polygon keeps at least 3 vertices.  All polygons of a call are
+processed together: each Douglas-Peucker iteration splits every
+outstanding segment of every polygon at once.
+"""
+
+import numpy
+import gdspy
+
+
+def _segment_distance(p, a, b):
+    ab = b - a
+    ap = p - a
+    length2 = (ab ** 2).sum(-1)
+    t = (ap * ab).sum(-1) / numpy.where(length2 > 0, length2, 1)
+    t = numpy.clip(t, 0, 1)
+    d = ap - t[:, None] * ab
+    return numpy.hypot(d[:, 0], d[:, 1])
+
+
+def simplify_polygons(polygons, max_deviation, collinear_tolerance=1e-9):
+    """
+    Simplify a list of closed polygons.
+
+    polygons            : list of `numpy.ndarray[N, 2]`
+    max_deviation       : maximal distance between a removed vertex and
+                          the simplified polygon
+    collinear_tolerance : vertices closer than this to the line through
+                          their neighbours are removed in a first pass
+
+    Return list of simplified polygons (same order)
+    """
+    if len(polygons) == 0:
+        return []
+    sizes = numpy.array([len(p) for p in polygons])
+    # each polygon becomes a closed chain v0 ... v(n-1) v0
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+    points = numpy.concatenate(polygons).astype(float)
+    chain = numpy.arange(points.shape[0] + len(polygons))
+    chain_starts = starts + numpy.arange(len(polygons))
+    owner = numpy.repeat(numpy.arange(len(polygons)), sizes + 1)
+    local = chain - chain_starts[owner]
+    idx = numpy.where(local < sizes[owner], starts[owner] + local, starts[owner])
+    q = points[idx]
+    ends = chain_starts + sizes
+    fixed = numpy.zeros(q.shape[0], dtype=bool)
+    fixed[chain_starts] = True
+    fixed[ends] = True
+
+    # collinear pass; of two neighbouring candidates only the first is
+    # removed in each round, so runs of duplicates shrink safely
+    while True:
+        inner = numpy.flatnonzero(~fixed)
+        d = _segment_distance(q[inner], q[inner - 1], q[inner + 1])
+        cand = numpy.zeros(q.shape[0], dtype=bool)
+        cand[inner[d <= collinear_tolerance]] = True
+        cand[1:] &= ~cand[:-1]
+        if not cand.any():
+            break
+        q = q[~cand]
+        fixed = fixed[~cand]
+        owner = owner[~cand]
+
+    # Douglas-Peucker, one level of all segments per iteration
+    keep = fixed.copy()
+    while True:
+        kept = numpy.flatnonzero(keep)
+        cand = numpy.flatnonzero(~keep)
+        if cand.size == 0:
+            break
+        seg = numpy.searchsorted(kept, cand) - 1
+        d = _segment_distance(q[cand], q[kept[seg]], q[kept[seg + 1]])
+        over = d > max_deviation
+        if not over.any():
+            break
+        cand, seg, d = cand[over], seg[over], d[over]
+        order = numpy.lexsort((-d, seg))
+        _, first = numpy.unique(seg[order], return_index=True)
+        keep[cand[order[first]]] = True
+
+    keep[numpy.flatnonzero(fixed)[1::2]] = False
+    result = []
+    counts = numpy.bincount(owner[keep], minlength=len(polygons))
+    pieces = numpy.split(q[keep], numpy.cumsum(counts)[:-1])
+    for original, simplified in zip(polygons, pieces):
+        result.append(simplified if simplified.shape[0] >= 3 else numpy.array(original))
+    return result
+
+
+def simplify_polygonset(polygonset, max_deviation, collinear_tolerance=1e-9):
+    """
+    Simplify the polygons of a `PolygonSet` in place.
+
+    Return `(vertices before, vertices after)`
+    """
+    before = sum(len(p) for p in polygonset.polygons)
+    polygonset.polygons = simplify_polygons(
+        polygonset.polygons, max_deviation, collinear_tolerance
+    )
+    return before, sum(len(p) for p in polygonset.polygons)
+
+
+def simplify_cell(cell, max_deviation, collinear_tolerance=1e-9):
+    """
+    Simplify the polygons of a cell in place (references are not followed).
+
+    Paths written as polygons (`gdsii_path` False) are converted to
+    `PolygonSet` so that their bends are simplified as well; GDSII path
+    elements only store their spine and are left untouched.  The polygon
+    sets are replaced by simplified copies added back to the cell.
+
+    Return `(vertices before, vertices after)`
+    """
+    polygonsets = list(cell.polygons)
+    polygonsets.extend(path.to_polygonset() for path in cell.paths if not getattr(path, "gdsii_path", False))
+    cell.remove_paths(lambda path: not getattr(path, "gdsii_path", False))
+    # all polygon sets of the cell are simplified in a single batch
+    polygons = [p for polygonset in polygonsets for p in polygonset.polygons]
+    simplified = simplify_polygons(polygons, max_deviation, collinear_tolerance)
+    cell.remove_polygons(lambda points, layer, datatype: True)
+    i = 0
+    for polygonset in polygonsets:
+        n = len(polygonset.polygons)
+        result = gdspy.PolygonSet([])
+        result.polygons = simplified[i:i + n]
+        result.layers = list(polygonset.layers)
+        result.datatypes = list(polygonset.datatypes)
+        result.properties = dict(polygonset.properties)
+        cell.add(result)
+        i += n
+    return sum(len(p) for p in polygons), sum(len(p) for p in simplified)
+
+
+def simplify_library(lib, max_deviation, collinear_tolerance=1e-9):
+    """
+    Simplify every cell of a `GdsLibrary` in place.
+
+    Return `(vertices before, vertices after)`
+    """
+    before = after = 0
+    for cell in lib.cells.values():
+        b, a = simplify_cell(cell, max_deviation, collinear_tolerance)
+        before += b
+        after += a
+    return before, after
@@ -0,0 +1,221 @@
+"""
+Layout statistics computed before writing.
+
+The hierarchy is walked without flattening: every cell is measured once
+and the flat totals are obtained by multiplying by the number of times
+each cell is placed.  The GDS size estimate follows the records written
+by gdspy (properties are not counted), so a runaway configuration can
+be rejected before `write_gds` is called.
+"""
+
+import io
+import numpy
+import gdspy
+
+_FIELDS = ("polygons", "vertices", "area", "shots")
+
+
+def _polygon_stats(polygons, max_shot):
+    """
+    Per polygon vertex count, area, shot estimate and written bytes.
+    """
+    sizes = numpy.array([len(p) for p in polygons])
+    points = numpy.concatenate(polygons)
+    x = points[:, 0]
+    y = points[:, 1]
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+    # shoelace over each polygon, closing edge included
+    nxt = numpy.arange(1, points.shape[0] + 1)
+    nxt[starts + sizes - 1] = starts
+    area = 0.5 * numpy.abs(numpy.add.reduceat(x * y[nxt] - x[nxt] * y, starts))
+    shots = numpy.maximum(
+        numpy.maximum(1, (sizes - 1) // 2), numpy.ceil(area / max_shot ** 2)
+    )
+    records = numpy.where(sizes > 8190, -(-(sizes + 1) // 8190), 1)
+    size = 20 + 8 * (sizes + 1) + 4 * records
+    return sizes, area, shots, size
+
+
+def _name_bytes(name):
+    return len(name) + len(name) % 2
+
+
+def header_bytes(name="library"):
+    """
+    Bytes written around the cells of a library named `name`.
+    """
+    return 6 + 28 + 4 + _name_bytes(name) + 20 + 4
+
+
+def cell_stats(cell, max_shot=2.0):
+    """
+    Statistics of the elements of one cell (references are not followed).
+
+    cell     : `Cell`
+    max_shot : largest e-beam shot side; a polygon needs at least one
+               trapezoid per 2 vertices beyond the first 2 and one shot
+               per `max_shot**2` of area
+
+    Return dictionary with the numbers of `polygons`, `vertices`,
+    `paths`, `labels` and `references`, the `bytes` of the written
+    structure and `layers`: for each `(layer, datatype)` a dictionary of
+    `polygons`, `vertices`, `area` and `shots`.  Paths are counted by
+    their polygonal outline.
+    """
+    nbytes = 28 + 4 + _name_bytes(cell.name) + 4
+    polygons = []
+    layers = []
+    datatypes = []
+    for polygonset in cell.polygons:
+        polygons.extend(polygonset.polygons)
+        layers.extend(polygonset.layers)
+        datatypes.extend(polygonset.datatypes)
+    npoly = len(polygons)
+    nvert = sum(len(p) for p in polygons)
+    # paths, labels and references are few: their records are serialized
+    # to measure them exactly
+    buf = io.BytesIO()
+    for element in cell.paths + cell.labels + cell.references:
+        element.to_gds(buf, 1000.0)
+    nbytes += buf.tell()
+    for path in cell.paths:
+        outline = path.to_polygonset() if hasattr(path, "to_polygonset") else path
+        polygons.extend(outline.polygons)
+        layers.extend(outline.layers)
+        datatypes.extend(outline.datatypes)
+
+    per_layer = {}
+    if polygons:
+        sizes, area, shots, size = _polygon_stats(polygons, max_shot)
+        nbytes += int(size[:npoly].sum())
+        keys = numpy.array(layers) * 65536 + numpy.array(datatypes)
+        unique, inverse = numpy.unique(keys, return_inverse=True)
+        sums = numpy.zeros((unique.size, len(_FIELDS)))
+        numpy.add.at(
+            sums, inverse, numpy.stack((numpy.ones_like(area), sizes, area, shots), -1)
+        )
+        for key, row in zip(unique, sums):
+            per_layer[(int(key) // 65536, int(key) % 65536)] = row
+    return {
+        "polygons": npoly,
+        "vertices": nvert,
+        "paths": len(cell.paths),
+        "labels": len(cell.labels),
+        "references": len(cell.references),
+        "bytes": nbytes,
+        "layers": per_layer,
+    }
+
+
+def layout_stats(cells, max_shot=2.0, name=None):
+    """
+    Statistics of a library or a set of cells, as written by `write_gds`
+    or `write_cells`.
+
+    cells    : `GdsLibrary` or iterable of `Cell`
+    max_shot : see `cell_stats`
+    name     : library name written in the header (default: the name of
+               the `GdsLibrary`, or 'library')
+
+    The `bytes` of each cell are summed into `gds_bytes` (with the
+    library header).  The flat totals per `(layer, datatype)` follow the
+    references from the top-level cells of the set, also into cells
+    outside of it; array references count once per instance and
+    magnifications scale the area.
+
+    Return dictionary with `cells` (name to `cell_stats`), `layers` (flat
+    totals per layer), `polygons`, `vertices`, `area` and `shots` (flat
+    totals), `instances` (name to number of placements) and `gds_bytes`
+    """
+    if isinstance(cells, gdspy.GdsLibrary):
+        name = cells.name if name is None else name
+        cells = list(cells.cells.values())
+    else:
+        cells = list(cells)
+    measured = {}
+    flat = {}
+
+    def measure(cell):
+        if cell.name not in measured:
+            measured[cell.name] = cell_stats(cell, max_shot)
+        return measured[cell.name]
+
+    def flatten(cell):
+        # flat totals of one placement of `cell`, per layer
+        if cell.name in flat:
+            return flat[cell.name]
+        totals = {k: v.copy() for k, v in measure(cell)["layers"].items()}
+        for ref in cell.references:
+            if not isinstance(ref.ref_cell, gdspy.Cell):
+                continue
+            count = getattr(ref, "columns", 1) * getattr(ref, "rows", 1)
+            scale = numpy.array([count, count, count, count], dtype=float)
+            if ref.magnification is not None:
+                scale[2] *= ref.magnification ** 2
+            for key, row in flatten(ref.ref_cell).items():
+                totals[key] = totals.get(key, 0) + row * scale
+        flat[cell.name] = totals
+        return totals
+
+    def count(cell, times, instances):
+        instances[cell.name] = instances.get(cell.name, 0) + times
+        for ref in cell.references:
+            if isinstance(ref.ref_cell, gdspy.Cell):
+                n = getattr(ref, "columns", 1) * getattr(ref, "rows", 1)
+                count(ref.ref_cell, times * n, instances)
+
+    for cell in cells:
+        measure(cell)
+    referenced = {
+        ref.ref_cell.name
+        for cell in cells
+        for ref in cell.references
+        if isinstance(ref.ref_cell, gdspy.Cell)
+    }
+    tops = [cell for cell in cells if cell.name not in referenced]
+    layers = {}
+    instances = {}
+    for cell in tops:
+        for key, row in flatten(cell).items():
+            layers[key] = layers.get(key, 0) + row
+        count(cell, 1, instances)
+
+    total = sum(layers.values(), numpy.zeros(len(_FIELDS)))
+    header = header_bytes(name or "library")
+    return {
+        "cells": {cell.name: measured[cell.name] for cell in cells},
+        "layers": {
+            key: dict(zip(_FIELDS, row.tolist())) for key, row in sorted(layers.items())
+        },
+        "instances": instances,
+        "gds_bytes": header + sum(measured[c.name]["bytes"] for c in cells),
+        **dict(zip(_FIELDS, total.tolist())),
+    }
+
+
+def format_stats(stats):
+    """
+    Text report of `layout_stats`: one line per cell and per flat layer.
+    """
+    lines = [
+        "{:<24}{:>10}{:>12}{:>6}{:>12}".format("cell", "polygons", "vertices", "refs", "bytes")
+    ]
+    for name, s in stats["cells"].items():
+        lines.append(
+            "{:<24}{:>10}{:>12}{:>6}{:>12}".format(
+                name, s["polygons"], s["vertices"], s["references"], s["bytes"]
+            )
+        )
+    lines.append(
+        "{:<24}{:>10}{:>12}{:>14}{:>12}".format("layer/datatype", "polygons", "vertices", "area", "shots")
+    )
+    for (layer, datatype), s in stats["layers"].items():
+        lines.append(
+            "{:<24}{:>10.0f}{:>12.0f}{:>14.1f}{:>12.0f}".format(
+                "{}/{}".format(layer, datatype), s["polygons"], s["vertices"], s["area"], s["shots"]
+            )
+        )
+    lines.append(
+        "estimated {} bytes, {:.0f} shots".format(stats["gds_bytes"], stats["shots"])
+    )
+    return "\n".join(lines)
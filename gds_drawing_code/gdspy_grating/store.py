@@ -0,0 +1,363 @@
+"""
+Out-of-core cell store: cells kept in memory within a budget, the least
+recently used ones spilled to a local cache.
+
+A spilled cell is kept as its GDS structure bytes, so writing the
+layout copies them without decoding, and it is only parsed back when
+asked for.  References between stored cells are kept by name, so a
+spilled cell is not held in memory by the cells placing it; the
+bounding box and placements of every cell are recorded when it is
+added, so extents can be queried without reloading anything.
+"""
+
+import collections
+import copy
+import io
+import itertools
+import os
+import shutil
+import struct
+import tempfile
+import time
+import numpy
+import gdspy
+from .build import (
+    build_block,
+    build_gratings,
+    build_structures,
+    build_waveguides,
+    output_paths,
+    shard_cell_name,
+)
+from .compressed import open_output
+from .partial import filter_cell, parse_layers
+from .placement import Packer
+from .simplify import simplify_cell
+from .stats import cell_stats, header_bytes
+from .transform import apply, reference_matrices
+
+
+class CellStore(object):
+    """
+    Cells by name, at most `budget` bytes of them in memory.
+
+    budget    : memory budget, counted as the GDS size of the cells in
+                memory (see `cell_stats`)
+    cache_dir : directory of the spilled cells, a temporary directory
+                removed by `close` by default
+    unit, precision : units of the spilled (and written) cells
+
+    Adding a cell replaces its references to other cells by their names
+    (`get` with `resolve` links them again).  Use as a context manager
+    or call `close`.
+    """
+
+    def __init__(self, budget=512 << 20, cache_dir=None, unit=1.0e-6, precision=1.0e-9):
+        self.budget = budget
+        self.unit = unit
+        self.precision = precision
+        self._temporary = cache_dir is None
+        self.cache_dir = tempfile.mkdtemp(prefix="cellstore") if cache_dir is None else cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._memory = collections.OrderedDict()
+        self._sizes = {}
+        self._spilled = {}
+        self._boxes = {}
+        self._placements = {}
+        self._order = []
+        self._files = itertools.count()
+        self.memory = 0
+        self.spills = 0
+        self.loads = 0
+
+    def __contains__(self, name):
+        return name in self._sizes
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def names(self):
+        """
+        Names of the stored cells, in the order they were added.
+        """
+        return list(self._order)
+
+    def add(self, cell, spill=False):
+        """
+        Store `cell` (replacing a stored cell of the same name), spilling
+        it at once if `spill` is True (e.g. a finished block) and the
+        least recently used cells while over budget.
+        """
+        if cell.name in self._sizes:
+            self.discard(cell.name)
+        placements = []
+        for ref in cell.references:
+            if isinstance(ref.ref_cell, gdspy.Cell):
+                ref.ref_cell = ref.ref_cell.name
+            placements.append((ref.ref_cell, reference_matrices(ref)))
+        polygonsets = list(cell.polygons) + [p.to_polygonset() for p in cell.paths]
+        polygons = [p for ps in polygonsets for p in ps.polygons]
+        if polygons:
+            points = numpy.concatenate(polygons)
+            self._boxes[cell.name] = numpy.array((points.min(0), points.max(0)))
+        else:
+            self._boxes[cell.name] = None
+        self._placements[cell.name] = placements
+        self._sizes[cell.name] = cell_stats(cell)["bytes"]
+        self._order.append(cell.name)
+        self._memory[cell.name] = cell
+        self.memory += self._sizes[cell.name]
+        if spill:
+            self.spill(cell.name)
+        self._evict()
+
+    def spill(self, name):
+        """
+        Move a cell from memory to the cache.
+        """
+        cell = self._memory.pop(name, None)
+        if cell is None:
+            return
+        path = os.path.join(self.cache_dir, "{}.gds".format(next(self._files)))
+        with open(path, "wb") as fout:
+            cell.to_gds(fout, self.unit / self.precision)
+        self._spilled[name] = path
+        self.memory -= self._sizes[name]
+        self.spills += 1
+
+    def _evict(self, keep=None):
+        while self.memory > self.budget and len(self._memory) > (keep is not None):
+            name = next(n for n in self._memory if n != keep)
+            self.spill(name)
+
+    def _header(self):
+        buf = io.BytesIO()
+        gdspy.GdsWriter(buf, name="cellstore", unit=self.unit, precision=self.precision)
+        return buf.getvalue()
+
+    def get(self, name, resolve=False):
+        """
+        Stored cell, reloaded from the cache if it was spilled.
+
+        resolve : if True, its references are linked to the stored cells,
+                  which are loaded (recursively) as well; the budget may
+                  then be exceeded while they are in use
+
+        Return `Cell`
+        """
+        if name not in self._sizes:
+            raise KeyError(name)
+        if name in self._memory:
+            self._memory.move_to_end(name)
+            cell = self._memory[name]
+        else:
+            path = self._spilled.pop(name)
+            with open(path, "rb") as fin:
+                data = self._header() + fin.read() + struct.pack(">2H", 4, 0x0400)
+            cell = gdspy.GdsLibrary(infile=io.BytesIO(data)).cells[name]
+            os.remove(path)
+            self._memory[name] = cell
+            self.memory += self._sizes[name]
+            self.loads += 1
+            self._evict(keep=name)
+        if not resolve:
+            return cell
+        result = gdspy.Cell(name, exclude_from_current=True)
+        result.add(cell.polygons)
+        result.add(cell.paths)
+        result.add(cell.labels)
+        for ref in cell.references:
+            ref = copy.copy(ref)
+            if ref.ref_cell in self._sizes:
+                ref.ref_cell = self.get(ref.ref_cell, resolve=True)
+            result.add(ref)
+        return result
+
+    def bounding_box(self, name):
+        """
+        Bounding box of a stored cell and the stored cells it references,
+        from the boxes recorded when they were added (no cell is loaded).
+
+        Return `numpy.ndarray[2, 2]` or None if empty
+        """
+        boxes = [self._boxes[name]] if self._boxes[name] is not None else []
+        for child, matrices in self._placements[name]:
+            if child not in self._sizes:
+                continue
+            box = self.bounding_box(child)
+            if box is None:
+                continue
+            corners = numpy.array(((box[0, 0], box[0, 1]), (box[1, 0], box[0, 1]), (box[1, 0], box[1, 1]), (box[0, 0], box[1, 1])))
+            points = apply(matrices, corners).reshape(-1, 2)
+            boxes.append(numpy.array((points.min(0), points.max(0))))
+        if not boxes:
+            return None
+        boxes = numpy.array(boxes)
+        return numpy.array((boxes[:, 0].min(0), boxes[:, 1].max(0)))
+
+    def discard(self, name):
+        """
+        Remove a cell from the store.
+        """
+        if name in self._memory:
+            del self._memory[name]
+            self.memory -= self._sizes[name]
+        path = self._spilled.pop(name, None)
+        if path is not None:
+            os.remove(path)
+        for mapping in (self._sizes, self._boxes, self._placements):
+            mapping.pop(name, None)
+        self._order.remove(name)
+
+    def write(self, outfile, name="library", plain=None):
+        """
+        Write all stored cells to a GDS file (compressed by its name, see
+        `open_gds`), the spilled ones copied from the cache without
+        being loaded.
+
+        Return `outfile`
+        """
+        with open_output(outfile, plain) as fout:
+            writer = gdspy.GdsWriter(fout, name=name, unit=self.unit, precision=self.precision)
+            for cell_name in self._order:
+                if cell_name in self._memory:
+                    writer.write_cell(self._memory[cell_name])
+                else:
+                    with open(self._spilled[cell_name], "rb") as fin:
+                        shutil.copyfileobj(fin, fout)
+            writer.close()
+        return outfile
+
+    def close(self):
+        """
+        Drop all cells and remove a temporary cache directory.
+        """
+        self._memory.clear()
+        self.memory = 0
+        if self._temporary:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        else:
+            for path in self._spilled.values():
+                os.remove(path)
+        self._spilled.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_and_write_stored(spec, base_dir=".", output_dir=".", shared_gratings=(), block_defaults=None):
+    """
+    Build one die through a `CellStore` and write it.
+
+    spec, base_dir, output_dir, shared_gratings, block_defaults : as in
+        `build_and_write`
+
+    The die's `memory_budget` (bytes, default that of `CellStore`) bounds
+    the cells kept in memory; each finished block and its tiles are
+    spilled to the cache as soon as they are built, the gratings and
+    the top cells stay in memory while there is room.  The file has the
+    cells of a merged sharded build, as `build_and_write_pipelined`;
+    blocks are placed from the boxes recorded by the store.
+    `max_shots`, the `cells` selection, `routes`, `fill` and `proximity`
+    are not supported in this mode and raise `ValueError`.
+
+    Return `(output path, timings, stats)` as `build_and_write`, `stats`
+    also holding the number of spilled and reloaded cells
+    """
+    for key in ("max_shots", "cells", "routes", "fill", "proximity"):
+        if spec.get(key) is not None:
+            raise ValueError("Die {} with {} cannot be built through a cell store.".format(spec["name"], key))
+    timings = {}
+    stats = {}
+    layers = parse_layers(spec.get("layers"))
+    lib = gdspy.GdsLibrary(name=spec["name"])
+    budget = spec.get("memory_budget")
+    store = CellStore(unit=lib.unit, precision=lib.precision, **({} if budget is None else {"budget": budget}))
+    stats["gds_bytes_estimate"] = header_bytes(spec["name"])
+
+    def emit(cell, spill=False):
+        cell = filter_cell(cell, layers)
+        if spec.get("max_deviation") is not None:
+            t0 = time.perf_counter()
+            before, after = simplify_cell(cell, spec["max_deviation"])
+            stats["vertices_before"] = stats.get("vertices_before", 0) + before
+            stats["vertices_after"] = stats.get("vertices_after", 0) + after
+            timings["simplify"] = timings.get("simplify", 0.0) + time.perf_counter() - t0
+        t0 = time.perf_counter()
+        stats["gds_bytes_estimate"] += cell_stats(cell)["bytes"]
+        timings["stats"] = timings.get("stats", 0.0) + time.perf_counter() - t0
+        limit = spec.get("max_gds_bytes")
+        if limit is not None and stats["gds_bytes_estimate"] > limit:
+            raise ValueError(
+                "Die {} exceeds max_gds_bytes: estimated more than {}, limit {}.".format(
+                    spec["name"], stats["gds_bytes_estimate"], limit
+                )
+            )
+        store.add(cell, spill)
+
+    with store:
+        t0 = time.perf_counter()
+        cells, surrounds = build_gratings(
+            lib, list(shared_gratings) + list(spec.get("gratings", [])), base_dir, layers
+        )
+        timings["gratings"] = time.perf_counter() - t0
+        for cell in cells.values():
+            emit(cell)
+        top = gdspy.Cell(spec.get("top", "Positive"), exclude_from_current=True)
+        tops = [top]
+        packer = None if spec.get("placement") is None else Packer(**spec["placement"])
+        timings["blocks"] = 0.0
+        for i, block in enumerate(spec.get("blocks", [])):
+            t0 = time.perf_counter()
+            name = shard_cell_name(spec, "block{}".format(i))
+            c = gdspy.Cell(name, exclude_from_current=True)
+            double = None
+            if block.get("double"):
+                double = gdspy.Cell(name + "_double", exclude_from_current=True)
+            build_block(c, block, cells, surrounds, base_dir, block_defaults, double, layers=layers)
+            timings["blocks"] += time.perf_counter() - t0
+            built = [c] if double is None else [c, double]
+            for cell in built:
+                for tile in cell.get_dependencies(False):
+                    if tile.name not in cells:
+                        emit(tile, spill=True)
+            for cell in built:
+                emit(cell, spill=True)
+            offset = (0, 0)
+            if packer is not None:
+                boxes = numpy.array([store.bounding_box(cell.name) for cell in built])
+                offset = tuple(packer.place(numpy.array((boxes[:, 0].min(0), boxes[:, 1].max(0)))))
+            top.add(gdspy.CellArray(gdspy.Cell(name, exclude_from_current=True), 1, 1, (0, 0), offset))
+            if double is not None:
+                if len(tops) == 1:
+                    tops.append(gdspy.Cell(top.name + "_double", exclude_from_current=True))
+                placeholder = gdspy.Cell(double.name, exclude_from_current=True)
+                tops[1].add(gdspy.CellArray(placeholder, 1, 1, (0, 0), offset))
+            del c, double, built
+
+        t0 = time.perf_counter()
+        for c, structure in zip(build_structures(spec, cells), spec.get("structures", [])):
+            emit(c)
+            if packer is None:
+                offset = tuple(structure.get("origin", (0, 0)))
+            else:
+                offset = tuple(packer.place(store.bounding_box(c.name)))
+            top.add(gdspy.CellReference(gdspy.Cell(c.name, exclude_from_current=True), offset))
+        c = gdspy.Cell(shard_cell_name(spec, "waveguides"), exclude_from_current=True)
+        build_waveguides(c, spec, cells)
+        top.add(gdspy.CellArray(gdspy.Cell(c.name, exclude_from_current=True), 1, 1, (0, 0), (0, 0)))
+        timings["waveguides"] = time.perf_counter() - t0
+        emit(c)
+        for cell in tops:
+            emit(cell)
+
+        outfile, plain = output_paths(spec, output_dir)
+        t0 = time.perf_counter()
+        store.write(outfile, spec["name"], plain)
+        timings["write"] = time.perf_counter() - t0
+        stats["spilled_cells"] = store.spills
+        stats["reloaded_cells"] = store.loads
+    return outfile, timings, stats
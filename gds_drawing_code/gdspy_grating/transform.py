@@ -0,0 +1,230 @@
+"""
+Affine transforms as 3x3 matrices applied to stacked vertex arrays.
+
+Placement, rotation, mirroring and magnification compose by matrix
+product, so a whole hierarchy of references reduces to one matrix per
+instance.  `flatten` groups the instances of each cell and transforms
+all of its vertices for all of its instances in a single operation.
+"""
+
+import numpy
+import gdspy
+from . import gdsstream
+
+#: rotation (radians) taking a grating built along +y to each direction
+DIRECTIONS = {"+y": 0.0, "-x": 0.5 * numpy.pi, "+x": -0.5 * numpy.pi, "-y": numpy.pi}
+
+
+def translation(dx, dy):
+    return numpy.array(((1.0, 0.0, dx), (0.0, 1.0, dy), (0.0, 0.0, 1.0)))
+
+
+def rotation(angle, center=(0, 0)):
+    """
+    Rotation by `angle` (radians) around `center`.
+    """
+    c = numpy.cos(angle)
+    s = numpy.sin(angle)
+    x, y = center
+    return numpy.array(
+        ((c, -s, x - c * x + s * y), (s, c, y - s * x - c * y), (0.0, 0.0, 1.0))
+    )
+
+
+def scaling(factor):
+    return numpy.diag((float(factor), float(factor), 1.0))
+
+
+def x_reflection():
+    """
+    Mirror across the x axis, as the GDSII `x_reflection`.
+    """
+    return numpy.diag((1.0, -1.0, 1.0))
+
+
+def compose(*matrices):
+    """
+    Single matrix applying `matrices` in order (the first one first).
+    """
+    result = numpy.eye(3)
+    for m in matrices:
+        result = numpy.asarray(m) @ result
+    return result
+
+
+def direction_matrix(direction, position=(0, 0)):
+    """
+    Rotation of a grating built along +y to `direction` ('+y', '-y',
+    '+x' or '-x') around `position`.
+    """
+    return rotation(DIRECTIONS.get(direction, 0.0), position)
+
+
+def reference_matrices(reference):
+    """
+    Matrices of the instances of a `CellReference` or `CellArray`, in
+    the order gdspy applies them: magnification, array spacing,
+    x reflection, rotation and origin.
+
+    Return `numpy.ndarray[K, 3, 3]`
+    """
+    before = scaling(reference.magnification) if reference.magnification is not None else numpy.eye(3)
+    after = compose(
+        x_reflection() if reference.x_reflection else numpy.eye(3),
+        rotation(numpy.pi * reference.rotation / 180) if reference.rotation is not None else numpy.eye(3),
+        translation(*reference.origin),
+    )
+    columns = getattr(reference, "columns", 1)
+    rows = getattr(reference, "rows", 1)
+    spacing = getattr(reference, "spacing", (0, 0))
+    ii, jj = numpy.meshgrid(numpy.arange(columns), numpy.arange(rows), indexing="ij")
+    offsets = numpy.zeros((columns * rows, 3, 3))
+    offsets[:] = numpy.eye(3)
+    offsets[:, 0, 2] = spacing[0] * ii.ravel()
+    offsets[:, 1, 2] = spacing[1] * jj.ravel()
+    return after @ offsets @ before
+
+
+def record_matrices(element):
+    """
+    Matrices of the instances of an SREF or AREF element decoded from
+    GDSII records: a dictionary with its record `type`, `strans` flags,
+    `mag` and `angle` (None if absent), `colrow` (AREF) and `xy` points
+    `[1 or 3, 2]` in user units.
+
+    Return `numpy.ndarray[K, 3, 3]`
+    """
+    local = compose(
+        scaling(element["mag"]) if element["mag"] is not None else numpy.eye(3),
+        x_reflection() if element["strans"] & 0x8000 else numpy.eye(3),
+        rotation(numpy.pi * element["angle"] / 180) if element["angle"] is not None else numpy.eye(3),
+    )
+    origin = numpy.asarray(element["xy"][0], dtype=float)
+    if element["type"] == gdsstream.SREF:
+        return (translation(*origin) @ local)[None]
+    columns, rows = element["colrow"]
+    column = (numpy.asarray(element["xy"][1]) - origin) / columns
+    row = (numpy.asarray(element["xy"][2]) - origin) / rows
+    ii, jj = numpy.meshgrid(numpy.arange(columns), numpy.arange(rows), indexing="ij")
+    offsets = origin + ii.reshape(-1, 1) * column + jj.reshape(-1, 1) * row
+    result = numpy.repeat(local[None], offsets.shape[0], axis=0)
+    result[:, :2, 2] = offsets
+    return result
+
+
+def apply(matrix, points):
+    """
+    Transform an array of points `[..., 2]` (e.g. stacked polygons
+    `[N, M, 2]`) by one matrix, or by `K` matrices `[K, 3, 3]` giving
+    `[K, ..., 2]`.
+    """
+    matrix = numpy.asarray(matrix, dtype=float)
+    points = numpy.asarray(points, dtype=float)
+    if matrix.ndim == 2:
+        return points @ matrix[:2, :2].T + matrix[:2, 2]
+    flat = points.reshape(-1, 2)
+    out = numpy.einsum("kij,nj->kni", matrix[:, :2, :2], flat) + matrix[:, None, :2, 2]
+    return out.reshape((matrix.shape[0],) + points.shape)
+
+
+def transform_polygonset(polygonset, matrix):
+    """
+    Transform all polygons of a `PolygonSet` in place with one operation.
+
+    Return `polygonset`
+    """
+    if len(polygonset.polygons) == 0:
+        return polygonset
+    sizes = [len(p) for p in polygonset.polygons]
+    points = apply(matrix, numpy.concatenate(polygonset.polygons))
+    polygonset.polygons = numpy.split(points, numpy.cumsum(sizes)[:-1])
+    return polygonset
+
+
+def _cell_geometry(cell, cache):
+    if cell.name not in cache:
+        polygonsets = list(cell.polygons) + [p.to_polygonset() for p in cell.paths]
+        polygons = [p for ps in polygonsets for p in ps.polygons]
+        cache[cell.name] = (
+            numpy.concatenate(polygons) if polygons else numpy.zeros((0, 2)),
+            numpy.array([len(p) for p in polygons], dtype=int),
+            numpy.array([l for ps in polygonsets for l in ps.layers], dtype=int),
+            numpy.array([d for ps in polygonsets for d in ps.datatypes], dtype=int),
+        )
+    return cache[cell.name]
+
+
+def instance_matrices(cell, matrix=None):
+    """
+    Matrices of every instance of every cell under `cell`, `cell` itself
+    placed by `matrix` (identity by default).
+
+    Return dictionary of `(Cell, numpy.ndarray[K, 3, 3])` by cell name
+    """
+    matrix = numpy.eye(3) if matrix is None else numpy.asarray(matrix, dtype=float)
+    instances = {}
+    # one level of the hierarchy at a time, instances of a cell grouped
+    level = {cell.name: (cell, [matrix[None]])}
+    while level:
+        following = {}
+        for name, (c, matrices) in level.items():
+            matrices = numpy.concatenate(matrices)
+            if name in instances:
+                instances[name] = (c, numpy.concatenate((instances[name][1], matrices)))
+            else:
+                instances[name] = (c, matrices)
+            for ref in c.references:
+                if isinstance(ref.ref_cell, gdspy.Cell):
+                    local = reference_matrices(ref)
+                    following.setdefault(ref.ref_cell.name, (ref.ref_cell, []))[1].append(
+                        (matrices[:, None] @ local[None]).reshape(-1, 3, 3)
+                    )
+        level = following
+    return instances
+
+
+def flatten(cell, matrix=None):
+    """
+    Flatten the polygons under `cell` (paths by their outline, labels
+    are ignored).
+
+    Return `(points, sizes, layers, datatypes)`: all vertices stacked in
+    one array and the vertex count, layer and datatype of each polygon
+    """
+    cache = {}
+    parts = []
+    for c, matrices in instance_matrices(cell, matrix).values():
+        points, sizes, layers, datatypes = _cell_geometry(c, cache)
+        if sizes.size == 0:
+            continue
+        k = matrices.shape[0]
+        parts.append(
+            (
+                apply(matrices, points).reshape(-1, 2),
+                numpy.tile(sizes, k),
+                numpy.tile(layers, k),
+                numpy.tile(datatypes, k),
+            )
+        )
+    if not parts:
+        empty = numpy.zeros(0, dtype=int)
+        return numpy.zeros((0, 2)), empty, empty, empty
+    return tuple(numpy.concatenate(column) for column in zip(*parts))
+
+
+def flat_polygons(cell, matrix=None, by_spec=False):
+    """
+    Flattened polygons under `cell` as lists of arrays, like
+    `Cell.get_polygons`.
+
+    Return list of `numpy.ndarray[N, 2]`, or dictionary of lists by
+    `(layer, datatype)` if `by_spec` is True
+    """
+    points, sizes, layers, datatypes = flatten(cell, matrix)
+    polygons = numpy.split(points, numpy.cumsum(sizes)[:-1]) if sizes.size else []
+    if not by_spec:
+        return polygons
+    result = {}
+    for polygon, layer, datatype in zip(polygons, layers.tolist(), datatypes.tolist()):
+        result.setdefault((layer, datatype), []).append(polygon)
+    return result
@@ -0,0 +1,303 @@
+"""
+Watch mode: rebuild a die whenever its masks or its manifest change.
+
+The process keeps gdspy and scipy imported, the grating cells built and
+the GDS bytes of every written cell in memory.  The mask directories of
+the blocks, the manifest and imported grating files are polled (size
+and modification time).  A changed mask only rebuilds the blocks reading
+from its directory, and the top cell which places them; the file is
+then rewritten from the cached bytes of all the other cells.  Each block
+goes to a cell `<top>_block<i>` referenced by the top cell, as in a
+merged sharded build.  A rebuild that fails leaves the die as it was
+built last, and is tried again at the next poll.
+"""
+
+import contextlib
+import io
+import json
+import os
+import struct
+import sys
+import time
+import gdspy
+from .build import (
+    build_block,
+    build_fill,
+    build_gratings,
+    build_routes,
+    build_structures,
+    build_waveguides,
+    die_ports,
+    load_manifest,
+    output_paths,
+    shard_cell_name,
+)
+from .compressed import atomic_path, codec, open_output
+from .partial import filter_cell, parse_layers
+from .placement import BoundingBoxes, place_cells
+from .simplify import simplify_cell
+
+
+#: attributes read from the manifest by `DieWatcher._load`
+_SETTINGS = ("spec", "shared_gratings", "block_defaults", "outfile", "plain", "layers")
+
+
+class DieWatcher(object):
+    """
+    One die of a manifest kept built in memory.
+
+    manifest   : manifest file
+    die        : name of the die
+    output_dir : directory of the GDS file (default: as the `build`
+                 command, the manifest `output_dir` relative to the
+                 manifest)
+
+    The die is built and written on creation; call `poll` (or `run`) to
+    follow changes.
+    """
+
+    def __init__(self, manifest, die, output_dir=None):
+        self.manifest = manifest
+        self.die = die
+        self.base_dir = os.path.dirname(os.path.abspath(manifest))
+        self._output_dir = output_dir
+        self._parts = {}
+        self._blocks = {}
+        self.boxes = BoundingBoxes()
+        self._load()
+        self.build()
+        self._state = self._snapshot()
+
+    def _load(self):
+        manifest = load_manifest(self.manifest)
+        specs = [d for d in manifest["dies"] if d["name"] == self.die]
+        if not specs:
+            raise ValueError("Die {} not found in {}.".format(self.die, self.manifest))
+        self.spec = specs[0]
+        if self.spec.get("proximity") is not None:
+            # the doses of a block depend on its neighbours
+            raise ValueError("Die {} with proximity cannot be watched.".format(self.die))
+        self.shared_gratings = manifest.get("gratings", [])
+        self.block_defaults = manifest.get("block_defaults")
+        output_dir = self._output_dir
+        if output_dir is None:
+            output_dir = os.path.join(self.base_dir, manifest.get("output_dir", "."))
+        self.outfile, self.plain = output_paths(self.spec, output_dir)
+        self.layers = parse_layers(self.spec.get("layers"))
+
+    def _context(self):
+        # everything but the blocks themselves
+        spec = dict(self.spec, blocks=len(self.spec.get("blocks", [])))
+        return json.dumps((spec, self.shared_gratings, self.block_defaults), sort_keys=True)
+
+    def _serialize(self, cells, lib):
+        buf = io.BytesIO()
+        for cell in cells:
+            cell = filter_cell(cell, self.layers)
+            if self.spec.get("max_deviation") is not None:
+                simplify_cell(cell, self.spec["max_deviation"])
+            cell.to_gds(buf, lib.unit / lib.precision)
+        return buf.getvalue()
+
+    def build(self):
+        """
+        Build the whole die and write it.  The previous build is kept
+        until the new one is complete.
+        """
+        lib = gdspy.GdsLibrary(name=self.spec["name"])
+        boxes = BoundingBoxes()
+        cells, surrounds = build_gratings(
+            lib,
+            list(self.shared_gratings) + list(self.spec.get("gratings", [])),
+            self.base_dir,
+            self.layers,
+        )
+        parts = {"gratings": self._serialize(cells.values(), lib)}
+        blocks = {}
+        for i in range(len(self.spec.get("blocks", []))):
+            self._build_block(i, lib, cells, surrounds, boxes, parts, blocks)
+        self._build_top(lib, cells, boxes, parts, blocks)
+        self.lib, self.cells, self.surrounds, self.boxes = lib, cells, surrounds, boxes
+        self._parts, self._blocks = parts, blocks
+        self.write()
+
+    def _build_block(self, i, lib, cells, surrounds, boxes, parts, blocks):
+        block = self.spec["blocks"][i]
+        c = gdspy.Cell(shard_cell_name(self.spec, "block{}".format(i)), exclude_from_current=True)
+        double = None
+        if block.get("double"):
+            double = gdspy.Cell(c.name + "_double", exclude_from_current=True)
+        build_block(c, block, cells, surrounds, self.base_dir, self.block_defaults, double, layers=self.layers)
+        written = [c] if double is None else [c, double]
+        for cell in list(written):
+            boxes.invalidate(cell)
+            written.extend(t for t in cell.get_dependencies(False) if t.name not in cells)
+        blocks[i] = (c, double)
+        parts["block{}".format(i)] = self._serialize(written, lib)
+
+    def _build_top(self, lib, cells, boxes, parts, blocks):
+        spec = self.spec
+        top = gdspy.Cell(spec.get("top", "Positive"), exclude_from_current=True)
+        tops = [top]
+        placed = [blocks[i] for i in range(len(spec.get("blocks", [])))]
+        if any(double is not None for _, double in placed):
+            tops.append(gdspy.Cell(top.name + "_double", exclude_from_current=True))
+        structures = build_structures(spec, cells)
+        offsets = None
+        if spec.get("placement") is None:
+            for c, double in placed:
+                top.add(gdspy.CellReference(c))
+                if double is not None:
+                    tops[1].add(gdspy.CellReference(double))
+            for c, structure in zip(structures, spec.get("structures", [])):
+                top.add(gdspy.CellReference(c, tuple(structure.get("origin", (0, 0)))))
+        else:
+            placed.extend((c, None) for c in structures)
+            offsets = place_cells(top, placed, spec["placement"], boxes, tops[-1])
+        build_waveguides(top, spec, cells)
+        if spec.get("routes") is not None:
+            boxes.invalidate(top)
+            build_routes(top, spec, die_ports(spec, self.block_defaults, offsets), boxes)
+        if spec.get("fill") is not None:
+            boxes.invalidate(top)
+            structures.append(build_fill(top, spec, boxes))
+        parts["top"] = self._serialize(structures + tops, lib)
+
+    def write(self):
+        """
+        Write the GDS file (and its plain copy) from the cached cell
+        bytes, replacing the previous files at once.
+        """
+        header = io.BytesIO()
+        gdspy.GdsWriter(header, name=self.spec["name"], unit=self.lib.unit, precision=self.lib.precision)
+        os.makedirs(os.path.dirname(os.path.abspath(self.outfile)), exist_ok=True)
+        with contextlib.ExitStack() as stack:
+            tmp = stack.enter_context(atomic_path(self.outfile))
+            plain_tmp = None if self.plain is None else stack.enter_context(atomic_path(self.plain))
+            with open_output(tmp, plain_tmp, codec(self.outfile)) as fout:
+                fout.write(header.getvalue())
+                for part in self._parts.values():
+                    fout.write(part)
+                fout.write(struct.pack(">2H", 4, 0x0400))
+
+    def _mask_dirs(self):
+        """
+        Mask directory of each block.
+        """
+        dirs = []
+        for block in self.spec.get("blocks", []):
+            mask_dir = dict(self.block_defaults or {}, **block)["mask_dir"]
+            dirs.append(os.path.normpath(os.path.join(self.base_dir, mask_dir.replace("\\", "/"))))
+        return dirs
+
+    def _snapshot(self):
+        """
+        Size and modification time of every watched file.
+        """
+        paths = [os.path.abspath(self.manifest)]
+        for grat in list(self.shared_gratings) + list(self.spec.get("gratings", [])):
+            if "gds" in grat:
+                paths.append(os.path.join(self.base_dir, grat["gds"]))
+        for directory in set(self._mask_dirs()):
+            try:
+                paths.extend(e.path for e in os.scandir(directory) if e.name.endswith(".mat"))
+            except OSError:
+                pass
+        state = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def poll(self):
+        """
+        Rebuild what changed since the last call and rewrite the file.
+
+        Return list of the rebuilt parts ('all' for a full rebuild,
+        'block<i>'), empty if nothing changed
+
+        If the rebuild fails, the die and the settings read from the
+        manifest are left as they were and the changes are still pending
+        at the next call.
+        """
+        state = self._snapshot()
+        changed = {p for p in set(state) | set(self._state) if state.get(p) != self._state.get(p)}
+        if not changed:
+            return []
+        settings = {key: getattr(self, key) for key in _SETTINGS}
+        try:
+            rebuilt = self._rebuild(changed)
+        except BaseException:
+            self.__dict__.update(settings)
+            raise
+        # a manifest rewritten during the rebuild is seen at the next poll
+        self._state = state
+        return rebuilt
+
+    def _rebuild(self, changed):
+        blocks = list(self.spec.get("blocks", []))
+        context = self._context()
+        rebuild = set()
+        if os.path.abspath(self.manifest) in changed:
+            self._load()
+            if self._context() != context:
+                self.build()
+                return ["all"]
+            rebuild.update(i for i, b in enumerate(self.spec.get("blocks", [])) if b != blocks[i])
+        if any(not p.endswith(".mat") for p in changed - {os.path.abspath(self.manifest)}):
+            # an imported grating file
+            self.build()
+            return ["all"]
+        dirs = {os.path.dirname(p) for p in changed if p.endswith(".mat")}
+        rebuild.update(i for i, d in enumerate(self._mask_dirs()) if d in dirs)
+        if not rebuild:
+            return []
+        count = len(self.spec.get("blocks", []))
+        expected = {"gratings", "top"} | {"block{}".format(i) for i in range(count)}
+        if set(self._parts) != expected or set(self._blocks) != set(range(count)):
+            self.build()
+            return ["all"]
+        parts = dict(self._parts)
+        blocks = dict(self._blocks)
+        for i in sorted(rebuild):
+            self._build_block(i, self.lib, self.cells, self.surrounds, self.boxes, parts, blocks)
+        self._build_top(self.lib, self.cells, self.boxes, parts, blocks)
+        self._parts, self._blocks = parts, blocks
+        self.write()
+        return ["block{}".format(i) for i in sorted(rebuild)]
+
+    def run(self, interval=0.2, out=sys.stdout, count=None):
+        """
+        Poll every `interval` seconds and report each rebuild to `out`.
+        Errors (e.g. a mask caught while being written) are reported once
+        and the file is left as it was; the rebuild is tried again at
+        every poll until it succeeds.
+
+        count : number of polls, None to run until interrupted
+        """
+        n = 0
+        error = None
+        while count is None or n < count:
+            time.sleep(interval)
+            n += 1
+            t0 = time.perf_counter()
+            try:
+                rebuilt = self.poll()
+            except Exception as err:
+                message = "error: {}: {}\n".format(type(err).__name__, err)
+                if message != error:
+                    out.write(message)
+                    out.flush()
+                error = message
+                continue
+            error = None
+            if rebuilt:
+                out.write(
+                    "rebuilt {} in {:.3f} s -> {}\n".format(
+                        ", ".join(rebuilt), time.perf_counter() - t0, self.outfile
+                    )
+                )
+                out.flush()